@@ -0,0 +1,301 @@
+"""
+合成数据基准测试：按真实目录结构生成瓦片树，测量拼接、混合与视频各阶段
+  python scripts/benchmark.py                                  # 默认 z4-global、z4-japan，small
+  python scripts/benchmark.py -s z5-global -s z5-china --size medium --save baseline.json
+  python scripts/benchmark.py --compare baseline.json --threshold 0.15 --repeat 3
+
+每个用例在独立子进程（spawn）中运行，记录墙钟时间、CPU 时间（含 ffmpeg 等子进程）与峰值 RSS，
+并从指标注册表读取各阶段耗时（解码/合成/拼接等）。对比模式下墙钟时间或峰值内存
+超过基线 (1 + threshold) 倍的用例标记为回退，退出码为 1。
+"""
+import argparse
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+try:
+    import resource
+except ImportError:  # Windows 无 resource 模块，只记录墙钟时间与 CPU 时间
+    resource = None
+
+# 场景：名称 -> (区域，None 表示全球, zoom)
+SCENARIOS = {
+    "z4-global": (None, 4),
+    "z4-japan": ("japan", 4),
+    "z5-global": (None, 5),
+    "z5-china": ("china", 5),
+}
+# 规模：每颗卫星的帧数（10 分钟间隔）
+SIZES = {"small": 3, "medium": 12, "large": 48}
+CASES = ("concat_tiles", "process_concat_core", "process_blend_core", "generate_timelapse")
+# 合成瓦片的内容变体数：瓦片按坐标与帧轮换使用，避免逐个编码 JPEG
+TILE_VARIANTS = 16
+
+
+def _tile_variants(count: int = TILE_VARIANTS) -> List[bytes]:
+    """生成带渐变与噪声的 JPEG 瓦片（压缩率与解码开销接近真实卫星图）"""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 160, 256, dtype=np.float32)
+    variants = []
+    for i in range(count):
+        base = gradient[None, :, None] + gradient[:, None, None] * (i % 4) / 4
+        noise = rng.normal(0, 18, (256, 256, 3))
+        pixels = np.clip(base + noise + i * 5, 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels, "RGB").save(buffer, format="JPEG", quality=85)
+        variants.append(buffer.getvalue())
+    return variants
+
+
+def _satellite_ranges(region: Optional[str], zoom: int) -> Dict[str, tuple]:
+    """参与混合的各卫星与区域相交的瓦片范围 (行 range, 列 range)，与 plan_download 一致"""
+    from zoom_earth_cli.const import (
+        COUNTRY_BOUNDS,
+        get_bound_tile_range,
+        get_satellite_tile_range,
+        range_intersection,
+        region_canvas,
+    )
+
+    _, _, offsets = region_canvas(region or "global", zoom)
+    ranges = {}
+    for satellite in offsets:
+        rows, cols = get_satellite_tile_range(zoom, satellite)
+        if region is not None:
+            c_rows, c_cols = get_bound_tile_range(zoom, COUNTRY_BOUNDS[region])
+            row_span = range_intersection((min(rows), max(rows)), (min(c_rows), max(c_rows)))
+            col_span = range_intersection((min(cols), max(cols)), (min(c_cols), max(c_cols)))
+            if row_span is None or col_span is None:
+                continue
+            rows, cols = range(row_span[0], row_span[1] + 1), range(col_span[0], col_span[1] + 1)
+        ranges[satellite] = (rows, cols)
+    return ranges
+
+
+def generate_tree(workdir: Path, region: Optional[str], zoom: int, frames: int) -> int:
+    """在 workdir/downloads/<区域>/ 下生成合成瓦片树（含 extent.json），返回瓦片数"""
+    from zoom_earth_cli.api_client import write_tile_extent
+
+    name = region or "global"
+    variants = _tile_variants()
+    latest = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    count = 0
+    try:
+        for satellite, (rows, cols) in _satellite_ranges(region, zoom).items():
+            write_tile_extent(name, satellite, zoom, rows, cols)
+            for frame in range(frames):
+                dt = latest - timedelta(minutes=10 * (frames - 1 - frame))
+                tile_dir = Path("downloads", name, satellite, str(zoom), dt.strftime("%Y-%m-%d"), dt.strftime("%H%M"))
+                tile_dir.mkdir(parents=True, exist_ok=True)
+                for x in rows:
+                    for y in cols:
+                        (tile_dir / f"x{x}_y{y}.jpg").write_bytes(variants[(x * 7 + y * 3 + frame) % len(variants)])
+                        count += 1
+    finally:
+        os.chdir(cwd)
+    return count
+
+
+def _usage() -> Dict[str, float]:
+    if resource is None:
+        return {"cpu": time.process_time(), "rss_kb": 0}
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    rss = max(own.ru_maxrss, children.ru_maxrss)
+    if sys.platform == "darwin":  # macOS 以字节为单位
+        rss //= 1024
+    return {"cpu": own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime, "rss_kb": rss}
+
+
+def _run_case(case: str, workdir: str, region: Optional[str], zoom: int, frames: int, workers: int, results) -> None:
+    """子进程入口：运行单个用例并回传测量结果"""
+    logging.basicConfig(level=logging.WARNING)
+    os.chdir(workdir)
+    from zoom_earth_cli.metrics import metrics
+    from zoom_earth_cli.const import region_canvas
+
+    name = region or "global"
+    logger = logging.getLogger("benchmark")
+    canvas_width, canvas_height, offsets = region_canvas(name, zoom)
+    before = _usage()
+    started = time.perf_counter()
+
+    if case == "concat_tiles":
+        from zoom_earth_cli.utils import concat_tiles
+
+        # 瓦片最多的卫星的最新一帧
+        satellite = max(Path("downloads", name).iterdir(), key=lambda d: len(list(d.glob(f"{zoom}/*/*/*.jpg"))))
+        frame_dir = sorted(satellite.glob(f"{zoom}/*/*"))[-1]
+        extent = json.loads((satellite / str(zoom) / "extent.json").read_text())
+        output_path = Path("bench_mosaic.png")
+        output_path.unlink(missing_ok=True)
+        concat_tiles(tile_dir=frame_dir, output_path=output_path, extent=extent)
+    elif case == "process_concat_core":
+        from zoom_earth_cli.concat import process_concat_core
+
+        shutil.rmtree(Path("mosaics", name), ignore_errors=True)
+        process_concat_core(str(Path("downloads", name)), str(Path("mosaics", name)), 256, 0, False, None, 0, logger)
+    elif case == "process_blend_core":
+        from zoom_earth_cli.blender import process_blend_core
+
+        shutil.rmtree(Path("lighter_blend", name), ignore_errors=True)
+        process_blend_core(
+            mosaics_dir=str(Path("mosaics", name)),
+            output_base_dir=str(Path("lighter_blend", name)),
+            hours=0,
+            canvas_width=canvas_width,
+            canvas_height=canvas_height,
+            satellite_offsets=offsets,
+            logger=logger,
+            zoom_level=zoom,
+            overwrite=True,
+            workers=workers,
+        )
+    elif case == "generate_timelapse":
+        from zoom_earth_cli.ffmpeg import generate_timelapse
+
+        generate_timelapse(
+            input_dir=str(Path("lighter_blend", name, str(zoom))),
+            output_file="bench.mp4",
+            duration_hours=max(1, frames // 6 + 1),
+        )
+
+    wall = time.perf_counter() - started
+    after = _usage()
+    phases = {}
+    for hist in metrics.snapshot()["histograms"]:
+        labels = ",".join(f"{k}={v}" for k, v in sorted(hist["labels"].items()))
+        phases[f"{hist['name']}{{{labels}}}" if labels else hist["name"]] = round(hist["sum"], 4)
+    results.put({
+        "wall_seconds": round(wall, 4),
+        "cpu_seconds": round(after["cpu"] - before["cpu"], 4),
+        "peak_rss_mb": round(after["rss_kb"] / 1024, 1),
+        "phases": phases,
+    })
+
+
+def run_case(case: str, workdir: Path, region: Optional[str], zoom: int, frames: int, workers: int) -> dict:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_case, args=(case, str(workdir), region, zoom, frames, workers, results))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"用例 {case} 失败（退出码 {process.exitcode}）")
+    return results.get()
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """返回回退描述列表：墙钟时间或峰值内存超过基线 (1 + threshold) 倍"""
+    regressions = []
+    for key, current in results.items():
+        base = baseline.get("results", {}).get(key)
+        if base is None:
+            continue
+        for metric in ("wall_seconds", "peak_rss_mb"):
+            if base[metric] and current[metric] > base[metric] * (1 + threshold):
+                regressions.append(
+                    f"{key} {metric}: {base[metric]} -> {current[metric]} ({(current[metric] / base[metric] - 1) * 100:+.1f}%)"
+                )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="合成数据基准测试（拼接/混合/视频）")
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS), help="场景，可重复指定")
+    parser.add_argument("--size", choices=sorted(SIZES), default="small", help="规模预设（每颗卫星帧数）")
+    parser.add_argument("--frames", type=int, help="每颗卫星帧数，覆盖 --size")
+    parser.add_argument("--case", action="append", choices=CASES, help="只运行指定用例，可重复指定")
+    parser.add_argument("--workers", type=int, default=1, help="混合进程数，默认1")
+    parser.add_argument("--repeat", type=int, default=1, help="每个用例重复次数，取墙钟时间的中位数，默认1")
+    parser.add_argument("--workdir", help="合成数据目录（默认临时目录，运行后删除）")
+    parser.add_argument("--save", help="把结果保存为基线 JSON")
+    parser.add_argument("--compare", help="与基线 JSON 对比")
+    parser.add_argument("--threshold", type=float, default=0.15, help="回退阈值（相对增幅），默认0.15")
+    args = parser.parse_args()
+
+    scenarios = args.scenario or ["z4-global", "z4-japan"]
+    frames = args.frames or SIZES[args.size]
+    cases = [case for case in CASES if not args.case or case in args.case]
+    if "generate_timelapse" in cases and shutil.which("ffmpeg") is None:
+        print("未找到 ffmpeg，跳过 generate_timelapse")
+        cases.remove("generate_timelapse")
+
+    results = {}
+    root = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="zec-bench-"))
+    try:
+        for scenario in scenarios:
+            region, zoom = SCENARIOS[scenario]
+            workdir = root / scenario
+            shutil.rmtree(workdir, ignore_errors=True)
+            workdir.mkdir(parents=True)
+            started = time.perf_counter()
+            tiles = generate_tree(workdir, region, zoom, frames)
+            print(f"[{scenario}] 生成 {tiles} 个瓦片（{frames} 帧/卫星），用时 {time.perf_counter() - started:.1f}s")
+            for case in cases:
+                runs = sorted(
+                    (run_case(case, workdir, region, zoom, frames, args.workers) for _ in range(max(1, args.repeat))),
+                    key=lambda run: run["wall_seconds"]
+                )
+                result = runs[len(runs) // 2]
+                results[f"{scenario}/{case}"] = result
+                print(
+                    f"  {case:<22}{result['wall_seconds']:>9.3f}s wall{result['cpu_seconds']:>9.3f}s cpu"
+                    f"{result['peak_rss_mb']:>9.1f} MB"
+                )
+                for phase, seconds in sorted(result["phases"].items()):
+                    print(f"      {phase:<40}{seconds:>9.3f}s")
+    finally:
+        if not args.workdir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "frames": frames,
+            "workers": args.workers,
+            "repeat": args.repeat,
+            "fingerprint": hashlib.sha1(json.dumps([scenarios, cases, frames]).encode()).hexdigest()[:12],
+        },
+        "results": results,
+    }
+    if args.save:
+        Path(args.save).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"结果已保存: {args.save}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if baseline["meta"].get("fingerprint") != report["meta"]["fingerprint"]:
+            print("警告：基线的场景/用例/帧数与本次不同，只对比共同的用例")
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"回退: {line}")
+        if regressions:
+            return 1
+        print(f"未发现超过 {args.threshold * 100:.0f}% 的回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+CLI 启动耗时基准：
+  python scripts/import_time.py                 # 测量 `import zoom_earth_cli.main` 与 `zec --help`
+  python scripts/import_time.py --save base.json
+  python scripts/import_time.py --compare base.json
+
+每项在全新子进程中运行 N 次取中位数，并列出 -X importtime 下累计耗时最多的模块。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+CASES = {
+    "import": [sys.executable, "-c", "import zoom_earth_cli.main"],
+    "help": [sys.executable, "-m", "zoom_earth_cli.main", "--help"],
+}
+# 启动阶段不应出现的重依赖
+HEAVY_MODULES = ("numpy", "PIL", "requests", "rich.progress", "asyncio")
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT / "src"), env.get("PYTHONPATH")]))
+    return env
+
+
+def measure(command: List[str], runs: int) -> float:
+    """返回子进程运行的中位耗时（毫秒）"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def import_profile(top: int) -> Tuple[List[Tuple[str, int]], List[str]]:
+    """解析 -X importtime 输出：返回 (累计耗时最多的模块 [(模块, 微秒)], 已导入的重依赖)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import zoom_earth_cli.main"],
+        env=_env(), capture_output=True, text=True, check=True
+    )
+    modules: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative)
+    ranked = sorted(modules.items(), key=lambda item: -item[1])[:top]
+    heavy = [name for name in HEAVY_MODULES if name in modules]
+    return ranked, heavy
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="测量 zec 启动耗时")
+    parser.add_argument("--runs", type=int, default=10, help="每项运行次数，默认10")
+    parser.add_argument("--top", type=int, default=15, help="列出累计耗时最多的模块数")
+    parser.add_argument("--save", help="把结果保存为基线 JSON")
+    parser.add_argument("--compare", help="与基线 JSON 对比")
+    args = parser.parse_args()
+
+    results = {name: round(measure(command, args.runs), 1) for name, command in CASES.items()}
+    ranked, heavy = import_profile(args.top)
+
+    print(f"{'模块':<50}{'累计(ms)':>10}")
+    for name, micros in ranked:
+        print(f"{name:<50}{micros / 1000:>10.1f}")
+    print()
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else {}
+    for name, value in results.items():
+        line = f"{name:<10}{value:>8.1f} ms（中位数，{args.runs} 次）"
+        if name in baseline:
+            line += f"  基线 {baseline[name]:.1f} ms，{(value / baseline[name] - 1) * 100:+.1f}%"
+        print(line)
+    if heavy:
+        print(f"警告：启动时导入了重依赖 {', '.join(heavy)}")
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2))
+    return 1 if heavy else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,31 @@
 import os
 import json
 import logging
+import time
 import requests
 from pprint import pprint
 from datetime import datetime, timezone
-from typing import Tuple, Optional, List
+from typing import Dict, Tuple, Optional, List
 from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from zoom_earth_cli.const import get_satellite_tile_range, get_bound_tile_range, COUNTRY_BOUNDS
+from zoom_earth_cli.coverage import get_region_tiles
+from zoom_earth_cli.locking import ClaimSet
+from zoom_earth_cli.logs import LogSampler, ProgressReporter, RateLimiter
+from zoom_earth_cli.metrics import metrics
+from zoom_earth_cli.ownership import ALTERNATES, build_ownership
 from zoom_earth_cli.utils import filter_timestamps_by_hours
+from zoom_earth_cli.validation import JPEGStreamValidator
 
 
 # 初始化模块级 logger
 logger = logging.getLogger(__name__)
 
+# 逐瓦片日志：成功/跳过只采样输出 DEBUG，失败警告限速；整体情况由 ProgressReporter 周期汇总
+_tile_log_sampler = LogSampler(every=500)
+_tile_warning_limiter = RateLimiter(per_second=2.0, burst=10)
+
 headers = {
     'accept': '*/*',
     'accept-language': 'zh-CN,zh;q=0.9',
@@ -139,20 +150,33 @@ def download_tile(country: str, satellite: str, timestamp: int, x: int, y: int,
         
         # 检查文件是否已存在
         if os.path.exists(filename):
-            logger.info(f"文件已存在，跳过下载: {filename}")
+            if _tile_log_sampler.sample():
+                logger.debug(f"文件已存在，跳过下载: {filename}")
+            metrics.inc("download_tiles_total", satellite=satellite, result="exists")
             return (True, False)
             
-        logger.debug(f"开始下载贴图: {url}")
-
         # 下载到临时文件（避免部分写入）
         temp_file = filename + ".tmp"
+        started = time.perf_counter()
         response = requests.get(url, headers=headers, stream=True, timeout=15)
+        metrics.inc("http_responses_total", status=response.status_code)
         response.raise_for_status()
 
-        # 写入临时文件
+        # 写入临时文件，同时校验 JPEG 结构（SOI/SOF 尺寸/EOI），不做完整解码
+        validator = JPEGStreamValidator()
         with open(temp_file, "wb") as f:
             for chunk in response.iter_content(chunk_size=8192):
+                if not validator.feed(chunk):
+                    break
                 f.write(chunk)
+        invalid_reason = validator.finish()
+        if invalid_reason:
+            response.close()
+            os.remove(temp_file)
+            if _tile_warning_limiter.allow():
+                logger.warning(f"下载内容无效，等待重试 - URL: {url} | {invalid_reason}")
+            metrics.inc("download_tiles_total", satellite=satellite, result="invalid")
+            return (False, False)
 
         # 检查文件大小是否过小（<0.2KB）
         file_size = os.path.getsize(temp_file)
@@ -163,38 +187,58 @@ def download_tile(country: str, satellite: str, timestamp: int, x: int, y: int,
         #     return (True, True)   # 成功生成黑图，需要记录到黑名单
         # else:
         os.rename(temp_file, filename)  # 重命名为正式文件
-        logger.info(f"下载成功: {filename} ({file_size/1024:.1f}KB)")
+        if _tile_log_sampler.sample():
+            logger.debug(f"下载成功: {filename} ({file_size/1024:.1f}KB)")
+        metrics.inc("download_tiles_total", satellite=satellite, result="ok")
+        metrics.inc("download_bytes_total", file_size, satellite=satellite)
+        metrics.observe("download_seconds", time.perf_counter() - started, satellite=satellite)
         return (True, False)  # 成功且无需记录
 
     except requests.exceptions.RequestException as e:
         status_code = getattr(e.response, "status_code", "N/A")
-        logger.warning(f"下载失败 - URL: {url} | 状态码: {status_code}")
+        if _tile_warning_limiter.allow():
+            logger.warning(f"下载失败 - URL: {url} | 状态码: {status_code}")
+        if e.response is None:
+            # 连接错误/超时：没有 HTTP 响应
+            metrics.inc("http_responses_total", status="error")
+        metrics.inc("download_tiles_total", satellite=satellite, result="http_error")
         return (False, False)
     except Exception as e:
         logger.error(f"未知错误: {str(e)}", exc_info=True)
+        metrics.inc("download_tiles_total", satellite=satellite, result="error")
         return (False, False)
 
-def batch_download(
-        concurrency: int = 5,
+def write_tile_extent(country: str, satellite: str, zoom: int, x_range: range, y_range: range):
+    """在 downloads/<国家>/<卫星>/<zoom>/extent.json 中记录计划下载的瓦片范围（闭区间）"""
+    extent_dir = os.path.join("downloads", country, satellite, f"{zoom}")
+    os.makedirs(extent_dir, exist_ok=True)
+    extent = {"x": [x_range.start, x_range.stop - 1], "y": [y_range.start, y_range.stop - 1]}
+    with open(os.path.join(extent_dir, "extent.json"), "w", encoding="utf-8") as f:
+        json.dump(extent, f)
+
+def plan_download(
         satellites: Optional[List[str]] = None,
         hours: int = 2,
         zoom: int = 4,
-        country: Optional[str] = None
-    ):
-    """批量下载主逻辑（包含黑名单过滤和国家边界筛选）
-    
-    Args:
-        concurrency: 并发线程数，默认5
-        satellites: 要处理的卫星列表，默认全部
-        hours: 仅处理最新N小时内的数据，0表示不限制
-        zoom: zoom级别，默认为4
-        country: 国家名称，从COUNTRY_BOUNDS中选择，None表示全球
+        country: Optional[str] = None,
+        coverage_file: Optional[str] = None,
+        ownership_margin: Optional[int] = None
+    ) -> Optional[Tuple[str, Dict[str, List[int]], Dict[str, List[Tuple[int, int]]]]]:
+    """规划下载任务（batch_download 与 zec run 共用），同时写出各卫星的 extent.json
+
+    Returns:
+        (区域名, 卫星 -> 时间戳列表, 卫星 -> 每帧需下载的瓦片坐标 (x, y))；获取时间列表失败时返回 None。
+        与区域无交集的卫星不出现在坐标字典中
     """
     county_name = 'global'
+    region_tiles = None
     # 国家边界检查
     if country is not None:
         county_name = country
-        if country not in COUNTRY_BOUNDS:
+        if coverage_file:
+            region_tiles = get_region_tiles(coverage_file, country, zoom)
+            logging.info(f"按 {coverage_file} 中的 {country} 轮廓筛选，共 {len(region_tiles)} 个瓦片")
+        elif country not in COUNTRY_BOUNDS:
             raise ValueError(f"国家 '{country}' 不在预定义列表中，可选: {list(COUNTRY_BOUNDS.keys())}")
         logging.info(f"将下载 {country} 范围内的卫星贴图")
     else:
@@ -205,24 +249,36 @@ def batch_download(
     latest_times = get_latest_times(hours=hours)
     if not latest_times:
         logging.error("获取卫星时间数据失败")
-        return
+        return None
     
     filtered_times = {k: v for k, v in latest_times.items() if k in satellites}
 
-    # 阶段1: 预处理
-    tasks = []
-    pre_stats = defaultdict(lambda: defaultdict(dict))
-    
+    ownership = None
+    if ownership_margin is not None:
+        ownership = build_ownership(zoom, tuple(sorted(filtered_times)), ownership_margin)
+        # 与主卫星时间戳相同的替补图像在混合时永远不会被选用
+        for alternate, main in ALTERNATES.items():
+            if alternate in filtered_times and main in filtered_times:
+                main_times = set(filtered_times[main])
+                skipped = [ts for ts in filtered_times[alternate] if ts in main_times]
+                filtered_times[alternate] = [ts for ts in filtered_times[alternate] if ts not in main_times]
+                if skipped:
+                    logging.info(f"{alternate} 有 {len(skipped)} 个时间点与 {main} 重复，跳过下载")
+
     # 获取国家边界对应的瓦片范围
-    if country is not None:
+    if region_tiles is not None:
+        # 多边形覆盖的外接矩形，瓦片再逐个按覆盖集合筛选
+        c_x_range = range(min(x for x, _ in region_tiles), max(x for x, _ in region_tiles) + 1)
+        c_y_range = range(min(y for _, y in region_tiles), max(y for _, y in region_tiles) + 1)
+    elif country is not None:
         country_bounds = COUNTRY_BOUNDS[country]
         c_x_range, c_y_range = get_bound_tile_range(zoom, country_bounds)
     else:
         # 如果没有指定国家，则下载所有瓦片
         c_x_range, c_y_range = None, None
 
+    planned: Dict[str, List[Tuple[int, int]]] = {}
     for satellite in filtered_times:
-        pre_stats[satellite] = {}
         x_range, y_range = get_satellite_tile_range(zoom, satellite)
         
         # 计算卫星瓦片范围与国家范围的交集
@@ -247,73 +303,138 @@ def batch_download(
             valid_x_range = x_range
             valid_y_range = y_range
 
+        # 记录完整拼接范围，部分瓦片不下载时拼接画布仍保持相同尺寸与偏移
+        write_tile_extent(county_name, satellite, zoom, valid_x_range, valid_y_range)
+
+        planned[satellite] = [
+            (x, y) for x in valid_x_range for y in valid_y_range
+            if (region_tiles is None or (x, y) in region_tiles)
+            and (ownership is None or ownership.owns(satellite, x, y))
+        ]
+        if ownership is not None:
+            logging.info(
+                f"卫星 {satellite} 按归属表需下载 {len(planned[satellite])}/"
+                f"{len(valid_x_range) * len(valid_y_range)} 个瓦片"
+            )
+
+    return county_name, filtered_times, planned
+
+def batch_download(
+        concurrency: int = 5,
+        satellites: Optional[List[str]] = None,
+        hours: int = 2,
+        zoom: int = 4,
+        country: Optional[str] = None,
+        coverage_file: Optional[str] = None,
+        ownership_margin: Optional[int] = None
+    ):
+    """批量下载主逻辑（包含黑名单过滤和国家边界筛选）
+    
+    Args:
+        concurrency: 并发线程数，默认5
+        satellites: 要处理的卫星列表，默认全部
+        hours: 仅处理最新N小时内的数据，0表示不限制
+        zoom: zoom级别，默认为4
+        country: 国家名称，从COUNTRY_BOUNDS中选择，None表示全球
+        coverage_file: 区域轮廓 GeoJSON 文件，指定后只下载与 country 轮廓相交的瓦片
+        ownership_margin: 指定后按卫星归属表只下载对最终合成有贡献的瓦片，
+                          数值为归属边界两侧保留的重叠列数；None 表示下载完整范围
+    """
+    suppressed_before = _tile_warning_limiter.suppressed
+    plan = plan_download(satellites, hours, zoom, country, coverage_file, ownership_margin)
+    if plan is None:
+        return
+    county_name, filtered_times, planned = plan
+
+    # 阶段1: 预处理
+    tasks = []
+    pre_stats = defaultdict(lambda: defaultdict(dict))
+    for satellite, planned_coords in planned.items():
         for timestamp in filtered_times[satellite]:
-            all_coords = [(x, y) for x in valid_x_range for y in valid_y_range]
-            
             # 记录预处理数据
             pre_stats[satellite][timestamp] = {
-                'total': len(all_coords),
+                'total': len(planned_coords),
             }
             
             # 生成下载任务
-            tasks.extend([(satellite, timestamp, x, y) 
-                        for x, y in all_coords if (x, y)])
-
-    # 阶段2: 批量并行下载
-    def _download_wrapper(args):
-        satellite, timestamp, x, y = args
-        success, is_black = download_tile(county_name, satellite, timestamp, x, y, zoom)
-        return (satellite, timestamp, success, is_black, x, y)
-
-    results = []
-    if tasks:
-        with ThreadPoolExecutor(max_workers=concurrency) as executor:
-            futures = [executor.submit(_download_wrapper, task) for task in tasks]
-            for future in as_completed(futures):
-                results.append(future.result())
-    else:
-        logging.info("没有需要下载的任务")
-        return
+            tasks.extend([(satellite, timestamp, x, y) for x, y in planned_coords])
+
+    # 按帧认领：与并发运行（如超时未结束的上一次 cron）分摊剩余帧，不重复下载
+    claims = ClaimSet("download", county_name, logger=logger)
+    with claims:
+        frame_keys = {(satellite, timestamp): f"{satellite}-{zoom}-{timestamp}" for satellite, timestamp, _, _ in tasks}
+        all_keys = sorted(set(frame_keys.values()))
+        claimed = set(claims.claim_all(all_keys))
+        if len(claimed) < len(all_keys):
+            logging.info(f"{len(all_keys) - len(claimed)} 个帧正由其他进程下载，已跳过")
+        tasks = [task for task in tasks if frame_keys[(task[0], task[1])] in claimed]
+
+        # 阶段2: 批量并行下载
+        def _download_wrapper(args):
+            satellite, timestamp, x, y = args
+            success, is_black = download_tile(county_name, satellite, timestamp, x, y, zoom)
+            return (satellite, timestamp, success, is_black, x, y)
+
+        results = []
+        if tasks:
+            progress = ProgressReporter("下载", len(tasks), logger=logger)
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = [executor.submit(_download_wrapper, task) for task in tasks]
+                for future in as_completed(futures):
+                    result = future.result()
+                    results.append(result)
+                    progress.update("成功" if result[2] else "失败")
+            progress.finish()
+        else:
+            logging.info("没有需要下载的任务")
+            return
 
-    # 阶段3: 处理结果
-    result_stats = defaultdict(lambda: defaultdict(lambda: {
-        'success': 0, 'failed': 0, 'new_black': 0
-    }))
-    new_black = defaultdict(lambda: defaultdict(set))  # 新结构: {sat: {zoom: set}}
-
-    for satellite, timestamp, success, is_black, x, y in results:
-        result_stats[satellite][timestamp]['success' if success else 'failed'] += 1
-        if is_black:
-            new_black[satellite][zoom].add((x, y))  # 关联当前zoom
-            result_stats[satellite][timestamp]['new_black'] += 1
-
-    # 阶段4: 失败任务重试
-    failed_tasks = []
-    for satellite, timestamp, success, is_black, x, y in results:
-        if not success:
-            failed_tasks.append((satellite, timestamp, x, y))
+        # 阶段3: 处理结果
+        result_stats = defaultdict(lambda: defaultdict(lambda: {
+            'attempted': 0, 'success': 0, 'failed': 0, 'new_black': 0, 'retried': 0, 'recovered': 0
+        }))
+        new_black = defaultdict(lambda: defaultdict(set))  # 新结构: {sat: {zoom: set}}
+
+        for satellite, timestamp, success, is_black, x, y in results:
+            result_stats[satellite][timestamp]['attempted'] += 1
+            result_stats[satellite][timestamp]['success' if success else 'failed'] += 1
+            if is_black:
+                new_black[satellite][zoom].add((x, y))  # 关联当前zoom
+                result_stats[satellite][timestamp]['new_black'] += 1
+
+        # 阶段4: 失败任务重试
+        failed_tasks = []
+        for satellite, timestamp, success, is_black, x, y in results:
+            if not success:
+                failed_tasks.append((satellite, timestamp, x, y))
+                result_stats[satellite][timestamp]['retried'] += 1
     
-    # 重试失败的任务
-    if failed_tasks:
-        logging.info(f"\n开始重试 {len(failed_tasks)} 个失败任务...")
-        retry_results = []
-        with ThreadPoolExecutor(max_workers=concurrency) as executor:
-            futures = [executor.submit(_download_wrapper, task) for task in failed_tasks]
-            for future in as_completed(futures):
-                retry_results.append(future.result())
+        # 重试失败的任务
+        if failed_tasks:
+            logging.info(f"\n开始重试 {len(failed_tasks)} 个失败任务...")
+            retry_results = []
+            progress = ProgressReporter("重试", len(failed_tasks), logger=logger)
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = [executor.submit(_download_wrapper, task) for task in failed_tasks]
+                for future in as_completed(futures):
+                    result = future.result()
+                    retry_results.append(result)
+                    progress.update("成功" if result[2] else "失败")
+            progress.finish()
         
-        # 更新重试结果
-        for satellite, timestamp, success, is_black, x, y in retry_results:
-            if success:
-                result_stats[satellite][timestamp]['success'] += 1
-                result_stats[satellite][timestamp]['failed'] -= 1
-                if is_black:
-                    new_black[satellite].add((x, y))
-                    result_stats[satellite][timestamp]['new_black'] += 1
-
-    # 阶段5: 生成统计报告
+            # 更新重试结果
+            for satellite, timestamp, success, is_black, x, y in retry_results:
+                if success:
+                    result_stats[satellite][timestamp]['success'] += 1
+                    result_stats[satellite][timestamp]['failed'] -= 1
+                    result_stats[satellite][timestamp]['recovered'] += 1
+                    if is_black:
+                        new_black[satellite][zoom].add((x, y))
+                        result_stats[satellite][timestamp]['new_black'] += 1
+
+    # 阶段5: 生成统计报告（成功率按本进程实际尝试的瓦片计算，失败数为重试之后仍失败的数量）
     for satellite in filtered_times:
-        sat_total = sat_success = sat_failed = sat_new_black = 0
+        sat_total = sat_attempted = sat_success = sat_failed = sat_new_black = sat_retried = sat_recovered = 0
         
         for timestamp in filtered_times[satellite]:
             # 获取预处理数据
@@ -323,17 +444,36 @@ def batch_download(
             
             # 累加卫星统计
             sat_total += pre['total']
-            sat_success += res.get('success',0)
-            sat_failed += res.get('failed',0)
+            sat_attempted += res['attempted']
+            sat_success += res['success']
+            sat_failed += res['failed']
+            sat_new_black += res['new_black']
+            sat_retried += res['retried']
+            sat_recovered += res['recovered']
+
+        metrics.inc("download_planned_tiles_total", sat_total, satellite=satellite)
+        metrics.inc("download_attempted_tiles_total", sat_attempted, satellite=satellite)
+        metrics.inc("download_failed_tiles_total", sat_failed, satellite=satellite)
+        metrics.inc("download_retried_tiles_total", sat_retried, satellite=satellite)
+        metrics.inc("download_recovered_tiles_total", sat_recovered, satellite=satellite)
+        metrics.inc("download_new_black_tiles_total", sat_new_black, satellite=satellite)
 
         # 生成卫星汇总日志
         logging.info(f"\n卫星 {satellite} 汇总:")
         logging.info(f"处理时间点: {len(filtered_times[satellite])}")
         logging.info(f"总处理区域: {sat_total}")
-        if sat_total > 0:
-            logging.info(f"成功率: {sat_success/(sat_total)*100:.1f}% [成功{sat_success}/尝试{sat_total}]")
-        if sat_failed > 0:
-            logging.info(f"失败任务数: {sat_failed} (已重试)")
+        if sat_attempted < sat_total:
+            logging.info(f"由其他进程处理: {sat_total - sat_attempted}")
+        if sat_attempted > 0:
+            logging.info(f"成功率: {sat_success/sat_attempted*100:.1f}% [成功{sat_success}/尝试{sat_attempted}]")
+        if sat_retried > 0:
+            logging.info(f"重试任务数: {sat_retried}（恢复 {sat_recovered}，仍失败 {sat_failed}）")
+        if sat_new_black > 0:
+            logging.info(f"新增黑图: {sat_new_black}")
+
+    suppressed = _tile_warning_limiter.suppressed - suppressed_before
+    if suppressed:
+        logging.info(f"另有 {suppressed} 条瓦片失败警告因限速未输出（失败数已计入上面的汇总）")
 
 def all_download(
     concurrency: int = 20,
@@ -0,0 +1,336 @@
+import io
+import json
+import logging
+import os
+import shutil
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from fnmatch import fnmatch
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+from zoom_earth_cli.locking import stage_lock
+from zoom_earth_cli.metrics import metrics
+
+try:
+    import zstandard
+except ImportError:  # 未安装时用 zlib 压缩，包格式相同
+    zstandard = None
+
+# 按天归档：<日期>/ 目录整体写成同级的 <日期>.zpk，读取时按条目偏移 seek，不解包
+# downloads/<区域>/<卫星>/<zoom>/<日期>.zpk     条目 <HHMM>/x*_y*.jpg
+# mosaics/<区域>/<卫星>/<zoom>/<日期>.zpk       条目 <HHMM>.png|npy
+# lighter_blend/<区域>/<zoom>/<日期>.zpk        条目 <HHMM>.png
+ARCHIVE_STAGES = {"downloads": 4, "mosaics": 4, "lighter_blend": 3}
+
+PACK_SUFFIX = ".zpk"
+PACK_MAGIC = b"ZECPACK1"
+INDEX_MAGIC = b"ZECINDEX"
+PACK_VERSION = 1
+# 包尾：索引偏移、索引长度、魔数
+_FOOTER = struct.Struct("<QQ8s")
+
+# JPEG/PNG 本身已压缩，原样存储；这样 ffmpeg 也能通过 subfile 协议直接读取条目
+STORED_SUFFIXES = (".jpg", ".png")
+ZSTD_LEVEL = 3
+ZLIB_LEVEL = 6
+
+
+class PackReader:
+    """
+    只读打开一个日包：索引常驻内存，条目按偏移读取，线程安全（每次读取单独打开文件）
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.stat = self.path.stat()
+        with open(self.path, "rb") as f:
+            if f.read(len(PACK_MAGIC)) != PACK_MAGIC:
+                raise ValueError(f"不是有效的归档包: {self.path}")
+            f.seek(-_FOOTER.size, os.SEEK_END)
+            index_offset, index_length, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+            if magic != INDEX_MAGIC:
+                raise ValueError(f"归档包索引损坏: {self.path}")
+            f.seek(index_offset)
+            index = json.loads(zlib.decompress(f.read(index_length)))
+        # 条目名 -> [偏移, 存储长度, 原始长度, 存储方式, crc32]
+        self.entries: Dict[str, list] = index["entries"]
+
+    def read_blob(self, name: str) -> bytes:
+        """读取条目的存储字节（未解压）"""
+        offset, length = self.entries[name][:2]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def read(self, name: str) -> bytes:
+        _, _, size, method, crc = self.entries[name]
+        data = _decode(self.read_blob(name), method, size)
+        if zlib.crc32(data) != crc:
+            raise ValueError(f"归档条目校验失败: {self.path}:{name}")
+        return data
+
+
+@lru_cache(maxsize=64)
+def _cached_reader(path: str, mtime_ns: int, size: int) -> PackReader:
+    return PackReader(Path(path))
+
+
+def open_pack(path: Path) -> PackReader:
+    """打开日包，索引按 (路径, 修改时间, 大小) 缓存，包被重写后自动失效"""
+    st = os.stat(path)
+    return _cached_reader(os.fspath(path), st.st_mtime_ns, st.st_size)
+
+
+def _encode(data: bytes, suffix: str) -> Tuple[bytes, str]:
+    if suffix in STORED_SUFFIXES:
+        return data, "store"
+    if zstandard is not None:
+        blob, method = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data), "zstd"
+    else:
+        blob, method = zlib.compress(data, ZLIB_LEVEL), "zlib"
+    return (blob, method) if len(blob) < len(data) else (data, "store")
+
+
+def _decode(blob: bytes, method: str, size: int) -> bytes:
+    if method == "store":
+        return blob
+    if method == "zlib":
+        return zlib.decompress(blob)
+    if method == "zstd":
+        if zstandard is None:
+            raise RuntimeError("该归档条目使用 zstd 压缩，请安装 zstandard: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompress(blob, max_output_size=size)
+    raise ValueError(f"未知的存储方式: {method}")
+
+
+def _pack_path(day_dir: Path) -> Path:
+    return day_dir.with_name(day_dir.name + PACK_SUFFIX)
+
+
+def _enclosing_packs(path: Path) -> Iterable[Tuple[PackReader, str]]:
+    """path 本身或其父目录被归档时，产出 (日包, path 在包内的前缀)"""
+    for day_dir, prefix in ((path, ""), (path.parent, path.name + "/")):
+        if not day_dir.name:
+            continue
+        pack = _pack_path(day_dir)
+        if pack.is_file():
+            yield open_pack(pack), prefix
+
+
+def locate(path: Path) -> Optional[Tuple[PackReader, str]]:
+    """查找不在磁盘上的文件所属的日包，返回 (日包, 条目名)；未归档时返回 None"""
+    path = Path(path)
+    for reader, prefix in _enclosing_packs(path.parent):
+        name = prefix + path.name
+        if name in reader.entries:
+            return reader, name
+    return None
+
+
+def exists(path: Path) -> bool:
+    """文件在磁盘上或已归档"""
+    return os.path.exists(path) or locate(path) is not None
+
+
+def open_frame(path: Path) -> BinaryIO:
+    """打开帧文件；不在磁盘上时从日包读取条目（只读这一个条目）"""
+    try:
+        return open(path, "rb")
+    except FileNotFoundError:
+        found = locate(path)
+        if found is None:
+            raise
+    reader, name = found
+    metrics.inc("archive_reads_total")
+    return io.BytesIO(reader.read(name))
+
+
+def frame_stat(path: Path) -> Tuple[tuple, int, int]:
+    """
+    返回 (标识, 大小, 修改时间 ns)。磁盘文件的标识为 (设备, inode)，硬链接的重复帧相同；
+    归档条目的标识为 (日包, 偏移)，归档时按 inode 去重的条目共享偏移。
+    """
+    try:
+        st = os.stat(path)
+        return (st.st_dev, st.st_ino), st.st_size, st.st_mtime_ns
+    except FileNotFoundError:
+        found = locate(path)
+        if found is None:
+            raise
+    reader, name = found
+    offset, _, size = reader.entries[name][:3]
+    return (os.fspath(reader.path), offset), size, reader.stat.st_mtime_ns
+
+
+def ffmpeg_input(path: Path) -> str:
+    """ffmpeg 可读的输入地址：磁盘文件为路径，归档条目为 subfile 协议的字节区间"""
+    if os.path.exists(path):
+        return os.fspath(path)
+    found = locate(path)
+    if found is None:
+        raise FileNotFoundError(path)
+    reader, name = found
+    offset, length, _, method = reader.entries[name][:4]
+    if method != "store":
+        raise ValueError(f"归档条目 {name} 经过压缩，ffmpeg 无法直接读取")
+    return f"subfile,,start,{offset},end,{offset + length},,:{os.path.abspath(reader.path)}"
+
+
+def _list(path: Path, want_dirs: bool, pattern: str = "*") -> List[Path]:
+    path = Path(path)
+    names = set()
+    if path.is_dir():
+        for entry in os.scandir(path):
+            if entry.name.endswith(PACK_SUFFIX) and entry.is_file():
+                if want_dirs:
+                    names.add(entry.name[:-len(PACK_SUFFIX)])
+            elif entry.is_dir() == want_dirs:
+                names.add(entry.name)
+    for reader, prefix in _enclosing_packs(path):
+        for name in reader.entries:
+            if not name.startswith(prefix):
+                continue
+            rest = name[len(prefix):]
+            if ("/" in rest) == want_dirs:
+                names.add(rest.split("/", 1)[0])
+    return [path / name for name in sorted(names) if fnmatch(name, pattern)]
+
+
+def list_dirs(path: Path) -> List[Path]:
+    """列出子目录，已归档的日期（<日期>.zpk）和包内的时间目录也视为目录"""
+    return _list(path, want_dirs=True)
+
+
+def list_files(path: Path, pattern: str = "*") -> List[Path]:
+    """列出目录下匹配 pattern 的文件（磁盘文件与包内条目的并集），不含日包本身"""
+    return _list(path, want_dirs=False, pattern=pattern)
+
+
+def _day_files(day_dir: Path) -> List[Tuple[str, Path]]:
+    files = []
+    for root, _, names in os.walk(day_dir):
+        for name in names:
+            if ".tmp" in name or name.endswith(".lock"):
+                continue
+            file_path = Path(root) / name
+            files.append((file_path.relative_to(day_dir).as_posix(), file_path))
+    return sorted(files)
+
+
+def pack_day(day_dir: Path, logger=logging) -> Tuple[int, int, int]:
+    """
+    把一天的目录写成同级的 <日期>.zpk，校验后删除原目录；已有日包时合并（新文件覆盖同名条目）。
+    返回 (文件数, 原始字节数, 包字节数)
+    """
+    day_dir = Path(day_dir)
+    pack_path = _pack_path(day_dir)
+    temp_path = pack_path.with_name(pack_path.name + ".tmp")
+    files = _day_files(day_dir)
+    previous = open_pack(pack_path) if pack_path.exists() else None
+
+    entries: Dict[str, list] = {}
+    original = 0
+    with open(temp_path, "wb") as out:
+        out.write(PACK_MAGIC)
+        new_names = {name for name, _ in files}
+        if previous is not None:
+            # 旧条目按存储字节原样复制，共享偏移的条目仍然共享
+            copied: Dict[int, list] = {}
+            for name, entry in previous.entries.items():
+                if name in new_names:
+                    continue
+                if entry[0] not in copied:
+                    copied[entry[0]] = [out.tell(), *entry[1:]]
+                    out.write(previous.read_blob(name))
+                entries[name] = copied[entry[0]]
+        # 硬链接的重复帧（blend 阶段的引用帧）只存一份
+        by_inode: Dict[Tuple[int, int], list] = {}
+        for name, file_path in files:
+            st = file_path.stat()
+            key = (st.st_dev, st.st_ino)
+            if key not in by_inode:
+                data = file_path.read_bytes()
+                blob, method = _encode(data, file_path.suffix)
+                by_inode[key] = [out.tell(), len(blob), len(data), method, zlib.crc32(data)]
+                out.write(blob)
+                original += len(data)
+            entries[name] = by_inode[key]
+        index = zlib.compress(json.dumps({"version": PACK_VERSION, "entries": entries}).encode())
+        index_offset = out.tell()
+        out.write(index)
+        out.write(_FOOTER.pack(index_offset, len(index), INDEX_MAGIC))
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(temp_path, pack_path)
+
+    # 删除原目录前逐条读回校验
+    reader = open_pack(pack_path)
+    for name in new_names:
+        reader.read(name)
+    shutil.rmtree(day_dir)
+    packed = pack_path.stat().st_size
+    logger.info(f"已归档 {day_dir}: {len(files)} 个文件，{original / 1024 ** 2:.1f} MB -> {packed / 1024 ** 2:.1f} MB")
+    return len(files), original, packed
+
+
+def find_archivable_days(stage: str, older_than: float, base_dir: str = ".", now: Optional[float] = None) -> List[Path]:
+    """返回整天都早于 now - older_than 的日期目录"""
+    root = Path(base_dir) / stage
+    if not root.is_dir():
+        return []
+    cutoff = (now if now is not None else time.time()) - older_than
+    days = []
+    for day_dir in root.glob("*/" * (ARCHIVE_STAGES[stage] - 1) + "????-??-??"):
+        try:
+            day = datetime.strptime(day_dir.name, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        if day_dir.is_dir() and (day + timedelta(days=1)).timestamp() <= cutoff:
+            days.append(day_dir)
+    return sorted(days)
+
+
+def archive_frames(
+    logger,
+    older_than: float,
+    stages: Optional[List[str]] = None,
+    dry_run: bool = False,
+    workers: int = 4,
+    base_dir: str = ".",
+) -> Dict[str, Dict[str, int]]:
+    """
+    把早于 older_than 秒的整天数据写成日包。返回每个阶段的
+    {"days", "files", "bytes", "packed"}（dry_run 时 packed 为 0）
+    """
+    base = Path(base_dir)
+    report: Dict[str, Dict[str, int]] = {}
+    with stage_lock("archive", "all", blocking=False, lock_root=str(base / ".zec_locks")) as acquired:
+        if not acquired:
+            logger.warning("另一个 zec archive 正在运行，本次跳过")
+            return report
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for stage in stages or list(ARCHIVE_STAGES):
+                days = find_archivable_days(stage, older_than, base_dir)
+                row = {"days": len(days), "files": 0, "bytes": 0, "packed": 0}
+                if dry_run:
+                    for day_dir in days:
+                        files = _day_files(day_dir)
+                        row["files"] += len(files)
+                        row["bytes"] += sum(path.stat().st_size for _, path in files)
+                else:
+                    for files, original, packed in pool.map(lambda d: pack_day(d, logger), days):
+                        row["files"] += files
+                        row["bytes"] += original
+                        row["packed"] += packed
+                    metrics.inc("archive_days_total", len(days), stage=stage)
+                    metrics.inc("archive_files_total", row["files"], stage=stage)
+                    metrics.inc("archive_bytes_total", row["bytes"], stage=stage, kind="original")
+                    metrics.inc("archive_bytes_total", row["packed"], stage=stage, kind="packed")
+                report[stage] = row
+                logger.info(f"[{stage}] 可归档 {len(days)} 天，{row['files']} 个文件")
+    return report
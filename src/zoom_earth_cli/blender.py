@@ -1,32 +1,112 @@
-from typing import Dict
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, List, Optional, Tuple
 from pathlib import Path
 from datetime import datetime, timezone
-from PIL import Image, ImageChops
 
-def process_blend_core(
-    mosaics_dir: str,
-    output_base_dir: str,
-    hours: int,
-    canvas_width: int,
-    canvas_height: int,
-    satellite_offsets: Dict[str, int],
+import numpy as np
+from PIL import Image
+
+from zoom_earth_cli import archive
+from zoom_earth_cli.blockwise import blend_blockwise
+from zoom_earth_cli.ffmpeg import encode_frame_stream
+from zoom_earth_cli.compositor import BLEND_MODES, compose_frame
+from zoom_earth_cli.locking import ClaimSet, blend_claim_key, blend_claim_region
+from zoom_earth_cli.metrics import metrics
+from zoom_earth_cli.timeline import FrameSchedule, TimelineIndex
+
+
+def select_blend_sources(
+    sources: Dict[str, Optional[int]],
+    all_files_info: Dict[str, Dict[int, Path]],
+    relevant_satellites: List[str],
     logger,
-    zoom_level: int = 4,
-    overwrite: bool = False,
-):
-    mosaics_base_path = Path(mosaics_dir)
-    output_base_dir = Path(output_base_dir)
+) -> Dict[str, Path]:
+    """
+    根据帧调度结果选出参与混合的图像。
+    mtg-zero 与 msg-zero 覆盖相同区域，取两者中较新的一张放在 mtg-zero 的位置。
+    """
+    images_to_use_for_ts: Dict[str, Path] = {}
+    timestamps_used: Dict[str, int] = {}
+
+    for sat_id, latest_available_ts in sources.items():
+        if latest_available_ts is not None:
+            image_path = all_files_info[sat_id][latest_available_ts]
+            images_to_use_for_ts[sat_id] = image_path
+            timestamps_used[sat_id] = latest_available_ts
+            logger.debug(f"  卫星 {sat_id}: 使用时间戳 {latest_available_ts} 的图像 ({image_path.name})")
+        else:
+            logger.debug(f"  卫星 {sat_id}: 无可用图像")
+
+    mtg_path = images_to_use_for_ts.get('mtg-zero')
+    msg_path = images_to_use_for_ts.get('msg-zero')
+    mtg_ts = timestamps_used.get('mtg-zero')
+    msg_ts = timestamps_used.get('msg-zero')
+
+    final_images_to_blend: Dict[str, Path] = {}
+    if 'mtg-zero' in relevant_satellites:
+        if mtg_path and msg_path:
+            if mtg_ts >= msg_ts:
+                final_images_to_blend['mtg-zero'] = mtg_path
+            else:
+                final_images_to_blend['mtg-zero'] = msg_path
+        elif mtg_path:
+            final_images_to_blend['mtg-zero'] = mtg_path
+        elif msg_path:
+            final_images_to_blend['mtg-zero'] = msg_path
+
+    for sat_id in relevant_satellites:
+        if sat_id != 'mtg-zero' and sat_id in images_to_use_for_ts:
+            final_images_to_blend[sat_id] = images_to_use_for_ts[sat_id]
+
+    return final_images_to_blend
+
+
+def link_frame(source: Path, target: Path) -> None:
+    """让 target 指向与 source 相同的内容：优先硬链接，文件系统不支持时退回复制"""
+    if target.exists():
+        target.unlink()
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
 
+
+# 拼接图格式：PNG，或分块拼接生成的 npy（可内存映射）
+MOSAIC_SUFFIXES = (".png", ".npy")
+
+
+def build_blend_schedule(
+    mosaics_base_path: Path,
+    hours: int,
+    zoom_level: int,
+    logger,
+) -> Optional[Tuple[Dict[str, Dict[int, Path]], FrameSchedule]]:
+    """
+    扫描拼接图目录，返回 (卫星 -> {时间戳: 路径}, 帧调度表)；没有可处理的数据时返回 None
+    """
     # 1. 收集所有文件信息
     all_files_info: Dict[str, Dict[int, Path]] = {}
     logger.info(f"正在扫描 {mosaics_base_path} 下 zoom={zoom_level} 的图像...")
-    for file_path in mosaics_base_path.glob(f"*/{zoom_level}/*/*.png"):
+    # 已归档的日期从日包索引中列出，不解包
+    mosaic_files = [
+        file_path
+        for zoom_dir in mosaics_base_path.glob(f"*/{zoom_level}")
+        for date_dir in archive.list_dirs(zoom_dir)
+        for file_path in archive.list_files(date_dir)
+    ]
+    for file_path in mosaic_files:
+        if file_path.suffix not in MOSAIC_SUFFIXES:
+            continue
         try:
             relative_parts = file_path.relative_to(mosaics_base_path).parts
             if len(relative_parts) == 4 and relative_parts[1] == str(zoom_level):
                 satellite_id = relative_parts[0]
                 date_str = relative_parts[2]
-                time_str = relative_parts[3].replace(".png", "")
+                time_str = file_path.stem
 
                 datetime_str = f"{date_str} {time_str}"
                 dt_obj = datetime.strptime(datetime_str, "%Y-%m-%d %H%M")
@@ -43,7 +123,7 @@ def process_blend_core(
 
     if not all_files_info:
         logger.error(f"在 {mosaics_base_path} (zoom={zoom_level}) 中没有找到任何有效的图像信息。")
-        return 0, 0
+        return None
 
     # 2. 合并所有时间戳
     all_timestamps = set()
@@ -51,7 +131,7 @@ def process_blend_core(
         all_timestamps.update(sat_timestamps.keys())
     if not all_timestamps:
         logger.error("未能从收集到的文件中提取任何有效时间戳。")
-        return 0, 0
+        return None
 
     now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
     filtered_timestamps = [
@@ -60,109 +140,504 @@ def process_blend_core(
     ]
     if not filtered_timestamps:
         logger.error(f"在指定的 {hours} 小时时间范围内没有找到任何有效时间戳。")
-        return 0, 0
+        return None
 
-    sorted_unique_timestamps = sorted(filtered_timestamps, reverse=True)
-    logger.info(f"共找到 {len(sorted_unique_timestamps)} 个唯一时间戳，将从最新开始处理。")
+    # 用时间轴索引一次性算出每个目标时间戳下各卫星使用的源图像
+    timeline = TimelineIndex({sat_id: files.keys() for sat_id, files in all_files_info.items()})
+    return all_files_info, timeline.schedule(filtered_timestamps)
+
+
+def process_blend_core(
+    mosaics_dir: str,
+    output_base_dir: str,
+    hours: int,
+    canvas_width: int,
+    canvas_height: int,
+    satellite_offsets: Dict[str, int],
+    logger,
+    zoom_level: int = 4,
+    overwrite: bool = False,
+    workers: int = 1,
+    mode: str = "lighter",
+    block_rows: Optional[int] = None,
+    tile_size: int = 256,
+):
+    """
+    block_rows: 指定后按该行数的条带分块合成并流式写出 PNG，峰值内存与画布大小无关（用于 zoom 6+）
+    tile_size: 拼接图中每个瓦片的像素尺寸（预览树为 256 / 缩放倍数），用于换算卫星偏移
+    """
+    if mode not in BLEND_MODES:
+        raise ValueError(f"不支持的混合模式: {mode}，可选: {BLEND_MODES}")
+
+    mosaics_base_path = Path(mosaics_dir)
+    output_base_dir = Path(output_base_dir)
+
+    built = build_blend_schedule(mosaics_base_path, hours, zoom_level, logger)
+    if built is None:
+        return 0, 0
+    all_files_info, schedule = built
+    logger.info(f"共找到 {len(schedule)} 个唯一时间戳，将从最新开始处理。")
 
     # 3. 相关卫星列表与偏移处理
-    tile_width = 256
+    tile_width = tile_size
     relevant_satellites = list(satellite_offsets.keys())
-    all_possible_satellites = relevant_satellites + ['msg-zero']
 
     total_images_generated = 0
     total_images_skipped = 0
+    total_images_linked = 0
+
+    # 4. 规划：确定每个时间戳是跳过、引用已有输出还是需要重新混合
+    # 源图像组合 -> 已存在/将生成的输出路径，用于识别无变化的重复帧
+    rendered_outputs: Dict[Tuple[Tuple[str, str], ...], Path] = {}
+    pending_links: Dict[Path, List[Path]] = {}
+    render_jobs: List[Tuple[int, Path, List[Tuple[str, Path, int]]]] = []
 
-    for target_ts in sorted_unique_timestamps:
+    for target_ts, sources in schedule.rows(reverse=True):
         target_dt = datetime.fromtimestamp(target_ts, tz=timezone.utc)
-        target_date_str = target_dt.strftime("%Y-%m-%d")
-        target_time_str = target_dt.strftime("%H%M")
+        output_path = output_base_dir / str(zoom_level) / target_dt.strftime("%Y-%m-%d") / f"{target_dt.strftime('%H%M')}.png"
 
-        output_dir_for_ts = output_base_dir / str(zoom_level) / target_date_str
-        output_path = output_dir_for_ts / f"{target_time_str}.png"
+        final_images_to_blend = select_blend_sources(sources, all_files_info, relevant_satellites, logger)
+        source_key = tuple(sorted((sat_id, str(path)) for sat_id, path in final_images_to_blend.items()))
 
-        if not overwrite and output_path.exists():
+        if not overwrite and archive.exists(output_path):
             logger.debug(f"图像已存在，跳过: {output_path}")
+            # 已归档的输出不能作为硬链接源
+            if output_path.exists():
+                rendered_outputs.setdefault(source_key, output_path)
             total_images_skipped += 1
             continue
 
-        logger.info(f"--- 开始为时间戳 {target_ts} ({target_dt.isoformat()}) 生成混合图像 ---")
-
-        images_to_use_for_ts: Dict[str, Path] = {}
-        timestamps_used: Dict[str, int] = {}
-
-        for sat_id in all_files_info.keys():
-            available_ts_for_sat = sorted([ts for ts in all_files_info[sat_id].keys() if ts <= target_ts], reverse=True)
-            if available_ts_for_sat:
-                latest_available_ts = available_ts_for_sat[0]
-                image_path = all_files_info[sat_id][latest_available_ts]
-                images_to_use_for_ts[sat_id] = image_path
-                timestamps_used[sat_id] = latest_available_ts
-                logger.debug(f"  卫星 {sat_id}: 使用时间戳 {latest_available_ts} 的图像 ({image_path.name})")
-            else:
-                logger.debug(f"  卫星 {sat_id}: 在 {target_ts} 或之前无可用图像")
-
-        mtg_path = images_to_use_for_ts.get('mtg-zero')
-        msg_path = images_to_use_for_ts.get('msg-zero')
-        mtg_ts = timestamps_used.get('mtg-zero')
-        msg_ts = timestamps_used.get('msg-zero')
-
-        final_images_to_blend: Dict[str, Path] = {}
-        if mtg_path and msg_path:
-            if mtg_ts >= msg_ts:
-                final_images_to_blend['mtg-zero'] = mtg_path
-            else:
-                final_images_to_blend['mtg-zero'] = msg_path
-        elif mtg_path:
-            final_images_to_blend['mtg-zero'] = mtg_path
-        elif msg_path:
-            final_images_to_blend['mtg-zero'] = msg_path
-
-        for sat_id in relevant_satellites:
-            if sat_id != 'mtg-zero' and sat_id in images_to_use_for_ts:
-                final_images_to_blend[sat_id] = images_to_use_for_ts[sat_id]
-
         if not final_images_to_blend:
             logger.warning(f"时间戳 {target_ts}: 没有找到任何可用的卫星图像进行混合。")
             continue
 
-        current_canvas = Image.new("RGBA", (canvas_width, canvas_height), (0, 0, 0, 0))
-        processed_count_for_ts = 0
+        # 没有任何卫星发布新图像：引用之前的输出，不再重新混合和编码
+        previous_output = rendered_outputs.get(source_key)
+        if previous_output is not None:
+            pending_links.setdefault(previous_output, []).append(output_path)
+            continue
 
+        layers: List[Tuple[str, Path, int]] = []
         for satellite_id, image_path in final_images_to_blend.items():
             # 偏移量统一用 tile 数量 * tile_width
             offset_tiles = satellite_offsets.get(satellite_id)
             if offset_tiles is None:
                 logger.warning(f"  内部错误: 卫星 {satellite_id} 缺少偏移量定义。")
                 continue
-            offset_x = offset_tiles * tile_width
+            if not archive.exists(image_path):
+                logger.warning(f"    -> 文件未找到（预期存在）: {image_path}")
+                continue
+            layers.append((satellite_id, image_path, offset_tiles * tile_width))
+
+        if not layers:
+            logger.warning(f"时间戳 {target_ts}: 处理了0个图像，未保存。")
+            continue
 
-            if image_path.exists():
+        rendered_outputs[source_key] = output_path
+        render_jobs.append((target_ts, output_path, layers))
+
+    def _resolve_links(rendered_path: Path) -> int:
+        linked = 0
+        for link_path in pending_links.pop(rendered_path, []):
+            try:
+                link_path.parent.mkdir(parents=True, exist_ok=True)
+                link_frame(rendered_path, link_path)
+                logger.info(f"  -> 源图像未变化，引用 {rendered_path.name}: {link_path}")
+                linked += 1
+            except OSError as e:
+                logger.error(f"  -> 引用重复帧失败 {link_path}: {e}")
+        return linked
+
+    # 已存在的输出可以立即被引用
+    for existing_path in [path for path in pending_links if path.exists()]:
+        total_images_linked += _resolve_links(existing_path)
+
+    # 按输出帧认领：并发运行的其他混合进程已认领的帧不再重复生成
+    claims = ClaimSet("blend", blend_claim_region(output_base_dir, zoom_level), logger=logger)
+    with claims:
+        claimed = set(claims.claim_all(blend_claim_key(output_path) for _, output_path, _ in render_jobs))
+        if len(claimed) < len(render_jobs):
+            logger.info(f"{len(render_jobs) - len(claimed)} 个时间戳正由其他进程混合，已跳过")
+        render_jobs = [job for job in render_jobs if blend_claim_key(job[1]) in claimed]
+
+        # 5. 执行混合（单进程或进程池）
+        stage_started = time.perf_counter()
+        if block_rows:
+            blend_results = _run_blockwise_blend(render_jobs, canvas_width, canvas_height, mode, workers, block_rows, logger)
+        elif workers > 1 and len(render_jobs) > 1:
+            blend_results = _run_parallel_blend(render_jobs, canvas_width, canvas_height, mode, workers, logger)
+        else:
+            blend_results = _run_serial_blend(render_jobs, canvas_width, canvas_height, mode, logger)
+
+        for output_path, processed_count in blend_results:
+            if processed_count > 0:
+                total_images_generated += 1
+                total_images_linked += _resolve_links(output_path)
+        if render_jobs:
+            metrics.observe("blend_stage_seconds", time.perf_counter() - stage_started, mode=mode)
+
+    # 剩余引用的源帧由其他进程认领（或混合失败）：已写完的立即引用，其余留到下次运行时补齐
+    for rendered_path in [path for path in pending_links if path.exists()]:
+        total_images_linked += _resolve_links(rendered_path)
+    skipped_links = sum(len(link_paths) for link_paths in pending_links.values())
+    if skipped_links:
+        logger.warning(f"{skipped_links} 个重复帧的源帧尚未生成（由其他进程混合或混合失败），本次未创建引用")
+        metrics.inc("blend_frames_total", skipped_links, result="link_deferred")
+
+    metrics.inc("blend_frames_total", total_images_generated, result="rendered")
+    metrics.inc("blend_frames_total", total_images_linked, result="linked")
+    metrics.inc("blend_frames_total", total_images_skipped, result="skipped")
+    total_images_generated += total_images_linked
+    logger.info(
+        f"处理完成。共生成 {total_images_generated} 个混合图像（其中 {total_images_linked} 个为重复帧引用），"
+        f"跳过 {total_images_skipped} 个已存在的图像。"
+    )
+    return total_images_generated, total_images_skipped
+
+
+def load_mosaic_array(image_path: Path) -> np.ndarray:
+    """解码拼接图为 RGB/RGBA 数组（已归档的拼接图从日包中读取）"""
+    with archive.open_frame(image_path) as fp:
+        if image_path.suffix == ".npy":
+            return np.load(fp)
+        with Image.open(fp) as mosaic_img:
+            if mosaic_img.mode not in ("RGB", "RGBA"):
+                mosaic_img = mosaic_img.convert("RGBA")
+            return np.asarray(mosaic_img)
+
+
+def _save_canvas(canvas: np.ndarray, output_path: Path) -> None:
+    # 先写临时文件再替换：输出可能与其他重复帧共享硬链接，不能原地覆盖
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output_path.with_name(output_path.name + ".tmp")
+    with metrics.timer("save_seconds", stage="blend"):
+        Image.fromarray(canvas, "RGBA").save(temp_path, format="PNG")
+    os.replace(temp_path, output_path)
+
+
+def _run_serial_blend(render_jobs, canvas_width: int, canvas_height: int, mode: str, logger):
+    """单进程混合；PNG 编码放到后台线程，与下一帧的合成重叠执行"""
+    results: List[Tuple[Path, int]] = []
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        pending_save = None
+        for target_ts, output_path, layers in render_jobs:
+            logger.info(f"--- 开始为时间戳 {target_ts} 生成混合图像 ---")
+            loaded_layers = []
+            for satellite_id, image_path, offset_x in layers:
                 try:
-                    with Image.open(image_path) as mosaic_img:
-                        mosaic_img = mosaic_img.convert("RGBA")
-                        # temp_canvas 画布为全局画布大小
-                        temp_canvas = Image.new("RGBA", (canvas_width, canvas_height), (0, 0, 0, 0))
-                        temp_canvas.paste(mosaic_img, (offset_x, 0), mosaic_img)
-                        # lighter 混合
-                        current_canvas = ImageChops.lighter(current_canvas, temp_canvas)
-                        processed_count_for_ts += 1
-                        logger.debug(f"    -> 已混合 {satellite_id} 从 {image_path.name}")
+                    with metrics.timer("decode_seconds", stage="blend"):
+                        loaded_layers.append((satellite_id, load_mosaic_array(image_path), offset_x))
+                    logger.debug(f"    -> 已混合 {satellite_id} 从 {image_path.name}")
                 except Exception as e:
                     logger.error(f"    -> 打开或混合图像失败 {image_path}: {e}")
+            processed_count = len(loaded_layers)
+            with metrics.timer("blend_seconds", mode=mode):
+                canvas = compose_frame(loaded_layers, canvas_width, canvas_height, mode)
+
+            if pending_save is not None:
+                results.append(_finish_save(*pending_save, logger))
+                pending_save = None
+            if processed_count > 0:
+                pending_save = (writer.submit(_save_canvas, canvas, output_path), output_path, processed_count)
             else:
-                logger.warning(f"    -> 文件未找到（预期存在）: {image_path}")
+                logger.warning(f"时间戳 {target_ts}: 处理了0个图像，未保存。")
+
+        if pending_save is not None:
+            results.append(_finish_save(*pending_save, logger))
+    return results
+
+
+def _finish_save(future, output_path: Path, processed_count: int, logger) -> Tuple[Path, int]:
+    try:
+        future.result()
+        logger.info(f"  -> 成功生成并保存: {output_path} (混合了 {processed_count} 个图像)")
+        return output_path, processed_count
+    except Exception as e:
+        logger.error(f"  -> 保存混合图像失败 {output_path}: {e}")
+        return output_path, 0
+
+
+def _blend_worker(output_path: str, canvas_width: int, canvas_height: int, layers, mode: str) -> Tuple[str, int]:
+    """进程池工作函数：从共享内存读取源图像，合成并编码保存 PNG"""
+    segments = [shared_memory.SharedMemory(name=shm_name) for _, shm_name, _, _ in layers]
+    try:
+        loaded_layers = [
+            (satellite_id, np.ndarray(shape, dtype=np.uint8, buffer=shm.buf), offset_x)
+            for (satellite_id, _, shape, offset_x), shm in zip(layers, segments)
+        ]
+        canvas = compose_frame(loaded_layers, canvas_width, canvas_height, mode)
+        del loaded_layers
+    finally:
+        for shm in segments:
+            shm.close()
+    _save_canvas(canvas, Path(output_path))
+    return output_path, len(layers)
+
+
+def _run_parallel_blend(render_jobs, canvas_width: int, canvas_height: int, mode: str, workers: int, logger):
+    """
+    多进程混合：源图像在主进程解码一次后放入共享内存，按引用计数释放；
+    各时间戳的合成与 PNG 编码分发到进程池并行执行。
+    """
+    # 每个源图像被多少个待处理任务使用
+    remaining_uses: Dict[Path, int] = {}
+    for _, _, layers in render_jobs:
+        for _, image_path, _ in layers:
+            remaining_uses[image_path] = remaining_uses.get(image_path, 0) + 1
+
+    segments: Dict[Path, Tuple[shared_memory.SharedMemory, Tuple[int, ...]]] = {}
+    # 已提交、尚未取回结果的解码任务；解码失败的源图像不再重试
+    decoding: Dict[Path, Future] = {}
+    failed = set()
+
+    def _load_into_shm(image_path: Path):
+        arr = load_mosaic_array(image_path)
+        shm = shared_memory.SharedMemory(create=True, size=arr.nbytes)
+        np.ndarray(arr.shape, dtype=np.uint8, buffer=shm.buf)[...] = arr
+        return shm, arr.shape
+
+    def _release(layers) -> None:
+        for _, image_path, _ in layers:
+            remaining_uses[image_path] -= 1
+            if remaining_uses[image_path] == 0 and image_path in segments:
+                shm, _ = segments.pop(image_path)
+                shm.close()
+                shm.unlink()
+
+    results: List[Tuple[Path, int]] = []
+    max_in_flight = workers * 2
+    logger.info(f"使用 {workers} 个进程并行混合 {len(render_jobs)} 个时间戳")
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as decoder, ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = {}
+
+            def _collect(done_futures) -> None:
+                for future in done_futures:
+                    target_ts, output_path, layers = in_flight.pop(future)
+                    try:
+                        _, processed_count = future.result()
+                        logger.info(f"  -> 成功生成并保存: {output_path} (混合了 {processed_count} 个图像)")
+                        results.append((output_path, processed_count))
+                    except Exception as e:
+                        logger.error(f"  -> 时间戳 {target_ts} 混合失败 {output_path}: {e}")
+                        results.append((output_path, 0))
+                    _release(layers)
+
+            def _prefetch(start: int) -> None:
+                # 提前提交后续 max_in_flight 个任务的解码，主线程等待当前任务时解码线程已在处理后面的源图像
+                for _, _, ahead_layers in render_jobs[start:start + max_in_flight]:
+                    for _, image_path, _ in ahead_layers:
+                        if image_path not in segments and image_path not in decoding and image_path not in failed:
+                            decoding[image_path] = decoder.submit(_load_into_shm, image_path)
+
+            for index, (target_ts, output_path, layers) in enumerate(render_jobs):
+                _prefetch(index)
+                for _, image_path, _ in layers:
+                    future = decoding.pop(image_path, None)
+                    if future is None:
+                        continue
+                    try:
+                        segments[image_path] = future.result()
+                    except Exception as e:
+                        failed.add(image_path)
+                        logger.error(f"    -> 打开或混合图像失败 {image_path}: {e}")
+                valid_layers = [layer for layer in layers if layer[1] in segments]
+                if not valid_layers:
+                    logger.warning(f"时间戳 {target_ts}: 处理了0个图像，未保存。")
+                    _release(layers)
+                    continue
+
+                worker_layers = [
+                    (satellite_id, segments[image_path][0].name, segments[image_path][1], offset_x)
+                    for satellite_id, image_path, offset_x in valid_layers
+                ]
+                future = pool.submit(_blend_worker, str(output_path), canvas_width, canvas_height, worker_layers, mode)
+                in_flight[future] = (target_ts, output_path, layers)
+
+                # 控制同时在途的任务数，限制共享内存占用
+                if len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    _collect(done)
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                _collect(done)
+    finally:
+        # 出错中止时，已提前解码但尚未使用的源图像也要释放共享内存（退出 with 时解码线程已全部结束）
+        leftovers = list(segments.values())
+        leftovers += [future.result() for future in decoding.values() if future.exception() is None]
+        for shm, _ in leftovers:
+            shm.close()
+            shm.unlink()
+
+    return results
+
+
+def _run_blockwise_blend(render_jobs, canvas_width: int, canvas_height: int, mode: str, workers: int, block_rows: int, logger):
+    """分块混合：每个时间戳按条带合成，多个时间戳可分发到进程池并行"""
+    results: List[Tuple[Path, int]] = []
+    logger.info(f"分块混合 {len(render_jobs)} 个时间戳（条带 {block_rows} 行，{workers} 个进程）")
+
+    def _record(target_ts, output_path, run) -> None:
+        try:
+            processed_count = run()
+            logger.info(f"  -> 成功生成并保存: {output_path} (混合了 {processed_count} 个图像)")
+            results.append((output_path, processed_count))
+        except Exception as e:
+            logger.error(f"  -> 时间戳 {target_ts} 混合失败 {output_path}: {e}")
+            results.append((output_path, 0))
+
+    if workers <= 1 or len(render_jobs) <= 1:
+        for target_ts, output_path, layers in render_jobs:
+            _record(target_ts, output_path, lambda: blend_blockwise(
+                layers, output_path, canvas_width, canvas_height, mode, block_rows))
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            (target_ts, output_path, pool.submit(blend_blockwise, layers, output_path, canvas_width, canvas_height, mode, block_rows))
+            for target_ts, output_path, layers in render_jobs
+        ]
+        for target_ts, output_path, future in futures:
+            _record(target_ts, output_path, future.result)
+    return results
+
+
+def iter_blend_frames(
+    mosaics_dir: str,
+    hours: int,
+    canvas_width: int,
+    canvas_height: int,
+    satellite_offsets: Dict[str, int],
+    logger,
+    zoom_level: int = 4,
+    mode: str = "lighter",
+    tile_size: int = 256,
+    built: Optional[Tuple[Dict[str, Dict[int, Path]], FrameSchedule]] = None,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    按时间升序逐帧产出 (时间戳, RGBA 画布)，不经过磁盘。
+    源图像组合未变化的帧直接复用上一帧画布；未更新的卫星图像不会重复解码。
+    built: 已构建的 build_blend_schedule 结果，省略时扫描 mosaics_dir
+    """
+    if mode not in BLEND_MODES:
+        raise ValueError(f"不支持的混合模式: {mode}，可选: {BLEND_MODES}")
+
+    if built is None:
+        built = build_blend_schedule(Path(mosaics_dir), hours, zoom_level, logger)
+    if built is None:
+        return
+    all_files_info, schedule = built
+
+    tile_width = tile_size
+    relevant_satellites = list(satellite_offsets.keys())
+    decoded: Dict[Path, np.ndarray] = {}
+    last_key = None
+    last_canvas = None
+
+    for target_ts, sources in schedule.rows():
+        final_images_to_blend = select_blend_sources(sources, all_files_info, relevant_satellites, logger)
+        if not final_images_to_blend:
+            logger.warning(f"时间戳 {target_ts}: 没有找到任何可用的卫星图像进行混合。")
+            continue
+
+        source_key = tuple(sorted((sat_id, str(path)) for sat_id, path in final_images_to_blend.items()))
+        if source_key != last_key:
+            layers = []
+            current: Dict[Path, np.ndarray] = {}
+            for satellite_id, image_path in final_images_to_blend.items():
+                offset_tiles = satellite_offsets.get(satellite_id)
+                if offset_tiles is None:
+                    continue
+                try:
+                    mosaic = decoded.get(image_path)
+                    if mosaic is None:
+                        mosaic = load_mosaic_array(image_path)
+                    current[image_path] = mosaic
+                    layers.append((satellite_id, mosaic, offset_tiles * tile_width))
+                except Exception as e:
+                    logger.error(f"    -> 打开或混合图像失败 {image_path}: {e}")
+            decoded = current
+            last_key = source_key
+            last_canvas = compose_frame(layers, canvas_width, canvas_height, mode)
+        yield target_ts, last_canvas
+
+
+def process_blend_stream(
+    mosaics_dir: str,
+    output_file: str,
+    hours: int,
+    canvas_width: int,
+    canvas_height: int,
+    satellite_offsets: Dict[str, int],
+    logger,
+    zoom_level: int = 4,
+    mode: str = "lighter",
+    framerate: int = 30,
+    tee_dir: Optional[str] = None,
+    tile_size: int = 256,
+) -> int:
+    """
+    混合 → 编码 融合模式：合成结果以原始 RGB 帧直接写入 ffmpeg 标准输入，
+    不生成中间 PNG。指定 tee_dir 时同时把每帧保存到磁盘（后台线程编码 PNG）。
+    返回写入的帧数。
+    """
+    built = build_blend_schedule(Path(mosaics_dir), hours, zoom_level, logger)
+    if built is None:
+        return 0
+    # 调度表长度即输出帧数（缺少源图像的时间戳会被跳过，仅影响进度条的最后一段）
+    total_frames = len(built[1])
+    frames = iter_blend_frames(
+        mosaics_dir=mosaics_dir,
+        hours=hours,
+        canvas_width=canvas_width,
+        canvas_height=canvas_height,
+        satellite_offsets=satellite_offsets,
+        logger=logger,
+        zoom_level=zoom_level,
+        mode=mode,
+        tile_size=tile_size,
+        built=built,
+    )
+    if tee_dir is None:
+        return encode_frame_stream(
+            (canvas for _, canvas in frames), canvas_width, canvas_height, output_file, framerate,
+            total_frames=total_frames, logger=logger
+        )
+
+    tee_base = Path(tee_dir) / str(zoom_level)
+
+    def _tee(writer: ThreadPoolExecutor):
+        last_canvas = None
+        last_future = None
+        for target_ts, canvas in frames:
+            target_dt = datetime.fromtimestamp(target_ts, tz=timezone.utc)
+            output_path = tee_base / target_dt.strftime("%Y-%m-%d") / f"{target_dt.strftime('%H%M')}.png"
+            if canvas is last_canvas and last_future is not None:
+                # 重复帧：等上一帧写完后以硬链接引用
+                last_future = writer.submit(_link_after, last_future, output_path)
+            else:
+                # 保存 PNG 比编码慢：等上一次写出完成再提交，最多一张画布在排队，内存不随窗口长度增长
+                if last_future is not None:
+                    last_future.result()
+                last_future = writer.submit(_save_canvas_returning_path, canvas, output_path)
+            last_canvas = canvas
+            yield canvas
+
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        return encode_frame_stream(
+            _tee(writer), canvas_width, canvas_height, output_file, framerate, total_frames=total_frames, logger=logger
+        )
+
+
+def _save_canvas_returning_path(canvas: np.ndarray, output_path: Path) -> Path:
+    _save_canvas(canvas, output_path)
+    return output_path
 
-        if processed_count_for_ts > 0:
-            try:
-                output_dir_for_ts.mkdir(parents=True, exist_ok=True)
-                current_canvas.save(output_path)
-                logger.info(f"  -> 成功生成并保存: {output_path} (混合了 {processed_count_for_ts} 个图像)")
-                total_images_generated += 1
-            except Exception as e:
-                logger.error(f"  -> 保存混合图像失败 {output_path}: {e}")
-        else:
-            logger.warning(f"时间戳 {target_ts}: 处理了0个图像，未保存。")
 
-    logger.info(f"处理完成。共生成 {total_images_generated} 个混合图像，跳过 {total_images_skipped} 个已存在的图像。")
-    return total_images_generated, total_images_skipped
\ No newline at end of file
+def _link_after(previous, output_path: Path) -> Path:
+    source_path = previous.result()
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    link_frame(source_path, output_path)
+    return output_path
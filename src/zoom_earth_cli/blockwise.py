@@ -0,0 +1,199 @@
+import logging
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from zoom_earth_cli import archive
+from zoom_earth_cli.compositor import compose_frame
+from zoom_earth_cli.utils import validate_coordinates
+
+# 分块处理时每个条带的行数：峰值内存 ≈ 条带行数 × 画布宽度 × 4 × (图层数 + 1)
+DEFAULT_BLOCK_ROWS = 256
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_PNG_COLOR_TYPES = {3: 2, 4: 6}  # 通道数 -> PNG 颜色类型（RGB / RGBA）
+
+
+class PNGStripWriter:
+    """
+    按条带流式写出 PNG：每个条带做 Sub 过滤后送入 zlib，内存中只保留当前条带。
+    先写临时文件，关闭时再替换目标文件。
+    """
+
+    def __init__(self, path: Path, width: int, height: int, channels: int = 4, level: int = 6):
+        if channels not in _PNG_COLOR_TYPES:
+            raise ValueError(f"不支持的通道数: {channels}")
+        self.path = Path(path)
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(level)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._temp_path = self.path.with_name(self.path.name + ".tmp")
+        self._file = open(self._temp_path, "wb")
+        self._file.write(PNG_SIGNATURE)
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, _PNG_COLOR_TYPES[channels], 0, 0, 0))
+
+    def _write_chunk(self, chunk_type: bytes, data: bytes) -> None:
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type)) & 0xFFFFFFFF))
+
+    def write(self, rows: np.ndarray) -> None:
+        """追加若干行像素 (h, width, channels)"""
+        if rows.shape[1:] != (self.width, self.channels):
+            raise ValueError(f"条带尺寸 {rows.shape} 与画布 {(self.width, self.channels)} 不一致")
+        if self.rows_written + rows.shape[0] > self.height:
+            raise ValueError("写入的行数超过图像高度")
+        flat = np.ascontiguousarray(rows, dtype=np.uint8).reshape(rows.shape[0], -1)
+        filtered = np.empty((flat.shape[0], flat.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 1  # Sub 过滤：与左侧同通道像素的差值（uint8 自然回绕）
+        filtered[:, 1:1 + self.channels] = flat[:, :self.channels]
+        np.subtract(flat[:, self.channels:], flat[:, :-self.channels], out=filtered[:, 1 + self.channels:])
+        data = self._compressor.compress(filtered.tobytes())
+        if data:
+            self._write_chunk(b"IDAT", data)
+        self.rows_written += rows.shape[0]
+
+    def close(self) -> None:
+        if self.rows_written != self.height:
+            raise ValueError(f"PNG 只写入了 {self.rows_written}/{self.height} 行")
+        self._write_chunk(b"IDAT", self._compressor.flush())
+        self._write_chunk(b"IEND", b"")
+        self._file.close()
+        os.replace(self._temp_path, self.path)
+
+    def abort(self) -> None:
+        self._file.close()
+        if self._temp_path.exists():
+            self._temp_path.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def open_mosaic(path: Path) -> np.ndarray:
+    """
+    打开拼接图：.npy 以内存映射方式打开，只在访问的条带上产生读取；
+    PNG 无法按行解码，只能整张读入。
+    """
+    path = Path(path)
+    if not path.exists():
+        # 已归档的拼接图从日包中整张读入
+        with archive.open_frame(path) as fp:
+            return np.load(fp) if path.suffix == ".npy" else _decode_png(fp)
+    if path.suffix == ".npy":
+        return np.load(path, mmap_mode="r")
+    logging.debug(f"PNG 拼接图需整张解码，大画布建议使用 npy 格式: {path}")
+    return _decode_png(path)
+
+
+def _decode_png(source) -> np.ndarray:
+    with Image.open(source) as img:
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA")
+        return np.asarray(img)
+
+
+def concat_tiles_blockwise(
+    tile_dir: Path,
+    output_path: Path,
+    tile_size: int = 256,
+    swap_xy: bool = True,
+    extent: Optional[Dict[str, List[int]]] = None,
+    tile_filter: Optional[Callable[[int, int], bool]] = None
+) -> bool:
+    """
+    把瓦片逐个写入内存映射的 .npy 画布（RGB），内存占用只有单个瓦片。
+    参数含义与 utils.concat_tiles 一致；不支持旋转与坐标标注。
+    """
+    output_path = Path(output_path)
+    if archive.exists(output_path):
+        logging.info(f"拼接图已存在，跳过: {output_path}")
+        return False
+
+    coord_map = {}
+    for tile_file in archive.list_files(tile_dir, "x*_y*.jpg"):
+        x, y = validate_coordinates(tile_file.name)
+        if x is None or y is None:
+            continue
+        if tile_filter is not None and not tile_filter(x, y):
+            continue
+        coord_map[(y, x) if swap_xy else (x, y)] = tile_file
+
+    if not coord_map:
+        logging.warning(f"跳过空目录: {tile_dir}")
+        return False
+
+    if extent:
+        file_x = range(extent["x"][0], extent["x"][1] + 1)
+        file_y = range(extent["y"][0], extent["y"][1] + 1)
+        cols, rows = (file_y, file_x) if swap_xy else (file_x, file_y)
+    else:
+        cols = range(min(c for c, _ in coord_map), max(c for c, _ in coord_map) + 1)
+        rows = range(min(r for _, r in coord_map), max(r for _, r in coord_map) + 1)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output_path.with_name(output_path.stem + ".tmp.npy")
+    # 新建的 memmap 文件内容为 0，缺失瓦片保持黑色
+    canvas = np.lib.format.open_memmap(
+        temp_path, mode="w+", dtype=np.uint8, shape=(len(rows) * tile_size, len(cols) * tile_size, 3)
+    )
+    try:
+        for (col, row), path in coord_map.items():
+            if col not in cols or row not in rows:
+                continue
+            try:
+                with archive.open_frame(path) as fp, Image.open(fp) as img:
+                    img.draft("RGB", (tile_size, tile_size))
+                    img = img.convert("RGB")
+                    if img.size != (tile_size, tile_size):
+                        img = img.resize((tile_size, tile_size))
+                    top = (row - rows.start) * tile_size
+                    left = (col - cols.start) * tile_size
+                    canvas[top:top + tile_size, left:left + tile_size] = np.asarray(img)
+            except Exception as e:
+                logging.error(f"处理失败 [{path.name}]: {str(e)}")
+        canvas.flush()
+    finally:
+        del canvas
+    os.replace(temp_path, output_path)
+    logging.info(f"生成拼接图: {output_path}")
+    return True
+
+
+def blend_blockwise(
+    layers: Sequence[Tuple[str, Path, int]],
+    output_path: Path,
+    canvas_width: int,
+    canvas_height: int,
+    mode: str = "lighter",
+    block_rows: int = DEFAULT_BLOCK_ROWS
+) -> int:
+    """
+    按水平条带合成并流式写出 PNG。npy 拼接图通过内存映射只读取当前条带，
+    峰值内存由条带大小决定而不是画布大小。返回参与混合的图层数。
+    """
+    mosaics = [(satellite_id, open_mosaic(path), offset_x) for satellite_id, path, offset_x in layers]
+    with PNGStripWriter(output_path, canvas_width, canvas_height, channels=4) as writer:
+        for top in range(0, canvas_height, block_rows):
+            rows = min(block_rows, canvas_height - top)
+            strip_layers = [
+                (satellite_id, np.asarray(mosaic[top:top + rows]), offset_x)
+                for satellite_id, mosaic, offset_x in mosaics
+            ]
+            writer.write(compose_frame(strip_layers, canvas_width, rows, mode))
+    return len(mosaics)
@@ -0,0 +1,170 @@
+from functools import lru_cache
+from typing import Sequence, Tuple
+
+import numpy as np
+
+BLEND_MODES = ("lighter", "feather", "priority")
+
+# 低于该亮度的像素视为无数据（与 utils.add_feather_alpha 的默认阈值一致）
+BLACK_THRESHOLD = 10
+
+# 一个图层：(卫星名称, 图像数组 HxWx3/4, X 偏移像素)
+Layer = Tuple[str, np.ndarray, int]
+
+
+def composite_lighter(canvas: np.ndarray, mosaic: np.ndarray, offset_x: int) -> None:
+    """
+    将拼接图按 X 偏移以 'lighter' 模式叠加到 RGBA 画布上（原地修改）。
+    等价于 paste 到全透明临时画布后再做 ImageChops.lighter。
+    """
+    height = min(canvas.shape[0], mosaic.shape[0])
+    width = min(canvas.shape[1] - offset_x, mosaic.shape[1])
+    if height <= 0 or width <= 0:
+        return
+    region = canvas[:height, offset_x:offset_x + width]
+    src = mosaic[:height, :width]
+    if src.shape[2] == 3:
+        np.maximum(region[..., :3], src, out=region[..., :3])
+        region[..., 3] = 255
+    else:
+        alpha = src[..., 3:4].astype(np.uint16)
+        weighted = (src.astype(np.uint16) * alpha + 127) // 255
+        np.maximum(region, weighted.astype(np.uint8), out=region)
+
+
+@lru_cache(maxsize=256)
+def feather_profile(canvas_width: int, left: int, right: int, left_ramp: int, right_ramp: int) -> np.ndarray:
+    """
+    单个卫星在画布上的水平权重曲线（0~1）：覆盖范围 [left, right) 内为 1，
+    两侧分别在 left_ramp / right_ramp 像素内线性过渡，覆盖范围外为 0。
+    """
+    profile = np.zeros(canvas_width, dtype=np.float32)
+    if right <= left:
+        return profile
+    x = np.arange(left, right, dtype=np.float32)
+    weight = np.ones(right - left, dtype=np.float32)
+    if left_ramp > 0:
+        weight = np.minimum(weight, (x - left + 1) / (left_ramp + 1))
+    if right_ramp > 0:
+        weight = np.minimum(weight, (right - x) / (right_ramp + 1))
+    profile[left:right] = weight
+    profile.setflags(write=False)
+    return profile
+
+
+@lru_cache(maxsize=64)
+def build_blend_plan(
+    mode: str,
+    footprints: Tuple[Tuple[str, int, int], ...],
+    canvas_width: int,
+    feather_width: int = 150,
+):
+    """
+    为一组卫星布局 (卫星, X偏移, 宽度) 预先计算列方向的合成计划。
+
+    返回 [(起始列, 结束列, 图层序号元组, 归一化权重或None)]：
+    只有一个图层的列段直接拷贝，多图层重叠的列段（羽化接缝）按权重加权平均。
+    同一布局在整个时间序列中只计算一次。
+    """
+    n = len(footprints)
+    spans = [(max(0, off), min(canvas_width, off + width)) for _, off, width in footprints]
+
+    weights = np.zeros((n, canvas_width), dtype=np.float32)
+    if mode == "feather":
+        for i, (left, right) in enumerate(spans):
+            # 只在与其他卫星重叠的一侧羽化，羽化宽度不超过重叠宽度
+            left_overlap = max((min(r, right) - left for j, (l, r) in enumerate(spans) if j != i and l < left < r), default=0)
+            right_overlap = max((right - max(l, left) for j, (l, r) in enumerate(spans) if j != i and l < right < r), default=0)
+            weights[i] = feather_profile(
+                canvas_width, left, right,
+                min(feather_width, max(0, left_overlap)),
+                min(feather_width, max(0, right_overlap)),
+            )
+    elif mode == "priority":
+        # 每列只取覆盖它且离自身覆盖中心最近的卫星
+        x = np.arange(canvas_width, dtype=np.float32) + 0.5
+        distance = np.full((n, canvas_width), np.inf, dtype=np.float32)
+        for i, (left, right) in enumerate(spans):
+            if right > left:
+                center = (left + right) / 2
+                distance[i, left:right] = np.abs(x[left:right] - center)
+        covered = np.isfinite(distance).any(axis=0)
+        owner = np.argmin(distance, axis=0)
+        weights[owner[covered], np.nonzero(covered)[0]] = 1.0
+    else:
+        raise ValueError(f"不支持的混合模式: {mode}，可选: {BLEND_MODES}")
+
+    total = weights.sum(axis=0)
+    active = weights > 0
+
+    plan = []
+    start = 0
+    for col in range(1, canvas_width + 1):
+        if col < canvas_width and np.array_equal(active[:, col], active[:, start]):
+            continue
+        layer_ids = tuple(int(i) for i in np.nonzero(active[:, start])[0])
+        if len(layer_ids) == 1:
+            plan.append((start, col, layer_ids, None))
+        elif layer_ids:
+            normalized = weights[list(layer_ids), start:col] / total[start:col]
+            plan.append((start, col, layer_ids, normalized))
+        start = col
+    return plan
+
+
+def _apply_plan(canvas: np.ndarray, layers: Sequence[Layer], plan) -> None:
+    canvas_height = canvas.shape[0]
+    for start, stop, layer_ids, normalized in plan:
+        if normalized is None:
+            _, mosaic, offset_x = layers[layer_ids[0]]
+            height = min(canvas_height, mosaic.shape[0])
+            src = mosaic[:height, start - offset_x:stop - offset_x]
+            canvas[:height, start:stop, :3] = src[..., :3]
+            canvas[:height, start:stop, 3] = src[..., 3] if src.shape[2] == 4 else 255
+            continue
+
+        # 接缝区：按列权重加权平均，无数据（近黑/透明）像素不参与
+        width = stop - start
+        acc = np.zeros((canvas_height, width, 3), dtype=np.float32)
+        weight_sum = np.zeros((canvas_height, width), dtype=np.float32)
+        covered = np.zeros((canvas_height, width), dtype=bool)
+        for k, layer_id in enumerate(layer_ids):
+            _, mosaic, offset_x = layers[layer_id]
+            height = min(canvas_height, mosaic.shape[0])
+            src = mosaic[:height, start - offset_x:stop - offset_x]
+            rgb = src[..., :3]
+            valid = rgb.max(axis=2) > BLACK_THRESHOLD
+            if src.shape[2] == 4:
+                valid &= src[..., 3] > 0
+            w = normalized[k][None, :] * valid
+            acc[:height] += rgb * w[..., None]
+            weight_sum[:height] += w
+            covered[:height] = True
+        has_data = weight_sum > 0
+        out = np.zeros_like(acc)
+        np.divide(acc, weight_sum[..., None], out=out, where=has_data[..., None])
+        canvas[:, start:stop, :3] = np.rint(out).astype(np.uint8)
+        canvas[:, start:stop, 3] = np.where(covered, 255, 0)
+
+
+def compose_frame(
+    layers: Sequence[Layer],
+    canvas_width: int,
+    canvas_height: int,
+    mode: str = "lighter",
+    feather_width: int = 150,
+) -> np.ndarray:
+    """按指定模式把各卫星图层合成为一张 RGBA 画布"""
+    canvas = np.zeros((canvas_height, canvas_width, 4), dtype=np.uint8)
+    if mode == "lighter":
+        for _, mosaic, offset_x in layers:
+            composite_lighter(canvas, mosaic, offset_x)
+        return canvas
+
+    footprints = tuple(
+        (satellite_id, offset_x, min(mosaic.shape[1], canvas_width - offset_x))
+        for satellite_id, mosaic, offset_x in layers
+    )
+    plan = build_blend_plan(mode, footprints, canvas_width, feather_width)
+    _apply_plan(canvas, layers, plan)
+    return canvas
@@ -1,6 +1,13 @@
+import json
+import time
 from pathlib import Path
 from datetime import datetime, timezone
 from typing import Optional, List
+from zoom_earth_cli import archive
+from zoom_earth_cli.blockwise import concat_tiles_blockwise
+from zoom_earth_cli.locking import ClaimSet, concat_claim_key
+from zoom_earth_cli.metrics import metrics
+from zoom_earth_cli.ownership import build_ownership
 from zoom_earth_cli.utils import concat_tiles
 
 def process_concat_core(
@@ -11,13 +18,23 @@ def process_concat_core(
     show_coords: bool,
     satellites: Optional[List[str]],
     hours: int,
-    logger
+    logger,
+    ownership_margin: Optional[int] = None,
+    output_format: str = "png"
 ):
     """
     卫星图片拼接核心逻辑
+
+    ownership_margin: 指定后按卫星归属表只拼接对最终合成有贡献的瓦片（见 ownership.build_ownership）
+    output_format: png，或 npy（逐瓦片写入内存映射画布，内存占用与画布大小无关，供分块混合使用）
     """
     logger.info("启动卫星图片拼接任务...")
 
+    if output_format not in ("png", "npy"):
+        raise ValueError(f"不支持的输出格式: {output_format}，可选: png, npy")
+    if output_format == "npy" and (rotate or show_coords):
+        logger.warning("npy 分块拼接不支持旋转和坐标标注，已忽略")
+
     base_path = Path(input_dir)
     if not base_path.exists():
         logger.error("输入目录不存在")
@@ -25,6 +42,12 @@ def process_concat_core(
 
     now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
 
+    claims = ClaimSet("concat", Path(output_dir).name, logger=logger)
+    satellite_names = tuple(sorted(
+        d.name for d in base_path.iterdir()
+        if d.is_dir() and (not satellites or d.name in satellites)
+    ))
+
     for satellite in base_path.iterdir():
         if not satellite.is_dir():
             continue
@@ -42,16 +65,20 @@ def process_concat_core(
 
             logger.info(f"处理 zoom 目录: {zoom_dir.name}")
 
-            for date_dir in zoom_dir.iterdir():
-                if not date_dir.is_dir():
-                    logger.debug(f"跳过 {zoom_dir.name} 下的非日期目录项: {date_dir}")
-                    continue
+            # 下载阶段记录的完整范围，保证只下载部分瓦片时画布尺寸不变
+            extent = None
+            extent_file = zoom_dir / "extent.json"
+            if extent_file.exists():
+                extent = json.loads(extent_file.read_text(encoding="utf-8"))
 
-                for time_dir in date_dir.iterdir():
-                    if not time_dir.is_dir():
-                        logger.debug(f"跳过 {date_dir.name} 下的非时间目录项: {time_dir}")
-                        continue
+            tile_filter = None
+            if ownership_margin is not None:
+                ownership = build_ownership(int(zoom_dir.name), satellite_names, ownership_margin)
+                tile_filter = lambda x, y, sat=satellite.name, table=ownership: table.owns(sat, x, y)
 
+            # 已归档的日期（<日期>.zpk）与其中的时间目录一并列出，瓦片从日包中按条目读取
+            for date_dir in archive.list_dirs(zoom_dir):
+                for time_dir in archive.list_dirs(date_dir):
                     if hours > 0:
                         try:
                             dt = datetime.strptime(
@@ -72,15 +99,43 @@ def process_concat_core(
                         / satellite.name
                         / zoom_dir.name
                         / date_dir.name
-                        / f"{time_dir.name}.png"
+                        / f"{time_dir.name}.{output_format}"
                     )
 
-                    concat_tiles(
-                        tile_dir=time_dir,
-                        output_path=output_path,  # type: ignore
-                        tile_size=tile_size,
-                        rotate_deg=rotate,
-                        show_coords=show_coords
-                    )
+                    # 按帧认领，与并发运行的其他拼接进程分摊工作
+                    claim_key = concat_claim_key(satellite.name, zoom_dir.name, date_dir.name, time_dir.name)
+                    existed = archive.exists(output_path)
+                    if not existed and not claims.try_claim(claim_key):
+                        logger.info(f"拼接图正由其他进程生成，跳过: {output_path}")
+                        continue
+
+                    started = time.perf_counter()
+                    try:
+                        if output_format == "npy":
+                            concat_tiles_blockwise(
+                                tile_dir=time_dir,
+                                output_path=output_path,
+                                tile_size=tile_size,
+                                extent=extent,
+                                tile_filter=tile_filter
+                            )
+                        else:
+                            concat_tiles(
+                                tile_dir=time_dir,
+                                output_path=output_path,  # type: ignore
+                                tile_size=tile_size,
+                                rotate_deg=rotate,
+                                show_coords=show_coords,
+                                extent=extent,
+                                tile_filter=tile_filter
+                            )
+                    finally:
+                        claims.release(claim_key)
+
+                    if not existed and archive.exists(output_path):
+                        metrics.observe("concat_seconds", time.perf_counter() - started, satellite=satellite.name)
+                        metrics.inc("concat_mosaics_total", satellite=satellite.name, result="created")
+                    else:
+                        metrics.inc("concat_mosaics_total", satellite=satellite.name, result="skipped")
 
     logger.info("所有拼接任务已完成")
@@ -1,6 +1,6 @@
 # const.py
 import math
-from typing import Tuple
+from typing import Dict, Tuple
 
 SATELLITE_BOUNDS = {
     "goes-west":  (-180, -60, -112.5, 60),  # 实际覆盖西经165至105
@@ -57,6 +57,19 @@ SATELLITE_OFFSETS = {
     }
 }
 
+# 归属边界两侧额外保留的瓦片列数，供羽化/接缝混合使用（见 ownership.build_ownership）
+DEFAULT_OVERLAP_MARGIN = 1
+
+# 预取时每个预测时间点允许的探测失败次数，用尽后重新拉取时间列表对齐（见 prefetch.PrefetchScheduler）
+DEFAULT_MISS_BUDGET = 5
+
+# 预览模式支持的缩小倍数（JPEG draft 模式可直接解码的比例）
+PREVIEW_SCALES = (2, 4, 8)
+
+# fetch_latest_times 保存在 debug_output/ 下的时间列表历史，prefetch 据此学习各卫星的节奏
+TIMES_HISTORY_GLOB = "satellite_times_*.json"
+TIMES_FILENAME_FORMAT = "satellite_times_%Y-%m-%d_%H-%M-%S.json"
+
 def range_intersection(a_range, b_range):
     """返回两个闭区间的交集，若无交集返回 None"""
     a_min, a_max = a_range
@@ -98,6 +111,28 @@ def calculate_canvas_size(x_range: range, y_range: range, tile_size: int = 256)
     height = (y_range.stop - y_range.start) * tile_size
     return width, height
 
+def region_canvas(region: str, zoom: int) -> Tuple[int, int, Dict[str, int]]:
+    """
+    区域混合画布 (宽, 高, 卫星偏移瓦片数)，blend / process-blend / zec run 共用。
+    全球画布按 zoom 4 的 4096x2048 及 SATELLITE_OFFSETS["global"] 逐级加倍；
+    国家画布的偏移由卫星与国家范围交集的起始列计算（拼接图从交集起始列开始），
+    只保留 SATELLITE_OFFSETS 中为该国家配置的、与国家范围相交的卫星
+    """
+    if region not in COUNTRY_BOUNDS:
+        scale = 2 ** (zoom - 4)
+        rows, _ = get_satellite_tile_range(zoom, "himawari")
+        offsets = {sat: tiles * scale for sat, tiles in SATELLITE_OFFSETS["global"].items()}
+        return 4096 * scale, len(rows) * 256, offsets
+    c_rows, c_cols = get_bound_tile_range(zoom, COUNTRY_BOUNDS[region])
+    canvas_width, canvas_height = calculate_canvas_size(c_cols, c_rows)
+    offsets = {}
+    for satellite in SATELLITE_OFFSETS.get(region, SATELLITE_OFFSETS["default"]):
+        _, cols = get_satellite_tile_range(zoom, satellite)
+        if range_intersection((min(cols), max(cols)), (min(c_cols), max(c_cols))) is None:
+            continue
+        offsets[satellite] = max(cols.start, c_cols.start) - c_cols.start
+    return canvas_width, canvas_height, offsets
+
 # 定义拼接范围常量
 X_RANGE_CONCAT = range(0, 16)
 Y_RANGE_CONCAT = range(0, 16)
@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from zoom_earth_cli.const import get_bound_tile_range
+
+# Web Mercator 可表示的纬度上限
+MAX_MERCATOR_LAT = 85.05112878
+
+# 磁盘缓存目录：<region>_z<zoom>.json
+COVERAGE_CACHE_DIR = "coverage_cache"
+
+# COUNTRY_BOUNDS 中的名称 -> 常见 GeoJSON 数据集（如 Natural Earth）中的 ISO 代码
+REGION_ALIASES = {
+    "usa": ("USA", "US", "United States of America"),
+    "canada": ("CAN", "CA"),
+    "china": ("CHN", "CN"),
+    "india": ("IND", "IN"),
+    "brazil": ("BRA", "BR"),
+    "australia": ("AUS", "AU"),
+    "russia": ("RUS", "RU", "Russian Federation"),
+    "japan": ("JPN", "JP"),
+    "france": ("FRA", "FR"),
+    "germany": ("DEU", "DE"),
+}
+
+# 瓦片坐标集合，与 batch_download / download_tile 的 (x, y) 一致，即 URL 中的 /{zoom}/{x}/{y}
+TileSet = FrozenSet[Tuple[int, int]]
+
+
+def _ring_array(ring) -> np.ndarray:
+    points = np.asarray(ring, dtype=np.float64)[:, :2]
+    if len(points) and not np.array_equal(points[0], points[-1]):
+        points = np.vstack([points, points[:1]])
+    return points
+
+
+def _feature_matches(feature: dict, names: set) -> bool:
+    values = [feature.get("id")] + list((feature.get("properties") or {}).values())
+    return any(isinstance(v, str) and v.casefold() in names for v in values)
+
+
+def load_region_rings(geojson_path: str, region: str) -> List[np.ndarray]:
+    """
+    从 GeoJSON 中读取区域轮廓，返回全部环（外环与内环）的经纬度数组列表。
+    按 properties 中任意字符串字段（名称、ISO 代码等）或 feature id 匹配区域名，不区分大小写。
+    """
+    with open(geojson_path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    features = data.get("features") if data.get("type") == "FeatureCollection" else [data]
+    names = {region.casefold(), *(alias.casefold() for alias in REGION_ALIASES.get(region, ()))}
+
+    rings = []
+    for feature in features:
+        if feature.get("type") == "Feature" and not _feature_matches(feature, names):
+            continue
+        geometry = feature.get("geometry", feature)
+        if geometry["type"] == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry["type"] == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        else:
+            continue
+        rings.extend(_ring_array(ring) for polygon in polygons for ring in polygon if len(ring) >= 3)
+
+    if not rings:
+        raise ValueError(f"GeoJSON {geojson_path} 中未找到区域 '{region}' 的多边形")
+    return rings
+
+
+def _lonlat_to_tile_space(points: np.ndarray, zoom: int) -> np.ndarray:
+    """经纬度 -> 以瓦片为单位的连续坐标 (列, 行)"""
+    n = 2.0 ** zoom
+    lon = points[:, 0]
+    lat = np.radians(np.clip(points[:, 1], -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+    col = (lon + 180.0) / 360.0 * n
+    row = (1.0 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2.0 * n
+    return np.column_stack([col, row])
+
+
+def _ragged_arange(starts: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """展开 [start, start+count) 区间：返回 (所属区间序号, 值)"""
+    owner = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, starts[owner] + offsets
+
+
+def _edge_cells(p0: np.ndarray, p1: np.ndarray) -> np.ndarray:
+    """
+    所有边经过的网格单元（supercover）：求出每条边与整数网格线的全部交点参数 t，
+    相邻交点之间的线段中点所在单元即被该边穿过的单元。
+    """
+    edge_ids = [np.arange(len(p0)), np.arange(len(p0))]
+    params = [np.zeros(len(p0)), np.ones(len(p0))]
+    for axis in (0, 1):
+        a0, a1 = p0[:, axis], p1[:, axis]
+        first = np.floor(np.minimum(a0, a1)) + 1
+        last = np.ceil(np.maximum(a0, a1)) - 1
+        counts = np.maximum(last - first + 1, 0).astype(np.int64)
+        owner, lines = _ragged_arange(first, counts)
+        edge_ids.append(owner)
+        params.append((lines - a0[owner]) / (a1 - a0)[owner])
+
+    edge_ids = np.concatenate(edge_ids)
+    params = np.concatenate(params)
+    order = np.lexsort((params, edge_ids))
+    edge_ids, params = edge_ids[order], params[order]
+
+    same_edge = edge_ids[1:] == edge_ids[:-1]
+    owner = edge_ids[1:][same_edge]
+    mid = ((params[1:] + params[:-1]) / 2)[same_edge]
+    points = p0[owner] + (p1[owner] - p0[owner]) * mid[:, None]
+    return np.floor(points).astype(np.int64)
+
+
+def _interior_cells(p0: np.ndarray, p1: np.ndarray) -> np.ndarray:
+    """
+    中心点落在多边形内的单元：对每行中心线做扫描线求交，
+    按奇偶规则两两配对成区间后展开为列（内环自然被挖空）。
+    """
+    y0, y1 = p0[:, 1], p1[:, 1]
+    # 半开区间 [min, max)，保证经过顶点的扫描线只计一次
+    first = np.ceil(np.minimum(y0, y1) - 0.5)
+    last = np.ceil(np.maximum(y0, y1) - 0.5) - 1
+    counts = np.maximum(last - first + 1, 0).astype(np.int64)
+    owner, rows = _ragged_arange(first, counts)
+    if not len(rows):
+        return np.empty((0, 2), dtype=np.int64)
+
+    center_y = rows + 0.5
+    t = (center_y - y0[owner]) / (y1 - y0)[owner]
+    xs = p0[owner, 0] + (p1[owner, 0] - p0[owner, 0]) * t
+
+    order = np.lexsort((xs, rows))
+    rows, xs = rows[order], xs[order]
+    left, right = xs[0::2], xs[1::2]
+    span_rows = rows[0::2]
+
+    start = np.ceil(left - 0.5)
+    counts = np.maximum(np.floor(right - 0.5) - start + 1, 0).astype(np.int64)
+    span, cols = _ragged_arange(start, counts)
+    return np.column_stack([cols, span_rows[span]]).astype(np.int64)
+
+
+def polygon_tiles(rings: List[np.ndarray], zoom: int) -> TileSet:
+    """计算与多边形（含内环）相交的全部瓦片，返回 (x, y) 集合"""
+    projected = [_lonlat_to_tile_space(ring, zoom) for ring in rings]
+    p0 = np.concatenate([ring[:-1] for ring in projected])
+    p1 = np.concatenate([ring[1:] for ring in projected])
+
+    cells = np.concatenate([_edge_cells(p0, p1), _interior_cells(p0, p1)])
+    n = 2 ** zoom
+    cells = np.unique(np.clip(cells, 0, n - 1), axis=0)
+    # 网格单元为 (列, 行)，瓦片 URL 的 x 为行、y 为列
+    return frozenset((int(row), int(col)) for col, row in cells)
+
+
+def _source_signature(geojson_path: str) -> dict:
+    stat = os.stat(geojson_path)
+    return {"source": os.path.abspath(geojson_path), "mtime": stat.st_mtime, "size": stat.st_size}
+
+
+@lru_cache(maxsize=64)
+def _region_tiles(geojson_path: str, region: str, zoom: int, cache_dir: Optional[str], mtime: float) -> TileSet:
+    signature = _source_signature(geojson_path)
+    cache_file = Path(cache_dir) / f"{region}_z{zoom}.json" if cache_dir else None
+    if cache_file and cache_file.exists():
+        try:
+            cached = json.loads(cache_file.read_text(encoding="utf-8"))
+            if all(cached.get(k) == v for k, v in signature.items()):
+                return frozenset((x, y) for x, y in cached["tiles"])
+        except (OSError, ValueError, KeyError):
+            logging.warning(f"覆盖范围缓存损坏，重新计算: {cache_file}")
+
+    tiles = polygon_tiles(load_region_rings(geojson_path, region), zoom)
+    if cache_file:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_suffix(".tmp")
+        tmp.write_text(json.dumps({**signature, "tiles": sorted(tiles)}), encoding="utf-8")
+        os.replace(tmp, cache_file)
+    return tiles
+
+
+def get_region_tiles(
+    geojson_path: str,
+    region: str,
+    zoom: int,
+    cache_dir: Optional[str] = COVERAGE_CACHE_DIR
+) -> TileSet:
+    """
+    获取区域在指定 zoom 下精确相交的瓦片集合。
+    结果按 (区域, zoom) 缓存在内存和 cache_dir 中，GeoJSON 文件变化后自动失效。
+    """
+    mtime = os.stat(geojson_path).st_mtime
+    return _region_tiles(geojson_path, region, zoom, cache_dir, mtime)
+
+
+def bound_tiles(zoom: int, bound) -> TileSet:
+    """矩形边界对应的瓦片集合，用于与多边形覆盖对比"""
+    x_range, y_range = get_bound_tile_range(zoom, bound)
+    return frozenset((x, y) for x in x_range for y in y_range)
@@ -1,15 +1,203 @@
+import hashlib
+import json
 import logging
 import os
 import datetime
 import subprocess
+import tempfile
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from zoom_earth_cli import archive
+
+# 各编码路径共用的 x264 输出参数
+X264_CODEC_ARGS = [
+    "-c:v", "libx264",
+    "-crf", "23",
+    "-preset", "medium",
+    "-x264-params", "keyint=60:min-keyint=30",
+]
+X264_OUTPUT_ARGS = [*X264_CODEC_ARGS, "-movflags", "+faststart"]
+
+# 帧列表输入：concat demuxer，允许以 subfile 协议直接读取日包中的条目
+CONCAT_INPUT_ARGS = ["-f", "concat", "-safe", "0", "-protocol_whitelist", "file,subfile"]
+
+# 多码率输出档位：名称 -> (输出类型, 目标高度，None 表示保持原始尺寸)
+# 另支持 "hls-<档位>"（如 hls-540p）输出 HLS 分片与播放列表
+RENDITION_PRESETS = {
+    "full": ("mp4", None),
+    "1080p": ("mp4", 1080),
+    "720p": ("mp4", 720),
+    "540p": ("mp4", 540),
+    "webp": ("webp", 270),
+}
+WEBP_PREVIEW_FPS = 10
+HLS_SEGMENT_SECONDS = 4
+
+# ffmpeg 自身日志级别；-progress 输出单独走 stdout，不依赖日志
+FFMPEG_LOGLEVEL = "info"
+
+# 全局进度回调（CLI 进度条、指标采集等），每次收到 ffmpeg 进度块时调用
+_progress_hooks: List[Callable[[Dict[str, Any]], None]] = []
+
+def add_progress_hook(hook: Callable[[Dict[str, Any]], None]):
+    """注册全局编码进度回调"""
+    _progress_hooks.append(hook)
+
+def remove_progress_hook(hook: Callable[[Dict[str, Any]], None]):
+    """移除全局编码进度回调"""
+    if hook in _progress_hooks:
+        _progress_hooks.remove(hook)
+
+class FFmpegProcess:
+    """
+    ffmpeg 子进程运行器：增量读取 -progress 输出得到帧数/fps/速度/ETA，
+    stderr 只保留末尾若干行用于错误报告，支持中途取消。
+    """
+
+    def __init__(
+        self,
+        cmd: List[str],
+        label: str = "",
+        total_frames: Optional[int] = None,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+        stdin=None,
+        stderr_lines: int = 200,
+        logger=logging
+    ):
+        # 在 ffmpeg 之后插入进度参数：机器可读的进度写到 stdout，关闭交互式统计行
+        self.cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+        self.label = label
+        self.total_frames = total_frames
+        self.on_progress = on_progress
+        self.stdin = stdin
+        self.logger = logger
+        self.stderr_tail = deque(maxlen=stderr_lines)
+        self.last_progress: Dict[str, Any] = {}
+        self.cancelled = False
+        self.proc: Optional[subprocess.Popen] = None
+        self._threads: List[threading.Thread] = []
+        self._started_at = 0.0
+
+    def start(self) -> "FFmpegProcess":
+        self._started_at = time.perf_counter()
+        self.proc = subprocess.Popen(
+            self.cmd,
+            stdin=self.stdin if self.stdin is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        self._threads = [
+            threading.Thread(target=self._drain_stderr, daemon=True),
+            threading.Thread(target=self._read_progress, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _drain_stderr(self):
+        for line in self.proc.stderr:
+            self.stderr_tail.append(line.decode(errors="replace"))
+
+    def _read_progress(self):
+        block: Dict[str, str] = {}
+        for raw in self.proc.stdout:
+            key, _, value = raw.decode(errors="replace").strip().partition("=")
+            if not key:
+                continue
+            block[key] = value
+            if key == "progress":
+                self._emit(block)
+                block = {}
+
+    def _emit(self, block: Dict[str, str]):
+        frame = int(block.get("frame", 0) or 0)
+        try:
+            fps = float(block.get("fps", 0) or 0)
+        except ValueError:
+            fps = 0.0
+        speed_text = block.get("speed", "").rstrip("x").strip()
+        try:
+            speed = float(speed_text) if speed_text not in ("", "N/A") else None
+        except ValueError:
+            speed = None
+        eta = None
+        if self.total_frames and fps > 0:
+            eta = max(0.0, (self.total_frames - frame) / fps)
+        snapshot = {
+            "label": self.label,
+            "frame": frame,
+            "total_frames": self.total_frames,
+            "fps": fps,
+            "speed": speed,
+            "out_time": block.get("out_time"),
+            "eta_seconds": eta,
+            "elapsed_seconds": time.perf_counter() - self._started_at,
+            "done": block.get("progress") == "end",
+        }
+        self.last_progress = snapshot
+        for hook in [self.on_progress, *_progress_hooks]:
+            if hook is None:
+                continue
+            try:
+                hook(snapshot)
+            except Exception as e:
+                self.logger.debug(f"进度回调异常: {e}")
+
+    def cancel(self):
+        """取消编码：先请求 ffmpeg 正常退出，超时后强制结束"""
+        if self.proc is None or self.proc.poll() is not None:
+            return
+        self.cancelled = True
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+    def wait(self) -> Dict[str, Any]:
+        """等待结束；失败时抛出 CalledProcessError（stderr 为截取的末尾日志）"""
+        returncode = self.proc.wait()
+        for thread in self._threads:
+            thread.join()
+        if self.cancelled:
+            raise KeyboardInterrupt(f"FFmpeg 编码已取消: {self.label}")
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self.cmd, stderr="".join(self.stderr_tail))
+        return self.last_progress
+
+def run_ffmpeg(
+    cmd: List[str],
+    label: str = "",
+    total_frames: Optional[int] = None,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    logger=logging
+) -> Dict[str, Any]:
+    """运行 ffmpeg 直到结束，Ctrl+C 时干净地终止子进程；返回最后一次进度"""
+    process = FFmpegProcess(cmd, label=label, total_frames=total_frames, on_progress=on_progress, logger=logger).start()
+    try:
+        return process.wait()
+    except KeyboardInterrupt:
+        process.cancel()
+        raise
 
 def generate_timelapse(
     input_dir: str,
     output_file: str,
     duration_hours: int = 24,
     start_time: str = None,
-    framerate: int = 30
+    framerate: int = 30,
+    segment_cache_dir: Optional[str] = None,
+    segment_minutes: int = 60,
+    jobs: int = 1,
+    chunk_frames: Optional[int] = None,
+    renditions: Optional[List[str]] = None
 ):
     """
     生成卫星图像延时视频
@@ -20,8 +208,52 @@ def generate_timelapse(
     duration_hours: 视频时长（小时），默认24
     start_time: 起始时间 (格式: YYYY-MM-DDTHH:MM)，默认使用最新时间
     framerate: 输出视频帧率，默认30
+    segment_cache_dir: 分段缓存目录，指定后按时间对齐分段编码并复用未变化的分段
+    segment_minutes: 分段时长（分钟），默认60
+    jobs: 并行编码的 ffmpeg 进程数，默认1（单进程编码整段）
+    chunk_frames: 并行编码时每块的帧数，默认按 jobs 均分
+    renditions: 输出档位列表（如 ["full", "1080p", "540p", "hls-540p", "webp"]），
+                指定后一次解码同时输出全部档位，不再使用分段缓存/并行分块
+
+    返回并行编码各块的耗时报告（未并行时为空列表）
     """
-    
+    valid_files = collect_timelapse_frames(input_dir, duration_hours, start_time)
+    if not valid_files:
+        print("未找到符合时间范围的图像")
+        return []
+
+    if renditions:
+        if segment_cache_dir or jobs > 1:
+            logging.warning("多档位输出为单次解码的单个 ffmpeg 进程，忽略分段缓存与并行分块参数")
+        frame_runs = collapse_duplicate_frames([path for _, path in valid_files])
+        encode_renditions(frame_runs, output_file, renditions, framerate)
+        return []
+
+    if segment_cache_dir:
+        encode_with_segment_cache(
+            valid_files,
+            output_file=output_file,
+            framerate=framerate,
+            cache_dir=segment_cache_dir,
+            segment_seconds=segment_minutes * 60,
+            jobs=jobs
+        )
+        return []
+
+    # 合并连续的重复帧（blend 阶段以硬链接引用的同一文件），每段只解码一次
+    frame_runs = collapse_duplicate_frames([path for _, path in valid_files])
+    logging.info(f"共 {len(valid_files)} 帧，合并重复帧后需解码 {len(frame_runs)} 张图像")
+    if jobs > 1:
+        return encode_parallel_chunks(frame_runs, output_file, framerate, jobs, chunk_frames)
+    encode_frame_runs(frame_runs, output_file, framerate)
+    return []
+
+def collect_timelapse_frames(
+    input_dir: str,
+    duration_hours: int = 24,
+    start_time: str = None
+) -> List[Tuple[datetime.datetime, str]]:
+    """收集时间窗口内的有效图像，按时间升序返回 [(时间, 路径)]"""
     # 解析时间参数
     if start_time:
         start_dt = datetime.datetime.fromisoformat(start_time)
@@ -32,10 +264,8 @@ def generate_timelapse(
     
     # 收集符合条件的图像路径
     image_files = []
-    for date_dir in sorted(Path(input_dir).iterdir(), reverse=True):
-        if not date_dir.is_dir():
-            continue
-            
+    # 已归档的日期（<日期>.zpk）从日包索引中列出帧
+    for date_dir in reversed(archive.list_dirs(input_dir)):
         date_str = date_dir.name
         try:
             current_date = datetime.datetime.strptime(date_str, "%Y-%m-%d")
@@ -48,7 +278,7 @@ def generate_timelapse(
         if current_date.date() < (start_dt - datetime.timedelta(hours=duration_hours)).date():
             break
             
-        for img_file in sorted(date_dir.glob("*.png"), reverse=True):
+        for img_file in reversed(archive.list_files(date_dir, "*.png")):
             time_str = img_file.stem
             try:
                 img_time = datetime.datetime.strptime(time_str, "%H%M")
@@ -66,63 +296,58 @@ def generate_timelapse(
     # 按时间顺序排序
     image_files.sort(key=lambda x: x[0])
     
-    if not image_files:
-        print("未找到符合时间范围的图像")
-        return
-    
     # 在生成输入列表前添加验证
     valid_files = []
     for dt, path in image_files:
-        if not Path(path).exists():
+        try:
+            _, size, _ = archive.frame_stat(path)
+        except FileNotFoundError:
             logging.warning(f"文件不存在: {path}")
             continue
-        if os.path.getsize(path) == 0:
+        if size == 0:
             logging.warning(f"空文件: {path}")
             continue
         valid_files.append((dt, path))
 
     if len(valid_files) != len(image_files):
         logging.error(f"发现 {len(image_files)-len(valid_files)} 个无效文件")
-    
-    # 计算实际帧率
-    total_frames = len(image_files)
-    target_duration = duration_hours * 3600  # 目标视频时长（秒）
-    actual_framerate = total_frames / target_duration
-    
-    # 生成FFmpeg输入列表（增加duration配置）
-    temp_list = Path("input_list.txt")
-    with temp_list.open("w") as f:
-        for _, path in image_files:
-            # 添加每张图片的持续时间（单位秒）
-            duration = 1 / actual_framerate
-            f.write(f"file '{path}'\n")
-            f.write(f"duration {duration:.5f}\n")
-    
-    
+    return valid_files
+
+def encode_frame_runs(
+    frame_runs: List[Tuple[str, int]],
+    output_file: str,
+    framerate: int = 30,
+    threads: Optional[int] = None
+):
+    """将 (路径, 连续帧数) 列表通过 concat demuxer 编码为视频"""
+    # 生成FFmpeg输入列表（每帧占 1/framerate 秒，重复帧合并为更长的 duration）
+    fd, list_name = tempfile.mkstemp(prefix="input_list_", suffix=".txt", dir=".")
+    os.close(fd)
+    temp_list = Path(list_name)
+    write_concat_list(temp_list, frame_runs, framerate)
+    total_frames = sum(count for _, count in frame_runs)
+
     # 修改后的FFmpeg命令
     cmd = [
         "ffmpeg",
         "-y",
-        "-f", "concat",
-        "-safe", "0",
+        *CONCAT_INPUT_ARGS,
         "-i", str(temp_list),
         "-fps_mode", "cfr",          # 替代旧的 -vsync 参数
         "-r", str(framerate),        # 输出帧率
-        "-vf", "format=yuv420p,setpts=N/FRAME_RATE/TB",  # 正确的时间戳处理
-        "-c:v", "libx264",
-        "-crf", "23",
-        "-preset", "medium",
-        "-x264-params", "keyint=60:min-keyint=30",
-        "-movflags", "+faststart",
-        "-loglevel", "debug",        # 开启详细日志
+        "-frames:v", str(total_frames),  # 截掉列表末尾为 duration 生效而重复的一帧
+        "-vf", "format=yuv420p",
+        *X264_OUTPUT_ARGS,
+        *(["-threads", str(threads)] if threads else []),
+        "-loglevel", FFMPEG_LOGLEVEL,
         str(output_file)
     ]
     
     # 执行命令（增加错误处理）
     try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
+        run_ffmpeg(cmd, label=Path(output_file).name, total_frames=total_frames)
     except subprocess.CalledProcessError as e:
-        print(f"FFmpeg执行失败，保留输入文件 {temp_list} 用于调试")
+        print(f"FFmpeg执行失败，输入列表 {temp_list}")
         print("错误输出：")
         print(e.stderr)
         raise
@@ -130,20 +355,400 @@ def generate_timelapse(
       # 清理临时文件
       temp_list.unlink()
 
+def parse_rendition(name: str) -> Tuple[str, Optional[int]]:
+    """解析档位名称，返回 (输出类型, 目标高度)"""
+    if name.startswith("hls-"):
+        kind, height = parse_rendition(name[len("hls-"):])
+        if kind != "mp4":
+            raise ValueError(f"HLS 只支持视频档位: {name}")
+        return "hls", height
+    if name not in RENDITION_PRESETS:
+        raise ValueError(f"不支持的输出档位: {name}，可选: {list(RENDITION_PRESETS)} 或 hls-<档位>")
+    return RENDITION_PRESETS[name]
+
+def rendition_output_path(output_file: str, name: str) -> Path:
+    """full 档位写入 output_file 本身，其余档位以 <文件名>_<档位> 放在同一目录"""
+    output = Path(output_file)
+    kind, _ = parse_rendition(name)
+    if kind == "hls":
+        return output.parent / f"{output.stem}_{name}" / "index.m3u8"
+    if kind == "webp":
+        return output.with_name(f"{output.stem}_preview.webp")
+    if name == "full":
+        return output
+    return output.with_name(f"{output.stem}_{name}{output.suffix}")
+
+def build_rendition_graph(
+    renditions: List[str],
+    output_file: str,
+    framerate: int,
+    total_frames: int
+) -> Tuple[List[str], Dict[str, Path]]:
+    """
+    构造单输入多输出的 ffmpeg 参数：输入帧只解码一次，
+    经 fps/trim 统一为恒定帧率后 split 到各档位的 scale 分支。
+
+    返回 (-filter_complex 及各输出参数, {档位: 输出路径})
+    """
+    branches = []
+    output_args: List[str] = []
+    outputs: Dict[str, Path] = {}
+    for i, name in enumerate(renditions):
+        kind, height = parse_rendition(name)
+        path = rendition_output_path(output_file, name)
+        outputs[name] = path
+
+        # 只缩小不放大；宽度取偶数以满足 yuv420p
+        scale = f",scale=-2:'min({height},ih)'" if height else ""
+        if kind == "webp":
+            branches.append(f"[s{i}]fps={WEBP_PREVIEW_FPS}{scale}[o{i}]")
+            output_args += [
+                "-map", f"[o{i}]",
+                "-c:v", "libwebp", "-lossless", "0", "-q:v", "60",
+                "-loop", "0",
+                str(path),
+            ]
+            continue
+
+        branches.append(f"[s{i}]format=yuv420p{scale}[o{i}]")
+        output_args += ["-map", f"[o{i}]", *X264_CODEC_ARGS]
+        if kind == "hls":
+            path.parent.mkdir(parents=True, exist_ok=True)
+            output_args += [
+                "-f", "hls",
+                "-hls_time", str(HLS_SEGMENT_SECONDS),
+                "-hls_playlist_type", "vod",
+                "-hls_segment_filename", str(path.parent / "segment_%05d.ts"),
+                str(path),
+            ]
+        else:
+            output_args += ["-movflags", "+faststart", str(path)]
+
+    labels = "".join(f"[s{i}]" for i in range(len(renditions)))
+    graph = ";".join([
+        # 截掉列表末尾为 duration 生效而重复的一帧
+        f"[0:v]fps={framerate},trim=end_frame={total_frames},"
+        f"split={len(renditions)}{labels}",
+        *branches,
+    ])
+    return ["-filter_complex", graph, *output_args], outputs
+
+def encode_renditions(
+    frame_runs: List[Tuple[str, int]],
+    output_file: str,
+    renditions: List[str],
+    framerate: int = 30
+) -> Dict[str, Path]:
+    """一次读取输入帧，同时编码出全部档位（MP4 / HLS / WebP 预览）"""
+    renditions = list(dict.fromkeys(renditions))
+    fd, list_name = tempfile.mkstemp(prefix="input_list_", suffix=".txt", dir=".")
+    os.close(fd)
+    temp_list = Path(list_name)
+    write_concat_list(temp_list, frame_runs, framerate)
+    total_frames = sum(count for _, count in frame_runs)
+
+    graph_args, outputs = build_rendition_graph(renditions, output_file, framerate, total_frames)
+    cmd = [
+        "ffmpeg",
+        "-y",
+        *CONCAT_INPUT_ARGS,
+        "-i", str(temp_list),
+        "-loglevel", FFMPEG_LOGLEVEL,
+        *graph_args,
+    ]
+    try:
+        run_ffmpeg(cmd, label=Path(output_file).name, total_frames=total_frames)
+    finally:
+        temp_list.unlink()
+
+    for name, path in outputs.items():
+        logging.info(f"档位 {name}: {path}")
+    return outputs
+
+def encode_with_segment_cache(
+    frames: List[Tuple[datetime.datetime, str]],
+    output_file: str,
+    framerate: int,
+    cache_dir: str,
+    segment_seconds: int = 3600,
+    jobs: int = 1,
+    logger=logging
+) -> Tuple[int, int]:
+    """
+    按时间对齐的分段编码并缓存，再以流复制方式拼接为最终视频。
+
+    每段是独立编码（从 IDR 帧开始的封闭 GOP），缓存文件名包含分段起始时间和
+    由编码参数与帧列表（路径、帧数、大小、修改时间）计算的签名，签名一致的分段直接复用。
+    滚动窗口刷新时通常只需重新编码最新一段（以及窗口起点被截断的那一段）。
+    返回 (复用分段数, 新编码分段数)。
+    """
+    cache_path = Path(cache_dir)
+    cache_path.mkdir(parents=True, exist_ok=True)
+
+    # 按 UTC 时间对齐分组
+    chunks: Dict[int, List[str]] = {}
+    for dt, path in frames:
+        ts = int(dt.replace(tzinfo=datetime.timezone.utc).timestamp())
+        chunks.setdefault(ts // segment_seconds * segment_seconds, []).append(path)
+
+    segment_files: List[Path] = []
+    pending: List[Tuple[Path, List[Tuple[str, int]], int]] = []
+    reused = 0
+    for chunk_start in sorted(chunks):
+        frame_runs = collapse_duplicate_frames(chunks[chunk_start])
+        signature = _segment_signature(frame_runs, framerate)
+        chunk_label = datetime.datetime.fromtimestamp(chunk_start, datetime.timezone.utc).strftime("%Y%m%d_%H%M")
+        segment_file = cache_path / f"{chunk_label}_{signature[:16]}.mp4"
+
+        if segment_file.exists() and segment_file.with_suffix(".json").exists():
+            logger.info(f"复用缓存分段: {segment_file.name}")
+            reused += 1
+        else:
+            pending.append((segment_file, frame_runs, chunk_start))
+        segment_files.append(segment_file)
+
+    def _encode_segment(segment_file: Path, frame_runs: List[Tuple[str, int]], chunk_start: int):
+        logger.info(f"编码分段 {segment_file.name[:13]}（{sum(c for _, c in frame_runs)} 帧）")
+        temp_file = segment_file.with_name(segment_file.stem + ".tmp.mp4")
+        encode_frame_runs(frame_runs, str(temp_file), framerate, threads=_threads_per_job(jobs))
+        os.replace(temp_file, segment_file)
+        segment_file.with_suffix(".json").write_text(json.dumps({
+            "output": os.path.abspath(output_file),
+            "chunk_start": chunk_start,
+            "segment_seconds": segment_seconds,
+            "framerate": framerate,
+            "encoder_args": X264_OUTPUT_ARGS,
+            "frames": [[path, count] for path, count in frame_runs],
+        }, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    # 需要重新编码的分段互相独立，可并行编码
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        for future in [executor.submit(_encode_segment, *task) for task in pending]:
+            future.result()
+    encoded = len(pending)
+
+    concat_segments(segment_files, output_file)
+    _prune_segment_cache(cache_path, segment_files, output_file, logger)
+    logger.info(f"分段编码完成：复用 {reused} 段，新编码 {encoded} 段 -> {output_file}")
+    return reused, encoded
+
+def _segment_signature(frame_runs: List[Tuple[str, int]], framerate: int) -> str:
+    """编码参数与帧内容（路径/帧数/大小/修改时间）的签名"""
+    digest = hashlib.sha1()
+    digest.update(json.dumps([framerate, X264_OUTPUT_ARGS]).encode())
+    for path, count in frame_runs:
+        _, size, mtime_ns = archive.frame_stat(path)
+        digest.update(f"{os.path.abspath(path)}|{count}|{size}|{mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+def _prune_segment_cache(cache_path: Path, keep: List[Path], output_file: str, logger=logging):
+    """
+    删除本输出窗口内被替换的旧分段以及早于窗口的分段。
+
+    多个输出可共用一个缓存目录：只清理记录中属于 output_file 的分段，
+    其他输出的分段由它们自己的刷新负责（未记录归属的旧缓存按原规则清理）。
+    """
+    if not keep:
+        return
+    keep_names = {p.name for p in keep}
+    newest_label = max(p.name[:13] for p in keep)
+    owner = os.path.abspath(output_file)
+    for cached in cache_path.glob("*.mp4"):
+        if cached.name in keep_names or cached.name[:13] > newest_label:
+            continue
+        sidecar = cached.with_suffix(".json")
+        try:
+            segment_owner = json.loads(sidecar.read_text(encoding="utf-8")).get("output", owner)
+        except (OSError, ValueError):
+            segment_owner = owner
+        if segment_owner != owner:
+            continue
+        cached.unlink(missing_ok=True)
+        sidecar.unlink(missing_ok=True)
+        logger.debug(f"清理过期分段: {cached.name}")
+
+def _threads_per_job(jobs: int) -> Optional[int]:
+    """并行编码时为每个 ffmpeg 分配的线程数，避免线程总数远超核数"""
+    if jobs <= 1:
+        return None
+    return max(1, (os.cpu_count() or 1) // jobs)
+
+def split_frame_runs(frame_runs: List[Tuple[str, int]], chunk_frames: int) -> List[List[Tuple[str, int]]]:
+    """按帧数把 (路径, 连续帧数) 列表切成连续的块，跨边界的重复帧段会被拆开"""
+    chunks: List[List[Tuple[str, int]]] = [[]]
+    room = chunk_frames
+    for path, count in frame_runs:
+        while count > 0:
+            if room == 0:
+                chunks.append([])
+                room = chunk_frames
+            take = min(count, room)
+            chunks[-1].append((path, take))
+            count -= take
+            room -= take
+    return [chunk for chunk in chunks if chunk]
+
+def encode_parallel_chunks(
+    frame_runs: List[Tuple[str, int]],
+    output_file: str,
+    framerate: int = 30,
+    jobs: int = 2,
+    chunk_frames: Optional[int] = None,
+    logger=logging
+) -> List[Dict[str, float]]:
+    """
+    将帧序列切成连续的块，多个 ffmpeg 进程以相同参数并行编码，
+    每块从关键帧开始，最后流复制无损拼接。返回每块的耗时报告。
+    """
+    total_frames = sum(count for _, count in frame_runs)
+    if chunk_frames is None:
+        chunk_frames = -(-total_frames // jobs)
+    chunks = split_frame_runs(frame_runs, max(1, chunk_frames))
+    logger.info(f"并行编码：{total_frames} 帧切为 {len(chunks)} 块，{jobs} 个进程")
+
+    output_path = Path(output_file)
+    with tempfile.TemporaryDirectory(prefix="chunks_", dir=output_path.parent) as temp_dir:
+        chunk_files = [Path(temp_dir) / f"chunk_{i:04d}.mp4" for i in range(len(chunks))]
+
+        def _encode_chunk(index: int) -> Dict[str, float]:
+            started = time.perf_counter()
+            encode_frame_runs(chunks[index], str(chunk_files[index]), framerate, threads=_threads_per_job(jobs))
+            elapsed = time.perf_counter() - started
+            frames = sum(count for _, count in chunks[index])
+            logger.info(f"块 {index} 完成：{frames} 帧，耗时 {elapsed:.1f}s（{frames / elapsed:.1f} fps）")
+            return {"chunk": index, "frames": frames, "seconds": elapsed, "fps": frames / elapsed if elapsed else 0.0}
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            report = list(executor.map(_encode_chunk, range(len(chunks))))
+
+        concat_segments(chunk_files, output_file)
+    return report
+
+def concat_segments(segment_files: List[Path], output_file: str):
+    """用 concat demuxer 流复制拼接编码参数一致的分段，不重新编码"""
+    fd, list_name = tempfile.mkstemp(prefix="segment_list_", suffix=".txt", dir=".")
+    os.close(fd)
+    temp_list = Path(list_name)
+    with temp_list.open("w") as f:
+        for segment_file in segment_files:
+            f.write(f"file '{segment_file.resolve()}'\n")
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-f", "concat",
+        "-safe", "0",
+        "-i", str(temp_list),
+        "-c", "copy",
+        "-movflags", "+faststart",
+        "-loglevel", FFMPEG_LOGLEVEL,
+        str(output_file)
+    ]
+    try:
+        run_ffmpeg(cmd, label=Path(output_file).name)
+    except subprocess.CalledProcessError as e:
+        print("FFmpeg分段拼接失败，错误输出：")
+        print(e.stderr)
+        raise
+    finally:
+        temp_list.unlink()
+
+def collapse_duplicate_frames(paths: List[str]) -> List[Tuple[str, int]]:
+    """
+    将连续指向同一文件（相同 inode）的帧合并为 (路径, 连续帧数) 列表
+    """
+    runs: List[Tuple[str, int]] = []
+    last_key = None
+    for path in paths:
+        key, _, _ = archive.frame_stat(path)
+        if runs and key == last_key:
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((path, 1))
+        last_key = key
+    return runs
+
+def write_concat_list(list_path: Path, frame_runs: List[Tuple[str, int]], framerate: int):
+    """写出 concat demuxer 输入列表，每段持续 帧数/framerate 秒"""
+    with list_path.open("w") as f:
+        for path, count in frame_runs:
+            f.write(f"file '{archive.ffmpeg_input(path)}'\n")
+            f.write(f"duration {count / framerate:.5f}\n")
+        # concat demuxer 会忽略最后一项的 duration，重复最后一帧使其生效
+        if frame_runs:
+            f.write(f"file '{archive.ffmpeg_input(frame_runs[-1][0])}'\n")
+
+def encode_frame_stream(
+    frames: Iterable[np.ndarray],
+    width: int,
+    height: int,
+    output_file: str,
+    framerate: int = 30,
+    total_frames: Optional[int] = None,
+    logger=logging
+) -> int:
+    """
+    将内存中的帧（HxWx3/4 uint8）以 rawvideo 通过标准输入写给 ffmpeg 编码。
+    管道写满时 write 会阻塞，合成端自然被 ffmpeg 的编码速度限流。
+    返回写入的帧数。
+    """
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-f", "rawvideo",
+        "-pix_fmt", "rgb24",
+        "-s", f"{width}x{height}",
+        "-r", str(framerate),
+        "-i", "-",
+        "-vf", "format=yuv420p",
+        *X264_OUTPUT_ARGS,
+        "-loglevel", FFMPEG_LOGLEVEL,
+        str(output_file)
+    ]
+    process = FFmpegProcess(
+        cmd, label=Path(output_file).name, total_frames=total_frames, stdin=subprocess.PIPE, logger=logger
+    ).start()
+    proc = process.proc
+
+    frames_written = 0
+    try:
+        for frame in frames:
+            if frame.shape[:2] != (height, width):
+                raise ValueError(f"帧尺寸 {frame.shape[1]}x{frame.shape[0]} 与视频尺寸 {width}x{height} 不一致")
+            proc.stdin.write(memoryview(np.ascontiguousarray(frame[..., :3])))
+            frames_written += 1
+    except BrokenPipeError:
+        logger.error("FFmpeg 提前退出，停止写入帧")
+    except BaseException:
+        # 合成端出错或 Ctrl+C：终止 ffmpeg，避免留下半成品进程
+        process.cancel()
+        raise
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    try:
+        process.wait()
+    except subprocess.CalledProcessError as e:
+        print("FFmpeg执行失败，错误输出：")
+        print(e.stderr)
+        raise
+
+    logger.info(f"已通过管道编码 {frames_written} 帧: {output_file}")
+    return frames_written
+
 def get_latest_image_time(input_dir: str) -> datetime.datetime:
     """获取目录中最新的图像时间"""
     latest = None
-    for date_dir in sorted(Path(input_dir).iterdir(), reverse=True):
-        if not date_dir.is_dir():
-            continue
-            
+    for date_dir in reversed(archive.list_dirs(input_dir)):
         date_str = date_dir.name
         try:
             current_date = datetime.datetime.strptime(date_str, "%Y-%m-%d")
         except ValueError:
             continue
             
-        for img_file in sorted(date_dir.glob("*.png"), reverse=True):
+        for img_file in reversed(archive.list_files(date_dir, "*.png")):
             time_str = img_file.stem
             try:
                 img_time = datetime.datetime.strptime(time_str, "%H%M")
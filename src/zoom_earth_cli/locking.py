@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 锁与认领文件的根目录（相对当前工作目录，与 downloads/mosaics 并列）
+LOCK_ROOT = ".zec_locks"
+# 认领租约时长（秒）：超时未续约视为崩溃遗留，可被其他进程回收
+DEFAULT_LEASE_SECONDS = 15 * 60
+
+
+def _safe_name(value: str) -> str:
+    return re.sub(r"[^0-9A-Za-z_.-]+", "_", value).strip("_") or "_"
+
+
+def _lock_file(handle, blocking: bool) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock_file(handle) -> None:
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def stage_lock(stage: str, region: str, blocking: bool = True, lock_root: str = LOCK_ROOT):
+    """
+    阶段 + 区域级别的建议锁（fcntl.flock / msvcrt.locking），进程退出时由系统自动释放。
+    非阻塞模式下拿不到锁时产出 False。
+    """
+    path = Path(lock_root) / f"{_safe_name(stage)}-{_safe_name(region)}.lock"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+") as handle:
+        acquired = _lock_file(handle, blocking)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                _unlock_file(handle)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class ClaimSet:
+    """
+    帧级别的工作认领：以 O_EXCL 创建认领文件，多个并发运行各自认领剩余的帧，互不重复。
+    认领带租约，持有者崩溃（本机进程已不存在）或租约过期后可被回收；回收在阶段锁内完成，避免两个进程同时抢占。
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        region: str,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        lock_root: str = LOCK_ROOT,
+        logger=logging
+    ):
+        self.stage = stage
+        self.region = region
+        self.lease_seconds = lease_seconds
+        self.lock_root = lock_root
+        self.claim_dir = Path(lock_root) / "claims" / _safe_name(stage) / _safe_name(region)
+        self.claim_dir.mkdir(parents=True, exist_ok=True)
+        self.owner = {"pid": os.getpid(), "host": socket.gethostname()}
+        self.held: List[str] = []
+        self.logger = logger
+        self._held_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def _path(self, key: str) -> Path:
+        return self.claim_dir / f"{_safe_name(key)}.claim"
+
+    def _write(self, path: Path, exclusive: bool) -> bool:
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_EXCL if exclusive else os.O_TRUNC)
+        try:
+            fd = os.open(path, flags, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            json.dump({**self.owner, "expires_at": time.time() + self.lease_seconds}, f)
+        return True
+
+    def _is_stale(self, path: Path) -> bool:
+        try:
+            info = json.loads(path.read_text())
+        except FileNotFoundError:
+            return True
+        except (OSError, ValueError):
+            # 写入中途崩溃留下的残缺文件：按修改时间判断
+            try:
+                return time.time() - path.stat().st_mtime > self.lease_seconds
+            except FileNotFoundError:
+                return True
+        if info.get("expires_at", 0) < time.time():
+            return True
+        return info.get("host") == self.owner["host"] and not _pid_alive(int(info.get("pid", 0)))
+
+    def try_claim(self, key: str) -> bool:
+        """认领一帧；已被其他存活进程认领时返回 False"""
+        path = self._path(key)
+        if self._write(path, exclusive=True):
+            with self._held_lock:
+                self.held.append(key)
+            return True
+        with stage_lock(self.stage, self.region, lock_root=self.lock_root):
+            if not self._is_stale(path):
+                return False
+            self.logger.info(f"回收过期认领: {self.stage}/{self.region}/{key}")
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            if not self._write(path, exclusive=True):
+                return False
+        with self._held_lock:
+            self.held.append(key)
+        return True
+
+    def claim_all(self, keys: Iterable[str]) -> List[str]:
+        """认领一批帧，返回本进程成功认领的部分"""
+        return [key for key in keys if self.try_claim(key)]
+
+    def renew(self) -> None:
+        """为当前持有的全部认领续约"""
+        with self._held_lock:
+            keys = list(self.held)
+        for key in keys:
+            self._write(self._path(key), exclusive=False)
+
+    def release(self, key: str) -> None:
+        with self._held_lock:
+            if key not in self.held:
+                return
+            self.held.remove(key)
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def release_all(self) -> None:
+        with self._held_lock:
+            keys = list(self.held)
+        for key in keys:
+            self.release(key)
+
+    def _renew_loop(self) -> None:
+        while not self._stop.wait(self.lease_seconds / 3):
+            self.renew()
+
+    def __enter__(self):
+        # 后台定期续约，长时间运行的阶段不会被误判为过期
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._renew_loop, daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        self.release_all()
+
+
+# 各阶段认领的区域与键：process-concat / process-blend 与 zec run 必须一致，才能看到彼此的认领
+def concat_claim_key(satellite: str, zoom, date_str: str, time_str: str) -> str:
+    """拼接阶段按帧认领的键（区域为下载区域名）"""
+    return f"{satellite}-{zoom}-{date_str}-{time_str}"
+
+
+def blend_claim_region(output_base_dir, zoom) -> str:
+    """混合阶段认领的区域：输出根目录名 + zoom，如 japan-4"""
+    return f"{Path(output_base_dir).name}-{zoom}"
+
+
+def blend_claim_key(output_path) -> str:
+    """混合阶段按输出帧认领的键（绝对路径，与调用方传入相对还是绝对路径无关）"""
+    return os.path.abspath(output_path)
@@ -0,0 +1,169 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+DEFAULT_LOG_FILE = "zoom_earth.log"
+# 聚合进度日志的默认间隔（秒）
+DEFAULT_PROGRESS_INTERVAL = 10.0
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+
+def setup_logging(level: int = logging.INFO, log_file: Optional[str] = DEFAULT_LOG_FILE) -> QueueListener:
+    """
+    根 logger 只挂一个 QueueHandler：工作线程写日志只是入队，
+    文件与终端输出由后台 QueueListener 线程完成，不再在 handler 锁上互相阻塞。
+    重复调用只更新日志级别。
+    """
+    global _listener, _queue_handler
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return _listener
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    _queue_handler = QueueHandler(log_queue)
+    root.addHandler(_queue_handler)
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """停止后台线程并写出队列中剩余的日志"""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger().removeHandler(_queue_handler)
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = _queue_handler = None
+
+
+def _after_fork_in_child() -> None:
+    # 子进程中没有监听线程，入队的日志不会被写出：改为直接挂载原始 handler
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    root = logging.getLogger()
+    root.removeHandler(_queue_handler)
+    for handler in _listener.handlers:
+        root.addHandler(handler)
+    _listener = _queue_handler = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class LogSampler:
+    """
+    逐瓦片日志的采样：前 first 次全部放行，之后每 every 次放行一次。
+    调用方先判断 sample() 再格式化消息，未采样的事件几乎没有开销。
+    """
+
+    def __init__(self, every: int = 100, first: int = 5):
+        self.every = max(1, every)
+        self.first = first
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def sample(self) -> bool:
+        with self._lock:
+            self.count += 1
+            count = self.count
+        return count <= self.first or count % self.every == 0
+
+
+class RateLimiter:
+    """令牌桶限速：每秒最多放行 per_second 条（允许 burst 条突发），记录被丢弃的数量"""
+
+    def __init__(self, per_second: float = 5.0, burst: int = 10, clock=time.monotonic):
+        self.per_second = per_second
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.suppressed = 0
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.per_second)
+            self._updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            self.suppressed += 1
+            return False
+
+
+class ProgressReporter:
+    """
+    聚合进度：各线程只累加计数，每隔 interval 秒最多输出一行
+    "已完成/总数、各结果数量、速率、预计剩余时间"，代替逐条日志。
+    """
+
+    def __init__(
+        self,
+        label: str,
+        total: int,
+        interval: float = DEFAULT_PROGRESS_INTERVAL,
+        logger=logging,
+        clock=time.monotonic
+    ):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.logger = logger
+        self.clock = clock
+        self.done = 0
+        self.counts: Dict[str, int] = {}
+        self._started = clock()
+        self._last_report = self._started
+        self._lock = threading.Lock()
+
+    def update(self, result: str, amount: int = 1) -> None:
+        with self._lock:
+            self.done += amount
+            self.counts[result] = self.counts.get(result, 0) + amount
+            now = self.clock()
+            if now - self._last_report < self.interval:
+                return
+            self._last_report = now
+            line = self._format(now)
+        self.logger.info(line)
+
+    def _format(self, now: float) -> str:
+        elapsed = max(now - self._started, 1e-9)
+        rate = self.done / elapsed
+        parts = "，".join(f"{name} {count}" for name, count in sorted(self.counts.items()))
+        line = f"{self.label}进度 {self.done}/{self.total}"
+        if self.total:
+            line += f" ({self.done / self.total * 100:.1f}%)"
+        line += f"，{parts}，{rate:.1f}/s"
+        if rate > 0 and self.total > self.done:
+            line += f"，预计剩余 {(self.total - self.done) / rate:.0f}s"
+        return line
+
+    def finish(self) -> None:
+        with self._lock:
+            line = self._format(self.clock())
+        self.logger.info(line.replace("进度", "完成", 1))
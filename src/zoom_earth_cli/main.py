@@ -1,32 +1,106 @@
-import typer
-from rich import print
-from rich.panel import Panel
 import logging
-from pathlib import Path
-from typing import List, Optional
+import threading
+import time
 import traceback
+from contextlib import contextmanager
 from datetime import datetime
-import traceback
+from pathlib import Path
+from typing import List, Optional
+
+import typer
 
-from zoom_earth_cli.ffmpeg import generate_timelapse
-from zoom_earth_cli.api_client import batch_download
-from zoom_earth_cli.blender import process_blend_core
-from zoom_earth_cli.const import get_satellite_tile_range, get_bound_tile_range, calculate_canvas_size, COUNTRY_BOUNDS, SATELLITE_OFFSETS
-from zoom_earth_cli.concat import process_concat_core
+# 模块顶层只导入标准库、typer 与纯 Python 常量：requests/PIL/numpy/rich 及各阶段模块
+# 都在对应命令内部导入，`zec --help` 与简单命令不必为用不到的依赖付出启动时间
+from zoom_earth_cli.const import (
+    COUNTRY_BOUNDS,
+    DEFAULT_MISS_BUDGET,
+    DEFAULT_OVERLAP_MARGIN,
+    PREVIEW_SCALES,
+    SATELLITE_BOUNDS,
+    get_satellite_tile_range,
+    region_canvas,
+)
 
 app = typer.Typer(help="Zoom Earth CLI")
 
-# 配置日志格式
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('zoom_earth.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+
+@app.callback()
+def main_callback(
+    ctx: typer.Context,
+    report_dir: str = typer.Option("reports", "--report-dir", help="运行报告（JSON）输出目录，默认当前目录下的 reports/"),
+    no_report: bool = typer.Option(False, "--no-report", help="不输出 JSON 运行报告"),
+    prometheus_file: Optional[str] = typer.Option(
+        None,
+        "--prometheus",
+        help="同时写出 Prometheus 文本格式指标（供 node_exporter textfile collector 采集）"
+    ),
+):
+    """每个命令结束时输出包含各阶段计数与耗时分布的运行报告"""
+    from zoom_earth_cli.logs import setup_logging
+    from zoom_earth_cli.metrics import write_run_report
+
+    # 日志在命令真正执行时才配置（--help 等不会创建日志文件与后台线程）：经由队列异步写入 zoom_earth.log 与终端
+    setup_logging()
+    started_at = time.time()
+
+    def _emit_report():
+        path = write_run_report(
+            ctx.invoked_subcommand or "zec",
+            started_at,
+            report_dir=None if no_report else report_dir,
+            prometheus_file=prometheus_file,
+        )
+        if path is not None:
+            logger.info(f"运行报告已写入: {path}")
+
+    ctx.call_on_close(_emit_report)
+
+
+@contextmanager
+def ffmpeg_progress():
+    """在终端实时显示 ffmpeg 编码进度（帧数、fps、速度、ETA）"""
+    from rich.progress import BarColumn, Progress, TextColumn
+
+    from zoom_earth_cli.ffmpeg import add_progress_hook, remove_progress_hook
+    from zoom_earth_cli.metrics import record_ffmpeg_progress
+
+    with Progress(
+        TextColumn("{task.description}"),
+        BarColumn(),
+        TextColumn("{task.completed} 帧"),
+        TextColumn("{task.fields[stats]}"),
+    ) as progress:
+        tasks = {}
+        lock = threading.Lock()
+
+        def _hook(snapshot):
+            with lock:
+                label = snapshot["label"] or "ffmpeg"
+                if label not in tasks:
+                    tasks[label] = progress.add_task(label, total=snapshot["total_frames"], stats="")
+                stats = f"{snapshot['fps']:.1f} fps"
+                if snapshot["speed"] is not None:
+                    stats += f" | {snapshot['speed']:.2f}x"
+                if snapshot["eta_seconds"] is not None:
+                    stats += f" | ETA {snapshot['eta_seconds']:.0f}s"
+                progress.update(tasks[label], completed=snapshot["frame"], stats=stats)
+
+        add_progress_hook(_hook)
+        add_progress_hook(record_ffmpeg_progress)
+        try:
+            yield
+        finally:
+            remove_progress_hook(_hook)
+            remove_progress_hook(record_ffmpeg_progress)
+
+
+def _validate_preview(value: Optional[int]) -> Optional[int]:
+    if value is not None and value not in PREVIEW_SCALES:
+        raise typer.BadParameter(f"预览缩放只支持 {'/'.join(map(str, PREVIEW_SCALES))}")
+    return value
+
 @app.command(name="process-video")
 def process_video(
     input_dir: str = typer.Option(
@@ -42,9 +116,42 @@ def process_video(
         "--hours", "-h",
         min=1,
         help="视频时间跨度（小时）"
+    ),
+    segment_cache: Optional[str] = typer.Option(
+        None,
+        "--segment-cache",
+        help="分段缓存目录：按时间对齐分段编码，刷新时只重新编码变化的分段"
+    ),
+    segment_minutes: int = typer.Option(
+        60,
+        "--segment-minutes",
+        min=1,
+        help="分段时长（分钟），默认60"
+    ),
+    jobs: int = typer.Option(
+        1,
+        "--jobs", "-j",
+        min=1,
+        help="并行编码的 ffmpeg 进程数，默认1"
+    ),
+    chunk_frames: Optional[int] = typer.Option(
+        None,
+        "--chunk-frames",
+        min=1,
+        help="并行编码时每块的帧数，默认按进程数均分"
+    ),
+    renditions: Optional[List[str]] = typer.Option(
+        None,
+        "--rendition",
+        help="输出档位，可重复指定：full/1080p/720p/540p/webp/hls-<档位>，一次解码输出全部档位"
     )
 ):
     """生成卫星延时视频（自动命名输出文件）"""
+    from rich import print
+    from rich.table import Table
+
+    from zoom_earth_cli.ffmpeg import generate_timelapse
+
     try:
         # 生成带时间戳的输出文件名
         output_dir = Path("output_videos")
@@ -53,16 +160,36 @@ def process_video(
         output_file = output_dir / f"timelapse_{timestamp}.mp4"
 
         # 调用生成逻辑
-        generate_timelapse(
-            input_dir=input_dir,
-            output_file=str(output_file),
-            duration_hours=duration,
-            start_time=None,    # 自动获取最新时间
-            framerate=30        # 固定默认帧率
-        )
+        with ffmpeg_progress():
+            chunk_report = generate_timelapse(
+                input_dir=input_dir,
+                output_file=str(output_file),
+                duration_hours=duration,
+                start_time=None,    # 自动获取最新时间
+                framerate=30,       # 固定默认帧率
+                segment_cache_dir=segment_cache,
+                segment_minutes=segment_minutes,
+                jobs=jobs,
+                chunk_frames=chunk_frames,
+                renditions=renditions
+            )
 
-        typer.echo(f"\n[成功] 视频已生成至: {output_file}", err=True)
+        if chunk_report:
+            table = Table(title="分块编码耗时")
+            for column in ("块", "帧数", "耗时(s)", "fps"):
+                table.add_column(column, justify="right")
+            for item in chunk_report:
+                table.add_row(str(item["chunk"]), str(item["frames"]), f"{item['seconds']:.1f}", f"{item['fps']:.1f}")
+            print(table)
 
+        if renditions:
+            typer.echo(f"\n[成功] 已生成档位 {', '.join(renditions)} 至: {output_dir}", err=True)
+        else:
+            typer.echo(f"\n[成功] 视频已生成至: {output_file}", err=True)
+
+    except KeyboardInterrupt:
+        typer.secho("已取消编码", fg=typer.colors.YELLOW, err=True)
+        raise typer.Exit(code=130)
     except Exception as e:
         typer.secho(f"生成失败: {str(e)}", fg=typer.colors.RED, err=True)
         raise typer.Exit(code=1)
@@ -91,8 +218,8 @@ def blend(
     zoom_level: int = typer.Option(
         4,
         "--zoom", "-z",
-        min=4, max=5,
-        help="zoom级别 (4或5)，默认4"
+        min=4, max=7,
+        help="zoom级别 (4-7)，默认4；6 及以上建议配合 --block-rows 分块处理"
     ),
     hours: int = typer.Option(
         0,
@@ -100,21 +227,80 @@ def blend(
         min=0,
         help="仅处理最新N小时内的数据（0表示不限制），默认0小时"
     ),
+    workers: int = typer.Option(
+        1,
+        "--workers", "-w",
+        min=1,
+        help="并行混合进程数（1 表示单进程），默认1"
+    ),
+    mode: str = typer.Option(
+        "lighter",
+        "--mode", "-m",
+        help="混合模式: lighter（取较亮值）/ feather（接缝羽化）/ priority（每列取单一卫星），默认lighter"
+    ),
+    video_file: Optional[str] = typer.Option(
+        None,
+        "--video",
+        help="混合帧直接通过管道编码为该视频文件，不写中间PNG"
+    ),
+    tee: bool = typer.Option(
+        False,
+        "--tee/--no-tee",
+        help="配合--video使用：编码的同时将混合帧保存到输出目录"
+    ),
+    block_rows: Optional[int] = typer.Option(
+        None,
+        "--block-rows",
+        min=16,
+        help="按N行条带分块混合并流式写出PNG，内存占用与画布大小无关（zoom 6+ 配合 npy 拼接图使用）"
+    ),
+    preview: Optional[int] = typer.Option(
+        None,
+        "--preview",
+        callback=_validate_preview,
+        help="预览模式：读取/写入 previews/1-N/ 下的平行目录，按 1/N 缩放（N=2/4/8）"
+    ),
 ) -> None:
     """
     扫描mosaics，为每个唯一时间戳生成一个混合图像。
     图像按时间倒序生成，如果卫星在某个时间点无数据，则使用其之前最新的数据。
-    使用 'lighter' 模式混合，并根据预设X偏移量放置。
+    默认使用 'lighter' 模式混合（可通过--mode切换），并根据预设X偏移量放置。
     可通过--hours参数限制只处理最近N小时的数据。
     """
-    country_bounds = COUNTRY_BOUNDS[country]
-    c_x_range, c_y_range = get_bound_tile_range(zoom=zoom_level, bound=country_bounds)
-    print(f"国家: {country} | X范围: {c_x_range} | Y范围: {c_y_range}")
-    canvas_width, canvas_height = calculate_canvas_size(c_y_range, c_x_range)
+    from rich import print
+
+    from zoom_earth_cli.blender import process_blend_core, process_blend_stream
+    from zoom_earth_cli.utils import preview_dir
+
+    if country != "global" and country not in COUNTRY_BOUNDS:
+        raise typer.BadParameter(f"国家 '{country}' 不在预定义列表中，可选: global, {', '.join(COUNTRY_BOUNDS)}")
+    canvas_width, canvas_height, satellite_offsets = region_canvas(country, zoom_level)
+    print(f"区域: {country} | zoom: {zoom_level} | 画布: {canvas_width}x{canvas_height} | 偏移: {satellite_offsets}")
 
     # 拼接 mosaics_dir 和 country
     mosaics_dir = str(Path(mosaics_dir) / country)
     output_filename = str(Path(output_filename) / country)
+    tile_size = 256
+    if preview:
+        mosaics_dir = preview_dir(mosaics_dir, preview)
+        output_filename = preview_dir(output_filename, preview)
+        canvas_width, canvas_height, tile_size = canvas_width // preview, canvas_height // preview, 256 // preview
+    if video_file:
+        with ffmpeg_progress():
+            process_blend_stream(
+                mosaics_dir=mosaics_dir,
+                output_file=video_file,
+                hours=hours,
+                canvas_width=canvas_width,
+                canvas_height=canvas_height,
+                satellite_offsets=satellite_offsets,
+                logger=logger,
+                zoom_level=zoom_level,
+                mode=mode,
+                tee_dir=output_filename if tee else None,
+                tile_size=tile_size,
+            )
+        return
     process_blend_core(
         canvas_height=canvas_height,
         canvas_width=canvas_width,
@@ -122,8 +308,12 @@ def blend(
         output_base_dir=output_filename,
         hours=hours,
         logger=logger,
-        satellite_offsets=SATELLITE_OFFSETS.get(country, SATELLITE_OFFSETS["default"]),
+        satellite_offsets=satellite_offsets,
         zoom_level=zoom_level,
+        workers=workers,
+        mode=mode,
+        block_rows=block_rows,
+        tile_size=tile_size,
     )
 
 
@@ -152,24 +342,94 @@ def process_blend(
         False,
         "--overwrite",
         help="强制覆盖已存在的输出文件"
-    )
+    ),
+    zoom_level: int = typer.Option(
+        4,
+        "--zoom", "-z",
+        min=4, max=7,
+        help="zoom级别 (4-7)，默认4；6 及以上建议配合 --block-rows 分块处理"
+    ),
+    workers: int = typer.Option(
+        1,
+        "--workers", "-w",
+        min=1,
+        help="并行混合进程数（1 表示单进程），默认1"
+    ),
+    mode: str = typer.Option(
+        "lighter",
+        "--mode", "-m",
+        help="混合模式: lighter（取较亮值）/ feather（接缝羽化）/ priority（每列取单一卫星），默认lighter"
+    ),
+    video_file: Optional[str] = typer.Option(
+        None,
+        "--video",
+        help="混合帧直接通过管道编码为该视频文件，不写中间PNG"
+    ),
+    tee: bool = typer.Option(
+        False,
+        "--tee/--no-tee",
+        help="配合--video使用：编码的同时将混合帧保存到输出目录"
+    ),
+    block_rows: Optional[int] = typer.Option(
+        None,
+        "--block-rows",
+        min=16,
+        help="按N行条带分块混合并流式写出PNG，内存占用与画布大小无关（zoom 6+ 配合 npy 拼接图使用）"
+    ),
+    preview: Optional[int] = typer.Option(
+        None,
+        "--preview",
+        callback=_validate_preview,
+        help="预览模式：读取/写入 previews/1-N/ 下的平行目录，按 1/N 缩放（N=2/4/8）"
+    ),
 ) -> None:
     """
     扫描mosaics，为每个唯一时间戳生成一个混合图像。
     图像按时间倒序生成，如果卫星在某个时间点无数据，则使用其之前最新的数据。
-    使用 'lighter' 模式混合，并根据预设X偏移量放置。
+    默认使用 'lighter' 模式混合（可通过--mode切换），并根据预设X偏移量放置。
     可通过--hours参数限制只处理最近N小时的数据。
     """
+    from rich import print
+
+    from zoom_earth_cli.blender import process_blend_core, process_blend_stream
+    from zoom_earth_cli.utils import preview_dir
+
+    canvas_width, canvas_height, satellite_offsets = region_canvas("global", zoom_level)
+    tile_size = 256
+    if preview:
+        mosaics_dir = preview_dir(mosaics_dir, preview)
+        output_filename = preview_dir(output_filename, preview)
+        canvas_width, canvas_height, tile_size = canvas_width // preview, canvas_height // preview, 256 // preview
+    if video_file:
+        with ffmpeg_progress():
+            process_blend_stream(
+                mosaics_dir=mosaics_dir,
+                output_file=video_file,
+                hours=hours,
+                canvas_width=canvas_width,
+                canvas_height=canvas_height,
+                satellite_offsets=satellite_offsets,
+                logger=logger,
+                zoom_level=zoom_level,
+                mode=mode,
+                tee_dir=output_filename if tee else None,
+                tile_size=tile_size,
+            )
+        return
     process_blend_core(
-        canvas_height=2048,
-        canvas_width=4096,
+        canvas_height=canvas_height,
+        canvas_width=canvas_width,
         mosaics_dir=mosaics_dir,
         output_base_dir=output_filename,
         hours=hours,
         logger=logger,
-        satellite_offsets=SATELLITE_OFFSETS["global"],
-        zoom_level=4,
-        overwrite=overwrite
+        satellite_offsets=satellite_offsets,
+        zoom_level=zoom_level,
+        overwrite=overwrite,
+        workers=workers,
+        mode=mode,
+        block_rows=block_rows,
+        tile_size=tile_size
     )
 
 
@@ -199,10 +459,33 @@ def process_concat(
         min=0,
         help="仅处理最新N小时内的数据（0表示不限制），默认2小时"
     ),
+    ownership_margin: Optional[int] = typer.Option(
+        None,
+        "--ownership-margin",
+        min=0,
+        help="按卫星归属表只拼接有贡献的瓦片，数值为接缝两侧保留的重叠列数（应与下载时一致）"
+    ),
+    output_format: str = typer.Option(
+        "png",
+        "--format",
+        help="拼接图格式: png / npy（逐瓦片写入内存映射文件，适合 zoom 6+ 大画布）"
+    ),
+    preview: Optional[int] = typer.Option(
+        None,
+        "--preview",
+        callback=_validate_preview,
+        help="快速预览：JPEG 按 1/N 缩放解码（N=2/4/8），结果写入 previews/1-N/ 下的平行目录"
+    ),
 ):
     """
     卫星图片拼接命令行工具
     """
+    from zoom_earth_cli.concat import process_concat_core
+    from zoom_earth_cli.utils import preview_dir
+
+    if preview:
+        tile_size = tile_size // preview
+        output_dir = preview_dir(output_dir, preview)
     process_concat_core(
         input_dir=input_dir,
         output_dir=output_dir,
@@ -211,7 +494,9 @@ def process_concat(
         show_coords=show_coords,
         satellites=satellites,
         hours=hours,
-        logger=logger
+        logger=logger,
+        ownership_margin=ownership_margin,
+        output_format=output_format
     )
 
 
@@ -237,16 +522,34 @@ def process_from_api(
     zoom: int = typer.Option(
         4,
         "--zoom", "-z",
-        min=4, max=5,
-        help="zoom级别 (4或5)，默认4"
+        min=4, max=7,
+        help="zoom级别 (4-7)，默认4；6 及以上建议配合 --block-rows 分块处理"
     ),
     country: str = typer.Option(
         None,
         "--country",
         help="按国家边界筛选（可选: usa, canada, china, india, brazil, australia, russia, japan, france, germany）"
+    ),
+    coverage_file: Optional[str] = typer.Option(
+        None,
+        "--coverage",
+        help="区域轮廓 GeoJSON 文件：按 --country 的多边形精确筛选瓦片，代替矩形边界",
+        exists=True,
+        dir_okay=False
+    ),
+    ownership_margin: Optional[int] = typer.Option(
+        None,
+        "--ownership-margin",
+        min=0,
+        help="按卫星归属表只下载对合成有贡献的瓦片，数值为接缝两侧保留的重叠列数（如 1）"
     )
 ):
     """主流程（支持卫星选择、时间过滤和国家边界筛选）"""
+    from rich import print
+    from rich.panel import Panel
+
+    from zoom_earth_cli.api_client import batch_download
+
     try:
         # 构建日志信息
         log_info = [
@@ -262,7 +565,9 @@ def process_from_api(
             satellites=satellites,
             hours=hours,
             zoom=zoom,
-            country=country
+            country=country,
+            coverage_file=coverage_file,
+            ownership_margin=ownership_margin
         )
         print(Panel("[bold green]所有任务完成![/]", title="完成通知"))
     except ValueError as e:
@@ -275,8 +580,442 @@ def process_from_api(
         print(Panel(f"[bold red]API 处理错误: {str(e)}[/]", title="严重错误"))
 
 
+@app.command(name="run")
+def run(
+    satellites: Optional[List[str]] = typer.Option(
+        None,
+        "--satellites", "-s",
+        help="选择卫星列表，默认全部卫星"
+    ),
+    hours: int = typer.Option(1, "--hours", "-h", min=0, help="仅处理最新N小时内的数据（0表示不限制），默认1小时"),
+    zoom: int = typer.Option(4, "--zoom", "-z", min=4, max=7, help="zoom级别 (4-7)，默认4"),
+    country: Optional[str] = typer.Option(None, "--country", help="按国家边界筛选，默认全球"),
+    coverage_file: Optional[str] = typer.Option(
+        None,
+        "--coverage",
+        help="区域轮廓 GeoJSON 文件：按 --country 的多边形精确筛选瓦片",
+        exists=True,
+        dir_okay=False
+    ),
+    ownership_margin: Optional[int] = typer.Option(
+        None,
+        "--ownership-margin",
+        min=0,
+        help="按卫星归属表只下载、拼接有贡献的瓦片，数值为接缝两侧保留的重叠列数"
+    ),
+    concurrency: int = typer.Option(10, "--concurrency", "-c", min=1, max=20, help="并发下载线程数 (1-20)"),
+    concat_workers: int = typer.Option(2, "--concat-workers", min=1, help="并行拼接线程数，默认2"),
+    mode: str = typer.Option(
+        "lighter",
+        "--mode", "-m",
+        help="混合模式: lighter / feather / priority，默认lighter"
+    ),
+    video_file: Optional[str] = typer.Option(None, "--video", help="混合帧直接通过管道编码为该视频文件"),
+    write_frames: bool = typer.Option(
+        True,
+        "--frames/--no-frames",
+        help="配合--video使用：是否同时把混合帧写入 lighter_blend/<区域>/"
+    ),
+    queue_size: int = typer.Option(4, "--queue-size", min=1, help="阶段间队列容量（帧数），下游跟不上时上游暂停"),
+):
+    """
+    下载 → 拼接 → 混合 → 编码 在同一进程中流水线执行：每帧瓦片下载完即拼接，
+    所需卫星的拼接图就绪即混合并送入编码器，各阶段经有界队列重叠运行
+    """
+    from rich import print
+    from rich.panel import Panel
+
+    from zoom_earth_cli.pipeline import FramePipeline
+
+    if country is not None and country not in COUNTRY_BOUNDS and not coverage_file:
+        raise typer.BadParameter(f"国家 '{country}' 不在预定义列表中，可选: {list(COUNTRY_BOUNDS.keys())}")
+    pipeline = FramePipeline(
+        region=country,
+        zoom=zoom,
+        logger=logger,
+        satellites=satellites,
+        hours=hours,
+        concurrency=concurrency,
+        concat_workers=concat_workers,
+        coverage_file=coverage_file,
+        ownership_margin=ownership_margin,
+        mode=mode,
+        video_file=video_file,
+        write_frames=write_frames,
+        queue_size=queue_size,
+    )
+    try:
+        if video_file:
+            with ffmpeg_progress():
+                stats = pipeline.run()
+        else:
+            stats = pipeline.run()
+    except KeyboardInterrupt:
+        typer.secho("已取消流水线", fg=typer.colors.YELLOW, err=True)
+        raise typer.Exit(code=130)
+    except Exception as e:
+        typer.secho(f"流水线失败: {e}", fg=typer.colors.RED, err=True)
+        raise typer.Exit(code=1)
+    summary = (
+        f"下载 {stats['download_frames']} 帧（失败瓦片 {stats['failed_tiles']}），拼接 {stats['mosaics']} 张，"
+        f"混合 {stats['blended']} 帧 / 引用 {stats['linked']} 帧 / 已存在 {stats['skipped']} 帧"
+    )
+    if stats["claimed_elsewhere"]:
+        summary += f"，其他进程生成 {stats['claimed_elsewhere']} 帧"
+    if video_file:
+        summary += f"，编码 {stats['encoded']} 帧至 {video_file}"
+    print(Panel(summary, title="流水线完成"))
+
+
+@app.command(name="coverage")
+def coverage(
+    geojson: str = typer.Option(..., "--geojson", "-g", help="区域轮廓 GeoJSON 文件", exists=True, dir_okay=False),
+    country: str = typer.Option(..., "--country", "-c", help="区域名称（GeoJSON 中的名称或 ISO 代码）"),
+    zooms: List[int] = typer.Option([4, 5], "--zoom", "-z", help="zoom级别，可重复指定"),
+):
+    """对比多边形覆盖与矩形边界的瓦片数量，并预先生成覆盖缓存"""
+    from rich import print
+    from rich.table import Table
+
+    from zoom_earth_cli.coverage import bound_tiles, get_region_tiles
+
+    table = Table(title=f"{country} 瓦片覆盖")
+    for column in ("zoom", "多边形", "矩形", "节省"):
+        table.add_column(column, justify="right")
+    for zoom in zooms:
+        tiles = get_region_tiles(geojson, country, zoom)
+        rect = len(bound_tiles(zoom, COUNTRY_BOUNDS[country])) if country in COUNTRY_BOUNDS else 0
+        saved = f"{(1 - len(tiles) / rect) * 100:.1f}%" if rect else "-"
+        table.add_row(str(zoom), str(len(tiles)), str(rect or "-"), saved)
+    print(table)
+
+
+@app.command(name="ownership")
+def ownership(
+    zoom: int = typer.Option(4, "--zoom", "-z", min=1, help="zoom级别"),
+    margin: int = typer.Option(DEFAULT_OVERLAP_MARGIN, "--margin", "-m", min=0, help="接缝两侧保留的重叠列数"),
+    satellites: Optional[List[str]] = typer.Option(
+        None,
+        "--satellites", "-s",
+        help="参与合成的卫星，默认全部卫星"
+    ),
+):
+    """显示各卫星在归属表中需要下载的瓦片数量"""
+    from rich import print
+    from rich.table import Table
+
+    from zoom_earth_cli.ownership import build_ownership
+
+    table_map = build_ownership(zoom, tuple(sorted(satellites or SATELLITE_BOUNDS)), margin)
+    table = Table(title=f"zoom {zoom} 卫星瓦片归属（margin={margin}）")
+    for column in ("卫星", "归属瓦片", "完整范围", "节省"):
+        table.add_column(column, justify="right")
+    for satellite, (owned, full) in table_map.summary().items():
+        table.add_row(satellite, str(owned), str(full), f"{(1 - owned / full) * 100:.1f}%" if full else "-")
+    print(table)
+
+
+@app.command(name="prefetch")
+def prefetch(
+    satellites: Optional[List[str]] = typer.Option(
+        None,
+        "--satellites", "-s",
+        help="选择卫星列表，默认全部卫星"
+    ),
+    zoom: int = typer.Option(4, "--zoom", "-z", min=4, max=7, help="zoom级别，默认4"),
+    country: Optional[str] = typer.Option(None, "--country", help="按国家边界筛选，默认全球"),
+    minutes: int = typer.Option(60, "--minutes", "-m", min=1, help="运行时长（分钟），默认60"),
+    miss_budget: int = typer.Option(DEFAULT_MISS_BUDGET, "--miss-budget", min=1, help="每个预测帧允许的探测失败次数"),
+    rps: float = typer.Option(5.0, "--rps", min=0.1, help="下载请求速率（次/秒），均匀分摊请求"),
+    concurrency: int = typer.Option(5, "--concurrency", "-c", min=1, max=20, help="并发下载线程数"),
+):
+    """根据历史发布节奏预测各卫星下一帧，发布后第一时间预取瓦片"""
+    from rich import print
+    from rich.panel import Panel
+    from rich.table import Table
+
+    from zoom_earth_cli.api_client import download_tile, fetch_latest_times
+    from zoom_earth_cli.prefetch import PrefetchScheduler, learn_cadence, load_times_history, plan_prefetch_tiles
+
+    if country is not None and country not in COUNTRY_BOUNDS:
+        raise typer.BadParameter(f"国家 '{country}' 不在预定义列表中，可选: {list(COUNTRY_BOUNDS.keys())}")
+    # 先拉取一次时间列表（同时写入历史），保证模型从当前最新帧开始
+    fetch_latest_times()
+    models = learn_cadence(load_times_history())
+    if satellites:
+        models = {sat: model for sat, model in models.items() if sat in satellites}
+    if not models:
+        typer.secho("时间历史不足，无法学习发布节奏（需要至少两帧）", fg=typer.colors.RED, err=True)
+        raise typer.Exit(code=1)
+
+    table = Table(title="卫星发布节奏")
+    for column in ("卫星", "帧间隔", "发布延迟", "最新帧", "预计下一帧可用"):
+        table.add_column(column, justify="right")
+    for sat, model in sorted(models.items()):
+        table.add_row(
+            sat, f"{model.cadence // 60} 分钟", f"{model.latency / 60:.1f} 分钟",
+            datetime.fromtimestamp(model.latest).strftime("%H:%M"),
+            datetime.fromtimestamp(model.expected_available_at).strftime("%H:%M:%S"),
+        )
+    print(table)
+
+    country_name = country or "global"
+    tiles = {sat: plan_prefetch_tiles(sat, zoom, country) for sat in models}
+    scheduler = PrefetchScheduler(
+        models,
+        tiles,
+        fetch_tile=lambda sat, ts, x, y: download_tile(country_name, sat, ts, x, y, zoom)[0],
+        refresh_times=fetch_latest_times,
+        miss_budget=miss_budget,
+        requests_per_second=rps,
+        concurrency=concurrency,
+        logger=logger,
+    )
+    try:
+        stats = scheduler.run(minutes * 60)
+    except KeyboardInterrupt:
+        stats = scheduler.stats
+    print(Panel(
+        f"预取 {stats['frames']} 帧 / {stats['tiles']} 个瓦片，探测未命中 {stats['misses']} 次，重新对齐 {stats['resyncs']} 次",
+        title="预取结束"
+    ))
+
+
+@app.command(name="verify")
+def verify(
+    input_dir: str = typer.Option(
+        "downloads",
+        "--input", "-i",
+        help="要校验的瓦片目录",
+        exists=True,
+        file_okay=False,
+        dir_okay=True
+    ),
+    quarantine_dir: str = typer.Option(
+        "quarantine",
+        "--quarantine", "-q",
+        help="损坏瓦片的隔离目录（保持原相对路径）"
+    ),
+    dry_run: bool = typer.Option(False, "--dry-run", help="只报告，不移动文件"),
+    workers: int = typer.Option(8, "--workers", "-w", min=1, help="并行校验线程数，默认8"),
+):
+    """并行校验已下载瓦片的 JPEG 结构，隔离截断或非图片内容的文件，以便重新下载"""
+    from rich import print
+    from rich.panel import Panel
+    from rich.table import Table
+
+    from zoom_earth_cli.validation import verify_store
+
+    result = verify_store(
+        input_dir,
+        quarantine_dir=None if dry_run else quarantine_dir,
+        workers=workers,
+        logger=logger
+    )
+    table = Table(title=f"瓦片校验: {input_dir}")
+    table.add_column("原因")
+    table.add_column("数量", justify="right")
+    for reason, count in sorted(result["reasons"].items(), key=lambda item: -item[1]):
+        table.add_row(reason, str(count))
+    if result["reasons"]:
+        print(table)
+    print(Panel(
+        f"已检查 {result['checked']} 个瓦片，损坏 {result['corrupt']} 个，已隔离 {result['quarantined']} 个",
+        title="校验完成"
+    ))
+
+
+@app.command(name="serve")
+def serve(
+    country: str = typer.Option("global", "--country", "-c", help="区域名称（对应 lighter_blend/<区域> 与 mosaics/<区域>）"),
+    zoom: int = typer.Option(4, "--zoom", "-z", min=4, max=7, help="存储画布的 zoom 级别，默认4"),
+    host: str = typer.Option("127.0.0.1", "--host", help="监听地址"),
+    port: int = typer.Option(8000, "--port", "-p", min=1, max=65535, help="监听端口，默认8000"),
+    blend_dir: str = typer.Option("lighter_blend", "--blend-dir", help="混合帧根目录"),
+    mosaics_dir: str = typer.Option("mosaics", "--mosaics-dir", help="单星拼接图根目录"),
+    cache_mb: int = typer.Option(256, "--cache-mb", min=1, help="已编码瓦片的 LRU 缓存上限（MB）"),
+    canvas_cache_mb: int = typer.Option(256, "--canvas-cache-mb", min=1, help="解码后画布的 LRU 缓存上限（MB）"),
+    workers: int = typer.Option(4, "--workers", "-w", min=1, help="切片线程数，默认4"),
+):
+    """
+    本地 XYZ 瓦片服务：按需从混合帧/单星拼接图切出 /{时间戳}/{z}/{x}/{y}.png，
+    单星瓦片为 /{卫星}/{时间戳}/{z}/{x}/{y}.png，时间戳可用 latest
+    """
+    import asyncio
+
+    from zoom_earth_cli.server import TileServer
+
+    server = TileServer(
+        region=country,
+        zoom=zoom,
+        blend_dir=blend_dir,
+        mosaics_dir=mosaics_dir,
+        cache_bytes=cache_mb * 1024 * 1024,
+        canvas_cache_bytes=canvas_cache_mb * 1024 * 1024,
+        workers=workers,
+        logger=logger,
+    )
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        logger.info(f"瓦片服务已停止（缓存命中 {server.tiles.hits} 次，未命中 {server.tiles.misses} 次）")
+    finally:
+        server.close()
+
+
+@app.command(name="pyramid")
+def pyramid(
+    country: str = typer.Option("global", "--country", "-c", help="区域名称（对应 lighter_blend/<区域>）"),
+    zoom: int = typer.Option(4, "--zoom", "-z", min=4, max=7, help="混合帧的 zoom 级别，默认4"),
+    min_zoom: int = typer.Option(0, "--min-zoom", min=0, help="金字塔最低 zoom 级别，默认0"),
+    blend_dir: str = typer.Option("lighter_blend", "--input", "-i", help="混合帧根目录"),
+    output_dir: str = typer.Option("pyramid", "--output", "-o", help="金字塔输出根目录"),
+    hours: int = typer.Option(0, "--hours", "-h", min=0, help="仅处理最新N小时内的帧（0表示不限制）"),
+    workers: int = typer.Option(4, "--workers", "-w", min=1, help="并行写瓦片的进程数，默认4"),
+):
+    """为每个混合帧生成静态 XYZ 瓦片金字塔（<输出>/<区域>/<时间戳>/<z>/<x>/<y>.png），供上传 CDN"""
+    from rich import print
+    from rich.panel import Panel
+
+    from zoom_earth_cli.pyramid import build_pyramids
+
+    if min_zoom > zoom:
+        raise typer.BadParameter("--min-zoom 不能大于 --zoom")
+    stats = build_pyramids(
+        blend_dir=blend_dir,
+        output_dir=output_dir,
+        region=country,
+        zoom=zoom,
+        logger=logger,
+        min_zoom=min_zoom,
+        hours=hours,
+        workers=workers,
+    )
+    print(Panel(
+        f"新生成 {stats['frames']} 帧 / {stats['tiles']} 个瓦片，跳过透明瓦片 {stats['empty_tiles']} 个，"
+        f"已完成帧 {stats['skipped_frames']} 个",
+        title="金字塔生成完成"
+    ))
+
+
+@app.command(name="gc")
+def gc(
+    max_age: Optional[List[str]] = typer.Option(
+        None,
+        "--max-age",
+        help="按阶段的最长保留时间，可重复指定，如 downloads=2d mosaics=7d lighter_blend=30d（单位 s/m/h/d/w）"
+    ),
+    max_size: Optional[List[str]] = typer.Option(
+        None,
+        "--max-size",
+        help="按阶段的总大小上限，超出时从最旧开始删除，如 downloads=20G output_videos=500M"
+    ),
+    stages: Optional[List[str]] = typer.Option(
+        None,
+        "--stage",
+        help="只处理指定阶段（downloads/mosaics/lighter_blend/pyramid/output_videos/debug_output），默认全部"
+    ),
+    dry_run: bool = typer.Option(False, "--dry-run", help="只报告将要删除的内容，不删除"),
+    workers: int = typer.Option(8, "--workers", "-w", min=1, help="并行删除线程数，默认8"),
+    rescan: bool = typer.Option(False, "--rescan", help="忽略增量索引，重新统计全部单元"),
+    force: bool = typer.Option(False, "--force", help="不检查下游依赖（下游尚未生成的输入也会被删除）"),
+):
+    """
+    按各阶段的保留时间与总大小策略清理存储：瓦片帧在拼接图生成前、拼接图在混合帧生成前
+    （以及各卫星最新一张拼接图）不会被删除；增量索引避免每次逐文件遍历
+    """
+    from rich import print
+    from rich.panel import Panel
+    from rich.table import Table
+
+    from zoom_earth_cli.retention import STAGE_LAYOUTS, collect_garbage, parse_duration, parse_policies, parse_size
+
+    try:
+        age_policies = parse_policies(max_age, parse_duration)
+        size_policies = parse_policies(max_size, parse_size)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    unknown = [stage for stage in stages or [] if stage not in STAGE_LAYOUTS]
+    if unknown:
+        raise typer.BadParameter(f"未知阶段: {', '.join(unknown)}，可选: {', '.join(STAGE_LAYOUTS)}")
+    if not age_policies and not size_policies:
+        typer.secho("未指定 --max-age / --max-size，只统计各阶段占用", fg=typer.colors.YELLOW, err=True)
+
+    report = collect_garbage(
+        logger,
+        max_age=age_policies,
+        max_bytes=size_policies,
+        stages=stages,
+        dry_run=dry_run,
+        workers=workers,
+        rescan=rescan,
+        force=force,
+    )
+    table = Table(title="存储清理（预演）" if dry_run else "存储清理")
+    for column in ("阶段", "单元", "占用", "删除", "释放", "受保护", "剩余"):
+        table.add_column(column, justify="right")
+    for stage, row in report.items():
+        table.add_row(
+            stage, str(row["units"]), f"{row['bytes'] / 1024 ** 2:.1f} MB", str(row["deleted"]),
+            f"{row['reclaimed'] / 1024 ** 2:.1f} MB", str(row["protected"]), f"{row['remaining'] / 1024 ** 2:.1f} MB",
+        )
+    print(table)
+    reclaimed = sum(row["reclaimed"] for row in report.values())
+    print(Panel(f"{'可释放' if dry_run else '共释放'} {reclaimed / 1024 ** 2:.1f} MB", title="清理完成"))
+
+
+@app.command(name="archive")
+def archive(
+    older_than: str = typer.Option(
+        "7d",
+        "--older-than",
+        help="把整天都早于该时长的数据写成日包（单位 s/m/h/d/w，纯数字按小时），默认7d"
+    ),
+    stages: Optional[List[str]] = typer.Option(
+        None,
+        "--stage",
+        help="只归档指定阶段（downloads/mosaics/lighter_blend），默认全部"
+    ),
+    dry_run: bool = typer.Option(False, "--dry-run", help="只统计可归档的天数与文件，不写包"),
+    workers: int = typer.Option(4, "--workers", "-w", min=1, help="并行打包的天数，默认4"),
+):
+    """
+    按天把旧的瓦片、拼接图和混合帧写成 <日期>.zpk 日包（带条目索引，JPEG/PNG 原样存储，npy 压缩），
+    删除原目录；concat / blend / video 按条目偏移直接读取，无需解包
+    """
+    from rich import print
+    from rich.panel import Panel
+    from rich.table import Table
+
+    from zoom_earth_cli.archive import ARCHIVE_STAGES, archive_frames
+    from zoom_earth_cli.retention import parse_duration
+
+    try:
+        threshold = parse_duration(older_than)
+    except ValueError:
+        raise typer.BadParameter(f"无法解析时长: {older_than}")
+    unknown = [stage for stage in stages or [] if stage not in ARCHIVE_STAGES]
+    if unknown:
+        raise typer.BadParameter(f"未知阶段: {', '.join(unknown)}，可选: {', '.join(ARCHIVE_STAGES)}")
+
+    report = archive_frames(logger, threshold, stages=stages, dry_run=dry_run, workers=workers)
+    table = Table(title="按天归档（预演）" if dry_run else "按天归档")
+    for column in ("阶段", "天数", "文件", "原始大小", "日包大小"):
+        table.add_column(column, justify="right")
+    for stage, row in report.items():
+        table.add_row(
+            stage, str(row["days"]), str(row["files"]), f"{row['bytes'] / 1024 ** 2:.1f} MB",
+            "-" if dry_run else f"{row['packed'] / 1024 ** 2:.1f} MB",
+        )
+    print(table)
+    files = sum(row["files"] for row in report.values())
+    print(Panel(f"{'可归档' if dry_run else '已归档'} {files} 个文件", title="归档完成"))
+
+
 @app.command(name="test")
 def test():
+    from rich import print
+
     x_range, y_range = get_satellite_tile_range(zoom=4, satellite="himawari")
     print(f"X Range: {x_range}")
     print(f"Y Range: {y_range}")
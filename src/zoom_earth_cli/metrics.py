@@ -0,0 +1,239 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# 指标名统一前缀，便于在 Prometheus 中区分
+METRIC_PREFIX = "zec_"
+# 延迟直方图默认分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 每个直方图保留的样本数上限（蓄水池抽样），用于在 JSON 报告中估计分位数
+RESERVOIR_SIZE = 2048
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Histogram:
+    """累计分桶计数（Prometheus 语义）+ 有界样本蓄水池（估计 p50/p95）"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self._samples: List[float] = []
+        self._random = random.Random(0)
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        if index < len(self.bucket_counts):
+            self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self._samples) < RESERVOIR_SIZE:
+            self._samples.append(value)
+        else:
+            slot = self._random.randrange(self.count)
+            if slot < RESERVOIR_SIZE:
+                self._samples[slot] = value
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+class MetricsRegistry:
+    """
+    进程内指标：计数器、瞬时值与延迟直方图，按 (指标名, 标签) 区分，线程安全。
+    运行结束时输出 JSON 报告，或写成 node_exporter textfile collector 可读取的 Prometheus 文本。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """记录代码块耗时（秒）到直方图"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(name, {}).get(_label_key(labels))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> Dict[str, List[dict]]:
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(key), "value": value}
+                    for name, series in sorted(self._counters.items()) for key, value in sorted(series.items())
+                ],
+                "gauges": [
+                    {"name": name, "labels": dict(key), "value": value}
+                    for name, series in sorted(self._gauges.items()) for key, value in sorted(series.items())
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(key), **hist.summary()}
+                    for name, series in sorted(self._histograms.items()) for key, hist in sorted(series.items())
+                ],
+            }
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+
+        def _labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = key + extra
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+        def _header(name: str, kind: str) -> None:
+            if name in self._help:
+                lines.append(f"# HELP {METRIC_PREFIX}{name} {self._help[name]}")
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                _header(name, "counter")
+                lines.extend(f"{METRIC_PREFIX}{name}{_labels(key)} {_format_value(value)}" for key, value in sorted(series.items()))
+            for name, series in sorted(self._gauges.items()):
+                _header(name, "gauge")
+                lines.extend(f"{METRIC_PREFIX}{name}{_labels(key)} {_format_value(value)}" for key, value in sorted(series.items()))
+            for name, series in sorted(self._histograms.items()):
+                _header(name, "histogram")
+                for key, hist in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.bucket_counts):
+                        cumulative += count
+                        lines.append(f"{METRIC_PREFIX}{name}_bucket{_labels(key, (('le', f'{bound:g}'),))} {cumulative}")
+                    lines.append(f"{METRIC_PREFIX}{name}_bucket{_labels(key, (('le', '+Inf'),))} {hist.count}")
+                    lines.append(f"{METRIC_PREFIX}{name}_sum{_labels(key)} {_format_value(hist.sum)}")
+                    lines.append(f"{METRIC_PREFIX}{name}_count{_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+# 全局默认注册表：各阶段直接 `from zoom_earth_cli.metrics import metrics` 使用
+metrics = MetricsRegistry()
+
+
+def _atomic_write(path: Path, text: str) -> None:
+    # textfile collector 可能随时读取，必须先写临时文件再替换
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(path.name + ".tmp")
+    temp_path.write_text(text, encoding="utf-8")
+    os.replace(temp_path, path)
+
+
+def write_run_report(
+    command: str,
+    started_at: float,
+    report_dir: Optional[str] = "reports",
+    prometheus_file: Optional[str] = None,
+    registry: MetricsRegistry = metrics
+) -> Optional[Path]:
+    """
+    输出本次运行的 JSON 报告 <report_dir>/<命令>_<时间>.json，并可选写出 Prometheus 文本文件。
+    返回 JSON 报告路径（report_dir 为空时不写报告，返回 None）
+    """
+    finished_at = time.time()
+    if prometheus_file:
+        registry.set("run_duration_seconds", finished_at - started_at, command=command)
+        registry.set("run_finished_timestamp_seconds", finished_at, command=command)
+        _atomic_write(Path(prometheus_file), registry.to_prometheus())
+    if not report_dir:
+        return None
+    report = {
+        "command": command,
+        "argv": sys.argv[1:],
+        "started_at": datetime.fromtimestamp(started_at, timezone.utc).isoformat(),
+        "finished_at": datetime.fromtimestamp(finished_at, timezone.utc).isoformat(),
+        "duration_seconds": round(finished_at - started_at, 3),
+        "metrics": registry.snapshot(),
+    }
+    stamp = datetime.fromtimestamp(started_at).strftime("%Y%m%d_%H%M%S")
+    path = Path(report_dir) / f"{command}_{stamp}.json"
+    _atomic_write(path, json.dumps(report, indent=2, ensure_ascii=False))
+    return path
+
+
+def record_ffmpeg_progress(snapshot: dict) -> None:
+    """ffmpeg 进度回调：记录编码帧数与速度（见 ffmpeg.add_progress_hook）"""
+    label = snapshot.get("label") or "ffmpeg"
+    metrics.set("encode_frames", snapshot["frame"], label=label)
+    metrics.set("encode_fps", snapshot["fps"], label=label)
+    if snapshot.get("speed") is not None:
+        metrics.set("encode_speed_ratio", snapshot["speed"], label=label)
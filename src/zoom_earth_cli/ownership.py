@@ -0,0 +1,115 @@
+from functools import lru_cache
+from typing import Dict, FrozenSet, Tuple
+
+import numpy as np
+
+from zoom_earth_cli.const import DEFAULT_OVERLAP_MARGIN, SATELLITE_BOUNDS, get_satellite_tile_range
+
+# 各卫星星下点经度（度）
+SUB_SATELLITE_LONGITUDES = {
+    "goes-west": -137.2,
+    "goes-east": -75.2,
+    "mtg-zero": 0.0,
+    "msg-zero": 0.0,
+    "msg-iodc": 45.5,
+    "himawari": 140.7,
+}
+
+# 替补卫星 -> 主卫星：覆盖相同，混合时二者择一（见 blender.select_blend_sources），
+# 因此替补不参与归属竞争，直接沿用主卫星的归属
+ALTERNATES = {
+    "msg-zero": "mtg-zero",
+}
+
+
+class OwnershipMap:
+    """
+    某个 zoom 下每个瓦片 (x, y) 由哪些卫星提供最终画面。
+    坐标与 batch_download / download_tile 一致：x 为行，y 为列。
+    """
+
+    def __init__(self, zoom: int, satellites: Tuple[str, ...], mask: np.ndarray):
+        self.zoom = zoom
+        self.satellites = satellites
+        # mask[i, x, y]：卫星 satellites[i] 是否需要瓦片 (x, y)
+        self.mask = mask
+        self.mask.setflags(write=False)
+
+    def owners(self, x: int, y: int) -> Tuple[str, ...]:
+        return tuple(sat for i, sat in enumerate(self.satellites) if self.mask[i, x, y])
+
+    def owns(self, satellite: str, x: int, y: int) -> bool:
+        if satellite not in self.satellites:
+            return True
+        return bool(self.mask[self.satellites.index(satellite), x, y])
+
+    def tiles_for(self, satellite: str) -> FrozenSet[Tuple[int, int]]:
+        xs, ys = np.nonzero(self.mask[self.satellites.index(satellite)])
+        return frozenset(zip(xs.tolist(), ys.tolist()))
+
+    def summary(self) -> Dict[str, Tuple[int, int]]:
+        """每颗卫星 (归属瓦片数, 完整覆盖瓦片数)"""
+        result = {}
+        for sat in self.satellites:
+            rows, cols = get_satellite_tile_range(self.zoom, sat)
+            result[sat] = (len(self.tiles_for(sat)), len(rows) * len(cols))
+        return result
+
+
+def _coverage_mask(zoom: int, satellite: str) -> np.ndarray:
+    n = 2 ** zoom
+    mask = np.zeros((n, n), dtype=bool)
+    rows, cols = get_satellite_tile_range(zoom, satellite)
+    mask[rows.start:rows.stop, cols.start:cols.stop] = True
+    return mask
+
+
+@lru_cache(maxsize=32)
+def build_ownership(
+    zoom: int,
+    satellites: Tuple[str, ...],
+    margin: int = DEFAULT_OVERLAP_MARGIN
+) -> OwnershipMap:
+    """
+    按列计算归属：每列归覆盖它且星下点经度离列中心最近的卫星，
+    再把每颗卫星的归属区向两侧扩展 margin 列（不超出其覆盖范围）。
+    结果按 (zoom, 卫星组合, margin) 缓存。
+    """
+    n = 2 ** zoom
+    satellites = tuple(satellites)
+    unknown = [sat for sat in satellites if sat not in SATELLITE_BOUNDS]
+    if unknown:
+        raise ValueError(f"未知卫星: {unknown}，可选: {list(SATELLITE_BOUNDS)}")
+
+    coverage = np.stack([_coverage_mask(zoom, sat) for sat in satellites])
+    competing = [
+        i for i, sat in enumerate(satellites)
+        if ALTERNATES.get(sat) not in satellites
+    ]
+
+    # 列中心经度到星下点的环绕距离
+    lon = (np.arange(n) + 0.5) / n * 360.0 - 180.0
+    sub_lon = np.array([SUB_SATELLITE_LONGITUDES[satellites[i]] for i in competing])
+    distance = np.abs(lon[None, :] - sub_lon[:, None])
+    distance = np.minimum(distance, 360.0 - distance)
+    covered_cols = coverage[competing].any(axis=1)
+    distance[~covered_cols] = np.inf
+
+    primary = np.zeros((len(satellites), n), dtype=bool)
+    has_owner = np.isfinite(distance).any(axis=0)
+    owner = np.asarray(competing)[np.argmin(distance, axis=0)]
+    primary[owner[has_owner], np.nonzero(has_owner)[0]] = True
+
+    # 向两侧膨胀 margin 列
+    cols = primary.copy()
+    for shift in range(1, margin + 1):
+        cols[:, shift:] |= primary[:, :-shift]
+        cols[:, :-shift] |= primary[:, shift:]
+
+    for i, sat in enumerate(satellites):
+        main = ALTERNATES.get(sat)
+        if main in satellites:
+            cols[i] = cols[satellites.index(main)]
+
+    mask = coverage & cols[:, None, :]
+    return OwnershipMap(zoom, satellites, mask)
@@ -0,0 +1,436 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from zoom_earth_cli.api_client import download_tile, plan_download
+from zoom_earth_cli.blender import _save_canvas, link_frame, load_mosaic_array, select_blend_sources
+from zoom_earth_cli.compositor import BLEND_MODES, compose_frame
+from zoom_earth_cli.const import region_canvas
+from zoom_earth_cli.ffmpeg import encode_frame_stream
+from zoom_earth_cli.locking import ClaimSet, blend_claim_key, blend_claim_region, concat_claim_key
+from zoom_earth_cli.logs import ProgressReporter
+from zoom_earth_cli.metrics import metrics
+from zoom_earth_cli.ownership import build_ownership
+from zoom_earth_cli.timeline import TimelineIndex
+from zoom_earth_cli.utils import concat_tiles
+
+# 阶段间队列的默认容量（帧数）：下游跟不上时上游阻塞，积压的中间结果有上限
+DEFAULT_QUEUE_SIZE = 4
+# 每个下载线程最多预先提交的瓦片数，超过后先等最早的帧下载完成
+TILES_AHEAD_PER_WORKER = 4
+# 队列阻塞等待时检查停止标志的间隔（秒）
+POLL_INTERVAL = 0.2
+
+# 队列结束标记
+_DONE = object()
+
+
+class PipelineAborted(Exception):
+    """其他阶段出错或被中断，当前阶段停止"""
+
+
+def _frame_path(base: Path, zoom: int, ts: int, suffix: str = ".png") -> Path:
+    dt = datetime.fromtimestamp(ts, tz=timezone.utc)
+    return base / str(zoom) / dt.strftime("%Y-%m-%d") / f"{dt.strftime('%H%M')}{suffix}"
+
+
+def _tile_dir(zoom_dir: Path, ts: int) -> Path:
+    """downloads/<区域>/<卫星>/<zoom>/<日期>/<HHMM> 瓦片目录（与 download_tile 一致）"""
+    dt = datetime.fromtimestamp(ts, tz=timezone.utc)
+    return zoom_dir / dt.strftime("%Y-%m-%d") / dt.strftime("%H%M")
+
+
+def _save_and_release(claims: ClaimSet, canvas: np.ndarray, output_path: Path) -> None:
+    try:
+        _save_canvas(canvas, output_path)
+    finally:
+        claims.release(blend_claim_key(output_path))
+
+
+class FramePipeline:
+    """
+    下载 → 拼接 → 混合 → 编码 的进程内流水线，各阶段在独立线程中运行，经有界队列传递帧：
+    - 下载：按时间升序提交瓦片，某颗卫星一帧的瓦片全部完成（失败的重试一次）即交给拼接
+    - 拼接：线程池解码并拼接单星拼接图，写入 mosaics/<区域>/
+    - 混合：某个目标时刻所需的各卫星拼接图都已就绪即合成，按时间升序输出到 lighter_blend/<区域>/
+    - 编码：合成画布直接写入 ffmpeg 标准输入（指定 video_file 时）
+    下游阻塞时上游在 put 处等待（背压），网络、解码与编码重叠执行。
+    """
+
+    def __init__(
+        self,
+        region: Optional[str],
+        zoom: int,
+        logger,
+        satellites: Optional[List[str]] = None,
+        hours: int = 1,
+        concurrency: int = 10,
+        concat_workers: int = 2,
+        coverage_file: Optional[str] = None,
+        ownership_margin: Optional[int] = None,
+        mode: str = "lighter",
+        video_file: Optional[str] = None,
+        write_frames: bool = True,
+        framerate: int = 30,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        mosaics_dir: str = "mosaics",
+        blend_dir: str = "lighter_blend",
+    ):
+        if mode not in BLEND_MODES:
+            raise ValueError(f"不支持的混合模式: {mode}，可选: {BLEND_MODES}")
+        self.country = region
+        self.zoom = zoom
+        self.logger = logger
+        self.satellites = satellites
+        self.hours = hours
+        self.concurrency = concurrency
+        self.concat_workers = concat_workers
+        self.coverage_file = coverage_file
+        self.ownership_margin = ownership_margin
+        self.mode = mode
+        self.video_file = video_file
+        self.write_frames = write_frames or not video_file
+        self.framerate = framerate
+        self.mosaics_dir = mosaics_dir
+        self.blend_dir = blend_dir
+
+        self.concat_queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self.blend_queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self.encode_queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+        self._lock = threading.Lock()
+        # (卫星, 时间戳) -> 该帧开始下载的时间，用于统计端到端延迟
+        self._frame_started: Dict[Tuple[str, int], float] = {}
+        self.stats = {
+            "download_frames": 0, "failed_tiles": 0, "mosaics": 0, "missing_mosaics": 0,
+            "blended": 0, "linked": 0, "skipped": 0, "claimed_elsewhere": 0, "encoded": 0,
+        }
+
+    # --- 队列辅助 -------------------------------------------------------------
+
+    def _put(self, q: "queue.Queue", item, stage: str) -> None:
+        blocked_since = None
+        while True:
+            if self._stop.is_set():
+                raise PipelineAborted()
+            try:
+                q.put(item, timeout=POLL_INTERVAL)
+                break
+            except queue.Full:
+                blocked_since = blocked_since or time.perf_counter()
+        if blocked_since is not None:
+            # 下游跟不上：记录背压等待时间
+            metrics.inc("pipeline_blocked_seconds_total", time.perf_counter() - blocked_since, stage=stage)
+        metrics.set("pipeline_queue_depth", q.qsize(), stage=stage)
+
+    def _get(self, q: "queue.Queue"):
+        while True:
+            if self._stop.is_set():
+                raise PipelineAborted()
+            try:
+                return q.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += amount
+
+    # --- 阶段 -------------------------------------------------------------------
+
+    def _download_stage(self, region: str, frames: List[Tuple[int, str]], planned: Dict[str, List[Tuple[int, int]]]) -> None:
+        claims = ClaimSet("download", region, logger=self.logger)
+        total = sum(len(planned[sat]) for _, sat in frames)
+        progress = ProgressReporter("下载", total, logger=self.logger)
+        max_ahead = self.concurrency * TILES_AHEAD_PER_WORKER
+
+        with claims, ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            window = deque()
+
+            def _submit(sat: str, ts: int, coords):
+                return {pool.submit(download_tile, region, sat, ts, x, y, self.zoom): (x, y) for x, y in coords}
+
+            def _finish_oldest() -> None:
+                sat, ts, futures = window.popleft()
+                failed = []
+                for future, coord in futures.items():
+                    ok = future.result()[0]
+                    progress.update("成功" if ok else "失败")
+                    if not ok:
+                        failed.append(coord)
+                if failed:
+                    # 失败的瓦片重试一次，仍失败的在拼接图中留黑
+                    retry = _submit(sat, ts, failed)
+                    still_failed = sum(1 for future in retry if not future.result()[0])
+                    self._count("failed_tiles", still_failed)
+                    if still_failed:
+                        self.logger.warning(f"{sat} {ts}: {still_failed} 个瓦片重试后仍失败")
+                claims.release(f"{sat}-{self.zoom}-{ts}")
+                self._count("download_frames")
+                self._put(self.concat_queue, (sat, ts, True), "download")
+
+            try:
+                for ts, sat in frames:
+                    if self._stop.is_set():
+                        raise PipelineAborted()
+                    if not claims.try_claim(f"{sat}-{self.zoom}-{ts}"):
+                        self.logger.info(f"{sat} {ts} 正由其他进程下载，跳过")
+                        self._put(self.concat_queue, (sat, ts, False), "download")
+                        continue
+                    with self._lock:
+                        self._frame_started[(sat, ts)] = time.perf_counter()
+                    window.append((sat, ts, _submit(sat, ts, planned[sat])))
+                    # 限制预先提交的瓦片数：拼接阶段阻塞时下载也随之暂停
+                    while window and sum(len(f) for _, _, f in window) > max_ahead:
+                        _finish_oldest()
+                while window:
+                    _finish_oldest()
+            except BaseException:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+        progress.finish()
+        self._put(self.concat_queue, _DONE, "download")
+
+    def _concat_stage(self, region: str, satellite_names: Tuple[str, ...]) -> None:
+        claims = ClaimSet("concat", region, logger=self.logger)
+        downloads = Path("downloads") / region
+        mosaics = Path(self.mosaics_dir) / region
+        ownership = None
+        if self.ownership_margin is not None:
+            ownership = build_ownership(self.zoom, satellite_names, self.ownership_margin)
+
+        def _concat(sat: str, ts: int, downloaded: bool) -> Tuple[str, int, Optional[Path]]:
+            output_path = _frame_path(mosaics / sat, self.zoom, ts)
+            claim_key = concat_claim_key(sat, self.zoom, output_path.parent.name, output_path.stem)
+            if not downloaded or (not output_path.exists() and not claims.try_claim(claim_key)):
+                return sat, ts, output_path if output_path.exists() else None
+            zoom_dir = downloads / sat / str(self.zoom)
+            extent_file = zoom_dir / "extent.json"
+            extent = json.loads(extent_file.read_text(encoding="utf-8")) if extent_file.exists() else None
+            started = time.perf_counter()
+            try:
+                concat_tiles(
+                    tile_dir=_tile_dir(zoom_dir, ts),
+                    output_path=output_path,
+                    extent=extent,
+                    tile_filter=None if ownership is None else (lambda x, y: ownership.owns(sat, x, y)),
+                )
+            finally:
+                claims.release(claim_key)
+            metrics.observe("pipeline_stage_seconds", time.perf_counter() - started, stage="concat")
+            return sat, ts, output_path if output_path.exists() else None
+
+        with claims, ThreadPoolExecutor(max_workers=self.concat_workers) as pool:
+            running = set()
+            finished = False
+            try:
+                while not finished or running:
+                    # 在途任务达到上限时先交付完成的拼接图，不再从队列取新帧（背压传给下载阶段）
+                    if not finished and len(running) < self.concat_workers:
+                        item = self._get(self.concat_queue)
+                        if item is _DONE:
+                            finished = True
+                        else:
+                            running.add(pool.submit(_concat, *item))
+                        if not finished and len(running) < self.concat_workers:
+                            continue
+                    if running:
+                        done, running = wait(running, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            sat, ts, path = future.result()
+                            self._count("mosaics" if path else "missing_mosaics")
+                            self._put(self.blend_queue, (sat, ts, path), "concat")
+            except BaseException:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+        self._put(self.blend_queue, _DONE, "concat")
+
+    def _blend_stage(self, region: str, times: Dict[str, List[int]]) -> None:
+        canvas_width, canvas_height, offsets = region_canvas(region, self.zoom)
+        relevant_satellites = list(offsets)
+        schedule = TimelineIndex(times).schedule(ts for sat_times in times.values() for ts in sat_times)
+        output_base = Path(self.blend_dir) / region
+        resolved: Dict[Tuple[str, int], Optional[Path]] = {}
+        decoded: Dict[Path, np.ndarray] = {}
+        last_key = None
+        last_canvas = None
+        last_output: Optional[Path] = None
+        finished = False
+
+        def _compose(final_images: Dict[str, Path]) -> np.ndarray:
+            nonlocal decoded
+            layers = []
+            current: Dict[Path, np.ndarray] = {}
+            for sat, image_path in final_images.items():
+                try:
+                    # 未更新的卫星沿用上一帧已解码的拼接图
+                    mosaic = decoded.get(image_path)
+                    if mosaic is None:
+                        mosaic = load_mosaic_array(image_path)
+                    current[image_path] = mosaic
+                    layers.append((sat, mosaic, offsets[sat] * 256))
+                except Exception as e:
+                    self.logger.error(f"    -> 打开或混合图像失败 {image_path}: {e}")
+            decoded = current
+            started = time.perf_counter()
+            canvas = compose_frame(layers, canvas_width, canvas_height, self.mode)
+            metrics.observe("pipeline_stage_seconds", time.perf_counter() - started, stage="blend")
+            return canvas
+
+        # 与 process-blend 相同的按输出帧认领，并发运行时不会重复生成同一帧
+        claims = ClaimSet("blend", blend_claim_region(output_base, self.zoom), logger=self.logger)
+        # 单线程写出：保存与引用按提交顺序执行；每次最多一个 PNG 在排队，限制积压的画布
+        with claims, ThreadPoolExecutor(max_workers=1) as writer:
+            pending_save = None
+            for target_ts, sources in schedule.rows():
+                needed = [(sat, ts) for sat, ts in sources.items() if ts is not None]
+                # 等待本帧所需的各卫星拼接图全部就绪
+                while not finished and any(key not in resolved for key in needed):
+                    item = self._get(self.blend_queue)
+                    if item is _DONE:
+                        finished = True
+                    else:
+                        sat, ts, path = item
+                        resolved[(sat, ts)] = path
+
+                # 拼接失败的卫星按无数据处理
+                available = {sat: ts if resolved.get((sat, ts)) is not None else None for sat, ts in sources.items()}
+                files_info: Dict[str, Dict[int, Path]] = {}
+                for sat, ts in available.items():
+                    if ts is not None:
+                        files_info.setdefault(sat, {})[ts] = resolved[(sat, ts)]
+                final_images = select_blend_sources(available, files_info, relevant_satellites, self.logger)
+                if not final_images:
+                    self.logger.warning(f"时间戳 {target_ts}: 没有找到任何可用的卫星图像进行混合。")
+                    continue
+
+                output_path = _frame_path(output_base, self.zoom, target_ts)
+                source_key = tuple(sorted((sat, str(path)) for sat, path in final_images.items()))
+                if source_key != last_key:
+                    last_key, last_canvas, last_output = source_key, None, None
+
+                if self.write_frames:
+                    if output_path.exists():
+                        self._count("skipped")
+                    elif last_output is not None:
+                        # 没有卫星发布新图像：引用上一帧输出，不再合成与编码 PNG
+                        output_path.parent.mkdir(parents=True, exist_ok=True)
+                        writer.submit(link_frame, last_output, output_path)
+                        self._count("linked")
+                    elif claims.try_claim(blend_claim_key(output_path)):
+                        last_canvas = _compose(final_images)
+                        if pending_save is not None:
+                            pending_save.result()
+                        pending_save = writer.submit(_save_and_release, claims, last_canvas, output_path)
+                        self._count("blended")
+                    else:
+                        # 其他进程正在生成：不写出，后续重复帧也不能引用尚未写完的文件
+                        self.logger.info(f"混合帧正由其他进程生成，跳过: {output_path}")
+                        self._count("claimed_elsewhere")
+                        output_path = None
+                    last_output = output_path
+                if self.video_file:
+                    if last_canvas is None:
+                        last_canvas = _compose(final_images)
+                        self._count("blended")
+                    self._put(self.encode_queue, last_canvas, "blend")
+                self._observe_latency(needed)
+            if pending_save is not None:
+                pending_save.result()
+
+        # 排空上游剩余的结果
+        while not finished:
+            finished = self._get(self.blend_queue) is _DONE
+        if self.video_file:
+            self._put(self.encode_queue, _DONE, "blend")
+
+    def _observe_latency(self, needed: List[Tuple[str, int]]) -> None:
+        # 端到端延迟：从本帧最新一张源图像开始下载到混合完成
+        with self._lock:
+            starts = [self._frame_started[key] for key in needed if key in self._frame_started]
+        if starts:
+            metrics.observe("pipeline_frame_latency_seconds", time.perf_counter() - max(starts))
+
+    def _encode_stage(self, region: str) -> None:
+        canvas_width, canvas_height, _ = region_canvas(region, self.zoom)
+
+        def _frames():
+            while True:
+                frame = self._get(self.encode_queue)
+                if frame is _DONE:
+                    return
+                yield frame
+
+        self.stats["encoded"] = encode_frame_stream(
+            _frames(), canvas_width, canvas_height, self.video_file, self.framerate, logger=self.logger
+        )
+
+    # --- 调度 -------------------------------------------------------------------
+
+    def _run_stage(self, name: str, target, *args) -> None:
+        try:
+            target(*args)
+        except PipelineAborted:
+            self.logger.debug(f"流水线阶段 {name} 已停止")
+        except BaseException as e:
+            self.logger.error(f"流水线阶段 {name} 失败: {e}", exc_info=True)
+            with self._lock:
+                self._errors.append(e)
+            self._stop.set()
+
+    def run(self) -> Dict[str, int]:
+        """运行整条流水线直到所有帧编码完成；任一阶段失败时停止其余阶段并抛出该异常"""
+        plan = plan_download(self.satellites, self.hours, self.zoom, self.country, self.coverage_file, self.ownership_margin)
+        if plan is None:
+            return self.stats
+        region, times, planned = plan
+        times = {sat: sorted(times[sat]) for sat in planned if times.get(sat)}
+        frames = sorted((ts, sat) for sat, sat_times in times.items() for ts in sat_times)
+        if not frames:
+            self.logger.info("没有需要处理的帧")
+            return self.stats
+        self.logger.info(
+            f"流水线启动：{len(times)} 颗卫星、{len(frames)} 个卫星帧，"
+            f"下载 {self.concurrency} 线程 / 拼接 {self.concat_workers} 线程"
+            + (f"，编码至 {self.video_file}" if self.video_file else "")
+        )
+
+        stages = [
+            ("download", self._download_stage, region, frames, planned),
+            ("concat", self._concat_stage, region, tuple(sorted(times))),
+            ("blend", self._blend_stage, region, times),
+        ]
+        if self.video_file:
+            stages.append(("encode", self._encode_stage, region))
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._run_stage, args=(name, target, *args), name=f"pipeline-{name}", daemon=True)
+            for name, target, *args in stages
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(POLL_INTERVAL)
+        except KeyboardInterrupt:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            raise
+        metrics.observe("pipeline_stage_seconds", time.perf_counter() - started, stage="total")
+        for key, value in self.stats.items():
+            metrics.inc("pipeline_frames_total", value, result=key)
+        if self._errors:
+            raise self._errors[0]
+        return self.stats
+
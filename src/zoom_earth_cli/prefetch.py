@@ -0,0 +1,227 @@
+import glob
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from zoom_earth_cli.const import (
+    COUNTRY_BOUNDS,
+    DEFAULT_MISS_BUDGET,
+    TIMES_FILENAME_FORMAT,
+    TIMES_HISTORY_GLOB,
+    get_bound_tile_range,
+    get_satellite_tile_range,
+    range_intersection,
+)
+
+# fetch_latest_times 保存的历史文件
+TIMES_HISTORY_PATTERN = os.path.join("debug_output", TIMES_HISTORY_GLOB)
+
+# 历史不足以估计发布延迟时使用的默认值（秒）
+DEFAULT_PUBLISH_LATENCY = 20 * 60
+
+
+class CadenceModel:
+    """单颗卫星的发布节奏：帧间隔、发布延迟（帧时间到可下载的时间差）和最新帧"""
+
+    def __init__(self, satellite: str, cadence: int, latency: float, latest: int):
+        self.satellite = satellite
+        self.cadence = cadence
+        self.latency = latency
+        self.latest = latest
+
+    @property
+    def next_timestamp(self) -> int:
+        return self.latest + self.cadence
+
+    @property
+    def expected_available_at(self) -> float:
+        return self.next_timestamp + self.latency
+
+    def advance(self, timestamp: int) -> None:
+        self.latest = max(self.latest, timestamp)
+
+    def __repr__(self):
+        return f"CadenceModel({self.satellite}, cadence={self.cadence}s, latency={self.latency:.0f}s, latest={self.latest})"
+
+
+def load_times_history(pattern: str = TIMES_HISTORY_PATTERN) -> List[Tuple[float, Dict[str, List[int]]]]:
+    """读取时间列表历史，返回按抓取时间排序的 [(抓取时间戳, {卫星: [帧时间戳]})]"""
+    history = []
+    for path in glob.glob(pattern):
+        try:
+            fetched_at = datetime.strptime(os.path.basename(path), TIMES_FILENAME_FORMAT).timestamp()
+            with open(path, encoding="utf-8") as f:
+                history.append((fetched_at, json.load(f)))
+        except (ValueError, OSError) as e:
+            logging.debug(f"跳过无法解析的时间历史 {path}: {e}")
+    history.sort(key=lambda item: item[0])
+    return history
+
+
+def learn_cadence(
+    history: List[Tuple[float, Dict[str, List[int]]]],
+    default_latency: float = DEFAULT_PUBLISH_LATENCY
+) -> Dict[str, CadenceModel]:
+    """
+    从历史中学习每颗卫星的节奏：帧间隔取相邻帧时间差的中位数，
+    发布延迟取每帧首次出现在列表中的时间与帧时间之差的中位数。
+    """
+    first_seen: Dict[str, Dict[int, float]] = {}
+    for fetched_at, data in history:
+        for satellite, timestamps in data.items():
+            seen = first_seen.setdefault(satellite, {})
+            for ts in timestamps:
+                seen.setdefault(int(ts), fetched_at)
+
+    models = {}
+    for satellite, seen in first_seen.items():
+        timestamps = np.array(sorted(seen), dtype=np.int64)
+        diffs = np.diff(timestamps)
+        diffs = diffs[diffs > 0]
+        if not len(diffs):
+            continue
+        cadence = int(np.median(diffs))
+
+        # 第一次抓取时已存在的帧无法反映发布延迟，只统计之后新出现的帧
+        first_fetch = history[0][0]
+        delays = np.array([seen[ts] - ts for ts in timestamps if seen[ts] > first_fetch], dtype=np.float64)
+        delays = delays[delays > 0]
+        latency = float(np.median(delays)) if len(delays) else default_latency
+        models[satellite] = CadenceModel(satellite, cadence, latency, int(timestamps[-1]))
+    return models
+
+
+def plan_prefetch_tiles(satellite: str, zoom: int, country: Optional[str] = None) -> List[Tuple[int, int]]:
+    """卫星在指定国家范围内的全部瓦片 (x, y)，与 batch_download 的矩形筛选一致"""
+    x_range, y_range = get_satellite_tile_range(zoom, satellite)
+    if country is not None:
+        c_x_range, c_y_range = get_bound_tile_range(zoom, COUNTRY_BOUNDS[country])
+        x_span = range_intersection((x_range.start, x_range.stop - 1), (c_x_range.start, c_x_range.stop - 1))
+        y_span = range_intersection((y_range.start, y_range.stop - 1), (c_y_range.start, c_y_range.stop - 1))
+        if x_span is None or y_span is None:
+            return []
+        x_range, y_range = range(x_span[0], x_span[1] + 1), range(y_span[0], y_span[1] + 1)
+    return [(x, y) for x in x_range for y in y_range]
+
+
+class PrefetchScheduler:
+    """
+    按学到的节奏预测各卫星下一帧的可用时间，到点后先探测单个瓦片，
+    命中则以固定速率下载其余瓦片；未命中按退避重试，超出失误预算后重新拉取时间列表对齐。
+    """
+
+    def __init__(
+        self,
+        models: Dict[str, CadenceModel],
+        tiles: Dict[str, List[Tuple[int, int]]],
+        fetch_tile: Callable[[str, int, int, int], bool],
+        refresh_times: Optional[Callable[[], Dict[str, List[int]]]] = None,
+        miss_budget: int = DEFAULT_MISS_BUDGET,
+        requests_per_second: float = 5.0,
+        concurrency: int = 5,
+        now: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+        logger=logging
+    ):
+        self.models = models
+        self.tiles = {sat: coords for sat, coords in tiles.items() if coords and sat in models}
+        self.fetch_tile = fetch_tile
+        self.refresh_times = refresh_times
+        self.miss_budget = miss_budget
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self.concurrency = concurrency
+        self.now = now
+        self.sleep = sleep
+        self.logger = logger
+        self.misses: Dict[str, int] = {sat: 0 for sat in self.tiles}
+        # 统计：命中帧数、探测失败次数、下载瓦片数、重新对齐次数
+        self.stats = {"frames": 0, "misses": 0, "tiles": 0, "resyncs": 0}
+        self._retry_at: Dict[str, float] = {}
+
+    def _due_at(self, satellite: str) -> float:
+        return self._retry_at.get(satellite, self.models[satellite].expected_available_at)
+
+    def _backoff(self, satellite: str) -> float:
+        # 退避时长随失败次数增长，但不超过半个帧间隔
+        model = self.models[satellite]
+        return min(model.cadence / 2, 30.0 * (2 ** (self.misses[satellite] - 1)))
+
+    def _resync(self, satellite: str) -> None:
+        self.stats["resyncs"] += 1
+        self.misses[satellite] = 0
+        self._retry_at.pop(satellite, None)
+        if self.refresh_times is None:
+            # 无法对齐时跳过这个预测帧
+            self.models[satellite].advance(self.models[satellite].next_timestamp)
+            return
+        latest = self.refresh_times().get(satellite) or []
+        if latest:
+            model = self.models[satellite]
+            newest = max(latest)
+            if newest >= model.next_timestamp:
+                # 预测帧之后已有新帧：把最新帧作为下一个目标
+                model.latest = newest - model.cadence
+            else:
+                model.advance(model.next_timestamp)
+        self.logger.info(f"{satellite} 连续探测失败，已重新对齐时间列表: {self.models[satellite]}")
+
+    def _fetch_frame(self, satellite: str, timestamp: int) -> int:
+        """以固定速率下载一帧的其余瓦片，返回成功数"""
+        coords = self.tiles[satellite][1:]
+        ok = 1
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = []
+            for x, y in coords:
+                futures.append(executor.submit(self.fetch_tile, satellite, timestamp, x, y))
+                if self.interval:
+                    self.sleep(self.interval)
+            ok += sum(1 for future in futures if future.result())
+        return ok
+
+    def step(self) -> Optional[str]:
+        """处理最早到期的一颗卫星：等待到点、探测、命中后下载；返回处理的卫星"""
+        if not self.tiles:
+            return None
+        satellite = min(self.tiles, key=self._due_at)
+        wait = self._due_at(satellite) - self.now()
+        if wait > 0:
+            self.sleep(wait)
+
+        model = self.models[satellite]
+        timestamp = model.next_timestamp
+        probe_x, probe_y = self.tiles[satellite][0]
+        if self.fetch_tile(satellite, timestamp, probe_x, probe_y):
+            lead = model.expected_available_at - self.now()
+            fetched = self._fetch_frame(satellite, timestamp)
+            self.logger.info(
+                f"预取 {satellite} {datetime.fromtimestamp(timestamp)}: {fetched}/{len(self.tiles[satellite])} 个瓦片"
+                f"（探测 {self.misses[satellite]} 次未命中，相对预测 {lead:+.0f}s）"
+            )
+            self.stats["frames"] += 1
+            self.stats["tiles"] += fetched
+            model.advance(timestamp)
+            self.misses[satellite] = 0
+            self._retry_at.pop(satellite, None)
+            return satellite
+
+        self.misses[satellite] += 1
+        self.stats["misses"] += 1
+        if self.misses[satellite] >= self.miss_budget:
+            self._resync(satellite)
+        else:
+            self._retry_at[satellite] = self.now() + self._backoff(satellite)
+            self.logger.debug(f"{satellite} 帧 {timestamp} 尚未发布，{self._backoff(satellite):.0f}s 后重试")
+        return satellite
+
+    def run(self, duration_seconds: float) -> Dict[str, int]:
+        """运行指定时长，返回统计"""
+        deadline = self.now() + duration_seconds
+        while self.tiles and min(self._due_at(sat) for sat in self.tiles) <= deadline:
+            self.step()
+        return self.stats
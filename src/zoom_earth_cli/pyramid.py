@@ -0,0 +1,254 @@
+import json
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from zoom_earth_cli.locking import ClaimSet
+from zoom_earth_cli.metrics import metrics
+from zoom_earth_cli.server import blend_origin, scan_frames
+
+# 完成标记：记录源文件修改时间，源帧被重新混合后金字塔会重建
+COMPLETE_MARKER = "complete.json"
+# 降采样时每次处理的行数（偶数），避免为整张画布分配 uint32 中间数组
+DOWNSAMPLE_STRIP_ROWS = 512
+# 每个写瓦片任务包含的瓦片行数
+TILE_ROWS_PER_JOB = 4
+
+
+def downsample_2x(canvas: np.ndarray) -> np.ndarray:
+    """
+    RGBA 画布 2x2 降采样（宽高须为偶数）。颜色按透明度加权平均，
+    透明区域的黑色不会渗入相邻的有效像素。
+    """
+    height, width = canvas.shape[:2]
+    out = np.zeros((height // 2, width // 2, 4), dtype=np.uint8)
+    for top in range(0, height, DOWNSAMPLE_STRIP_ROWS):
+        blocks = canvas[top:top + DOWNSAMPLE_STRIP_ROWS].astype(np.uint32)
+        blocks = blocks.reshape(blocks.shape[0] // 2, 2, width // 2, 2, 4)
+        alpha = blocks[..., 3].sum(axis=(1, 3))
+        rgb = (blocks[..., :3] * blocks[..., 3:4]).sum(axis=(1, 3))
+        safe_alpha = np.maximum(alpha, 1)[..., None]
+        strip = out[top // 2:(top + blocks.shape[0] * 2) // 2]
+        strip[..., :3] = (rgb + safe_alpha // 2) // safe_alpha
+        strip[..., 3] = (alpha + 2) // 4
+    return out
+
+
+def _align_for_next_level(canvas: np.ndarray, origin: Tuple[int, int], tile_size: int) -> np.ndarray:
+    """在四周补透明瓦片，使画布起点与瓦片数都对齐到偶数，下一级的瓦片边界才能与本级对齐"""
+    col0, row0 = origin
+    rows, cols = canvas.shape[0] // tile_size, canvas.shape[1] // tile_size
+    pad_top, pad_left = row0 % 2, col0 % 2
+    pad_bottom, pad_right = (row0 + rows) % 2, (col0 + cols) % 2
+    if not (pad_top or pad_left or pad_bottom or pad_right):
+        return canvas
+    return np.pad(
+        canvas,
+        ((pad_top * tile_size, pad_bottom * tile_size), (pad_left * tile_size, pad_right * tile_size), (0, 0)),
+    )
+
+
+def build_levels(
+    canvas: np.ndarray,
+    origin: Tuple[int, int],
+    zoom: int,
+    min_zoom: int = 0,
+    tile_size: int = 256
+) -> List[Tuple[int, Tuple[int, int], np.ndarray]]:
+    """由源 zoom 画布逐级 2x 降采样，返回 [(zoom, 左上角瓦片 (列, 行), 画布)]，从源 zoom 开始"""
+    levels = [(zoom, origin, canvas)]
+    for z in range(zoom - 1, min_zoom - 1, -1):
+        _, (col0, row0), previous = levels[-1]
+        aligned = _align_for_next_level(previous, (col0, row0), tile_size)
+        levels.append((z, (col0 // 2, row0 // 2), downsample_2x(aligned)))
+    return levels
+
+
+def _write_tiles_worker(
+    shm_name: str,
+    offset: int,
+    shape: Tuple[int, ...],
+    z: int,
+    origin: Tuple[int, int],
+    tile_rows: Tuple[int, int],
+    output_dir: str,
+    tile_size: int
+) -> Tuple[int, int]:
+    """进程池工作函数：从共享内存读取某一级画布，写出指定瓦片行中的非透明瓦片；返回 (写出数, 跳过数)"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    written = skipped = 0
+    try:
+        level = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+        col0, row0 = origin
+        for row in range(*tile_rows):
+            for col in range(shape[1] // tile_size):
+                tile = level[row * tile_size:(row + 1) * tile_size, col * tile_size:(col + 1) * tile_size]
+                if not tile[..., 3].any():
+                    skipped += 1
+                    continue
+                tile_dir = Path(output_dir) / str(z) / str(col0 + col)
+                tile_dir.mkdir(parents=True, exist_ok=True)
+                Image.fromarray(np.ascontiguousarray(tile), "RGBA").save(tile_dir / f"{row0 + row}.png", format="PNG")
+                written += 1
+        del level
+    finally:
+        shm.close()
+    return written, skipped
+
+
+def _load_rgba(path: Path) -> np.ndarray:
+    with Image.open(path) as img:
+        return np.asarray(img.convert("RGBA") if img.mode != "RGBA" else img)
+
+
+def pyramid_is_complete(frame_dir: Path, source: Path) -> bool:
+    marker = frame_dir / COMPLETE_MARKER
+    if not marker.exists():
+        return False
+    try:
+        info = json.loads(marker.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False
+    return info.get("source_mtime_ns") == source.stat().st_mtime_ns
+
+
+def build_pyramids(
+    blend_dir: str,
+    output_dir: str,
+    region: str,
+    zoom: int,
+    logger,
+    min_zoom: int = 0,
+    hours: int = 0,
+    workers: int = 1,
+    tile_size: int = 256,
+    downloads_dir: str = "downloads"
+) -> Dict[str, int]:
+    """
+    为 <blend_dir>/<region>/<zoom>/ 下的每个混合帧生成静态 XYZ 金字塔：
+    <output_dir>/<region>/<时间戳>/<z>/<x>/<y>.png（与 zec serve 的 URL 一致）。
+    各级在内存中逐级降采样后放入共享内存，瓦片编码与写出分发到进程池；
+    完全透明的瓦片不写出，已完成（带完成标记且源帧未变）的帧直接跳过。
+    """
+    frames = scan_frames(Path(blend_dir) / region, zoom)
+    if hours > 0:
+        cutoff = datetime.now(timezone.utc).timestamp() - hours * 3600
+        frames = {ts: path for ts, path in frames.items() if ts >= cutoff}
+    stats = {"frames": 0, "skipped_frames": 0, "tiles": 0, "empty_tiles": 0}
+    if not frames:
+        logger.warning(f"在 {Path(blend_dir) / region}/{zoom} 下没有找到混合帧")
+        return stats
+
+    origin = blend_origin(zoom, region, downloads_dir)
+    base = Path(output_dir) / region
+    pending = []
+    for ts in sorted(frames, reverse=True):
+        if pyramid_is_complete(base / str(ts), frames[ts]):
+            stats["skipped_frames"] += 1
+            continue
+        pending.append(ts)
+    logger.info(
+        f"共 {len(frames)} 个混合帧，{stats['skipped_frames']} 个金字塔已完成，"
+        f"待生成 {len(pending)} 个（zoom {zoom} -> {min_zoom}，{workers} 个进程）"
+    )
+
+    claims = ClaimSet("pyramid", f"{region}-{zoom}", logger=logger)
+    with claims, ProcessPoolExecutor(max_workers=workers) as pool:
+        # 每帧：共享内存段、未完成的写瓦片任务、统计
+        in_flight: Dict[int, dict] = {}
+
+        def _finish(ts: int) -> None:
+            frame = in_flight.pop(ts)
+            frame["shm"].close()
+            frame["shm"].unlink()
+            claims.release(str(ts))
+            if frame["failed"]:
+                logger.error(f"时间戳 {ts} 的金字塔未完整写出，下次运行时重建")
+                return
+            frame_dir = base / str(ts)
+            frame_dir.mkdir(parents=True, exist_ok=True)
+            (frame_dir / COMPLETE_MARKER).write_text(json.dumps({
+                "source": str(frames[ts]),
+                "source_mtime_ns": frame["source_mtime_ns"],
+                "zoom": [min_zoom, zoom],
+                "tiles": frame["written"],
+            }), encoding="utf-8")
+            stats["frames"] += 1
+            logger.info(f"  -> 金字塔完成: {frame_dir}（{frame['written']} 个瓦片，跳过透明瓦片 {frame['skipped']} 个）")
+
+        def _collect(done_futures) -> None:
+            for future in done_futures:
+                for ts, frame in list(in_flight.items()):
+                    if future not in frame["jobs"]:
+                        continue
+                    frame["jobs"].remove(future)
+                    try:
+                        written, skipped = future.result()
+                        frame["written"] += written
+                        frame["skipped"] += skipped
+                        stats["tiles"] += written
+                        stats["empty_tiles"] += skipped
+                    except Exception as e:
+                        logger.error(f"  -> 时间戳 {ts} 写瓦片失败: {e}")
+                        frame["failed"] = True
+                    if not frame["jobs"]:
+                        _finish(ts)
+                    break
+
+        for ts in pending:
+            if not claims.try_claim(str(ts)):
+                logger.info(f"时间戳 {ts} 的金字塔正由其他进程生成，跳过")
+                continue
+            source = frames[ts]
+            try:
+                source_mtime_ns = source.stat().st_mtime_ns
+                levels = build_levels(_load_rgba(source), origin, zoom, min_zoom, tile_size)
+            except Exception as e:
+                logger.error(f"读取混合帧失败 {source}: {e}")
+                claims.release(str(ts))
+                continue
+
+            # 全部层级放入同一个共享内存段，工作进程按偏移读取
+            total = sum(level.nbytes for _, _, level in levels)
+            shm = shared_memory.SharedMemory(create=True, size=total)
+            frame = {"shm": shm, "jobs": set(), "written": 0, "skipped": 0, "failed": False,
+                     "source_mtime_ns": source_mtime_ns}
+            offset = 0
+            jobs = []
+            for z, level_origin, level in levels:
+                np.ndarray(level.shape, dtype=np.uint8, buffer=shm.buf, offset=offset)[...] = level
+                tile_rows = level.shape[0] // tile_size
+                for start in range(0, tile_rows, TILE_ROWS_PER_JOB):
+                    jobs.append((shm.name, offset, level.shape, z, level_origin,
+                                 (start, min(start + TILE_ROWS_PER_JOB, tile_rows)), str(base / str(ts)), tile_size))
+                offset += level.nbytes
+            del levels
+            in_flight[ts] = frame
+            for job in jobs:
+                frame["jobs"].add(pool.submit(_write_tiles_worker, *job))
+
+            # 最多两帧在途：写出当前帧的同时解码并降采样下一帧，限制共享内存占用
+            while len(in_flight) > 1:
+                running = set().union(*(f["jobs"] for f in in_flight.values()))
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                _collect(done)
+
+        while in_flight:
+            running = set().union(*(f["jobs"] for f in in_flight.values()))
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            _collect(done)
+
+    metrics.inc("pyramid_frames_total", stats["frames"], result="built")
+    metrics.inc("pyramid_frames_total", stats["skipped_frames"], result="complete")
+    metrics.inc("pyramid_tiles_total", stats["tiles"], result="written")
+    metrics.inc("pyramid_tiles_total", stats["empty_tiles"], result="transparent")
+    logger.info(
+        f"金字塔生成结束：新生成 {stats['frames']} 帧 / {stats['tiles']} 个瓦片，"
+        f"跳过透明瓦片 {stats['empty_tiles']} 个，已完成帧 {stats['skipped_frames']} 个"
+    )
+    return stats
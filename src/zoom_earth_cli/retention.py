@@ -0,0 +1,429 @@
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from zoom_earth_cli import archive
+from zoom_earth_cli.const import TIMES_HISTORY_GLOB
+from zoom_earth_cli.locking import stage_lock
+from zoom_earth_cli.metrics import metrics
+
+# 各阶段的目录布局：根目录、删除单元所在深度（相对根目录）、单元类型
+# downloads/<区域>/<卫星>/<zoom>/<日期>/<HHMM>/            一帧瓦片目录
+# mosaics/<区域>/<卫星>/<zoom>/<日期>/<HHMM>.png|npy       单星拼接图
+# lighter_blend/<区域>/<zoom>/<日期>/<HHMM>.png            混合帧
+# pyramid/<区域>/<时间戳>/                                 一帧瓦片金字塔
+# output_videos/*、debug_output/*                          按修改时间计龄
+# zec archive 归档后的 <日期>.zpk（与日期目录同级）整体作为一个单元，帧时间取包内最新一帧
+STAGE_LAYOUTS: Dict[str, Tuple[int, str]] = {
+    "downloads": (5, "dir"),
+    "mosaics": (5, "file"),
+    "lighter_blend": (4, "file"),
+    "pyramid": (2, "dir"),
+    "output_videos": (1, "file"),
+    "debug_output": (1, "file"),
+}
+# 增量扫描索引：记录每个单元的修改时间、大小与下游是否已生成，以及单元所在目录的修改时间。
+# 目录修改时间未变时（没有新增、删除或替换的单元）文件单元直接沿用索引，不再列目录；
+# 目录单元（downloads 的帧目录、pyramid）的内容变化不反映在上层目录，仍逐个 stat，只有变化的单元才逐文件统计
+INDEX_PATH = os.path.join(".zec_index", "retention.json")
+INDEX_VERSION = 2
+# prefetch 学习节奏所需的时间列表历史：debug_output 中最新的这么多份不会被删除
+TIMES_HISTORY_KEEP = 144
+# 每个删除任务包含的单元数
+DELETE_BATCH = 32
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+_SIZE_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+
+def parse_duration(text: str) -> float:
+    """'36h'、'7d'、'2w' -> 秒；纯数字按小时"""
+    text = text.strip().lower()
+    if text and text[-1] in _DURATION_UNITS:
+        return float(text[:-1]) * _DURATION_UNITS[text[-1]]
+    return float(text) * 3600
+
+
+def parse_size(text: str) -> int:
+    """'500M'、'20G'、'1.5T' -> 字节（1024 进制）"""
+    text = text.strip().lower()
+    if text.endswith("ib"):
+        text = text[:-2]
+    elif len(text) > 1 and text.endswith("b") and text[-2] in _SIZE_UNITS:
+        text = text[:-1]
+    unit = text[-1] if text and text[-1] in _SIZE_UNITS else ""
+    return int(float(text[:-1] if unit else text) * _SIZE_UNITS[unit])
+
+
+def parse_policies(values: Optional[List[str]], parser) -> Dict[str, float]:
+    """把 ['downloads=2d', 'mosaics=7d'] 解析为 {阶段: 值}"""
+    policies = {}
+    for value in values or []:
+        stage, sep, amount = value.partition("=")
+        if not sep or stage not in STAGE_LAYOUTS:
+            raise ValueError(f"无效的策略 '{value}'，格式为 <阶段>=<值>，阶段可选: {', '.join(STAGE_LAYOUTS)}")
+        try:
+            policies[stage] = parser(amount)
+        except ValueError:
+            raise ValueError(f"无法解析 '{value}' 中的值 '{amount}'")
+    return policies
+
+
+def _unit_timestamp(stage: str, parts: Tuple[str, ...], mtime: float) -> Optional[float]:
+    """单元对应的帧时间（UTC 秒），无法解析时返回 None（不属于本工具生成的文件，不处理）"""
+    try:
+        if stage == "downloads":
+            dt = datetime.strptime(f"{parts[-2]} {parts[-1]}", "%Y-%m-%d %H%M")
+        elif stage in ("mosaics", "lighter_blend"):
+            dt = datetime.strptime(f"{parts[-2]} {Path(parts[-1]).stem}", "%Y-%m-%d %H%M")
+        elif stage == "pyramid":
+            return float(int(parts[-1]))
+        else:
+            return mtime
+    except ValueError:
+        return None
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _pack_timestamp(parts: Tuple[str, ...], path: str) -> Optional[float]:
+    """日包中最新一帧的时间（UTC 秒）；包无法读取时按当天结束计"""
+    date = parts[-1][:-len(archive.PACK_SUFFIX)]
+    try:
+        day = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    try:
+        names = archive.open_pack(Path(path)).entries
+    except (OSError, ValueError):
+        return day.timestamp() + 86400
+    latest = None
+    for name in names:
+        try:
+            dt = datetime.strptime(f"{date} {Path(name.split('/', 1)[0]).stem}", "%Y-%m-%d %H%M")
+        except ValueError:
+            continue
+        latest = dt if latest is None else max(latest, dt)
+    return (latest or day).replace(tzinfo=timezone.utc).timestamp()
+
+
+def _iter_containers(
+    root: Path, depth: int, packs: bool = False
+) -> Iterator[Tuple[Tuple[str, ...], str, Optional[os.DirEntry]]]:
+    """
+    逐层 scandir 到单元所在的目录（深度 depth - 1），产出 (相对路径各段, 路径, None)；只列目录。
+    packs 时同一层的 <日期>.zpk 也作为单元产出 (相对路径各段, 路径, 目录项)
+    """
+    def _walk(path: str, parts: Tuple[str, ...]):
+        if len(parts) == depth - 1:
+            yield parts, path, None
+            return
+        try:
+            entries = list(os.scandir(path))
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk(entry.path, parts + (entry.name,))
+            elif packs and len(parts) == depth - 2 and entry.name.endswith(archive.PACK_SUFFIX):
+                yield parts + (entry.name,), entry.path, entry
+
+    if root.is_dir():
+        yield from _walk(str(root), ())
+
+
+def _iter_units(container: str, parts: Tuple[str, ...], kind: str) -> Iterator[Tuple[Tuple[str, ...], os.DirEntry]]:
+    """列出目录中的单元，产出 (相对路径各段, 目录项)；不触碰目录单元内部的文件"""
+    try:
+        entries = list(os.scandir(container))
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for entry in entries:
+        if (kind == "dir") == entry.is_dir(follow_symlinks=False) and not entry.name.endswith(".tmp"):
+            yield parts + (entry.name,), entry
+
+
+def _tree_size(path: str) -> Tuple[int, int]:
+    """目录下所有文件的 (字节数, 文件数)"""
+    total = count = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            else:
+                try:
+                    total += entry.stat(follow_symlinks=False).st_size
+                    count += 1
+                except FileNotFoundError:
+                    pass
+    return total, count
+
+
+def _downstream_done(stage: str, parts: Tuple[str, ...], roots: Dict[str, Path]) -> bool:
+    """
+    下游产物是否已生成（生成过一次即记入索引，之后下游被清理也不再保护上游）：
+    瓦片帧 -> 对应拼接图；拼接图 -> 同时刻的混合帧；其余阶段没有下游依赖。
+    下游可能已归档，按 archive.exists 检查；日包单元要求包内每一帧的下游都已生成
+    """
+    if stage in ("downloads", "mosaics") and parts[-1].endswith(archive.PACK_SUFFIX):
+        date = parts[-1][:-len(archive.PACK_SUFFIX)]
+        try:
+            names = archive.open_pack(roots[stage].joinpath(*parts)).entries
+        except (OSError, ValueError):
+            return False
+        # downloads 条目为 <HHMM>/x*_y*.jpg，mosaics 条目为 <HHMM>.png|npy
+        frames = {name.split("/", 1)[0] for name in names}
+        return all(_downstream_done(stage, parts[:-1] + (date, frame), roots) for frame in frames)
+    if stage == "downloads":
+        region, sat, zoom, date, hhmm = parts
+        base = roots["mosaics"] / region / sat / zoom / date
+        return archive.exists(base / f"{hhmm}.png") or archive.exists(base / f"{hhmm}.npy")
+    if stage == "mosaics":
+        region, _, zoom, date, name = parts
+        return archive.exists(roots["lighter_blend"] / region / zoom / date / f"{Path(name).stem}.png")
+    return True
+
+
+def load_index(path: str = INDEX_PATH) -> Dict[str, Dict[str, dict]]:
+    try:
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != INDEX_VERSION:
+        return {}
+    return data.get("stages", {})
+
+
+def save_index(stages: Dict[str, Dict[str, dict]], path: str = INDEX_PATH) -> None:
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp = target.with_name(target.name + ".tmp")
+    temp.write_text(json.dumps({"version": INDEX_VERSION, "stages": stages}), encoding="utf-8")
+    os.replace(temp, target)
+
+
+def scan_stage(stage: str, roots: Dict[str, Path], previous: Dict[str, dict]) -> Tuple[Dict[str, dict], int]:
+    """
+    扫描一个阶段，返回 ({"units": 单元索引, "dirs": 目录修改时间}, 重新统计的单元数)。
+    文件单元所在目录的修改时间未变时整目录沿用索引；其余单元修改时间未变时沿用索引中的大小，
+    只有新增或变化的单元才逐文件统计
+    """
+    depth, kind = STAGE_LAYOUTS[stage]
+    previous_units: Dict[str, dict] = previous.get("units", {})
+    previous_dirs: Dict[str, int] = previous.get("dirs", {})
+    by_container: Dict[str, List[str]] = {}
+    for key in previous_units:
+        by_container.setdefault(key.rpartition("/")[0], []).append(key)
+
+    entries: Dict[str, dict] = {}
+    dirs: Dict[str, int] = {}
+    rescanned = 0
+    for container_parts, container, pack in _iter_containers(roots[stage], depth, packs=stage in archive.ARCHIVE_STAGES):
+        if pack is not None:
+            units = [(container_parts, pack)]
+        else:
+            container_key = "/".join(container_parts)
+            try:
+                dirs[container_key] = os.stat(container).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if kind == "file" and previous_dirs.get(container_key) == dirs[container_key]:
+                for key in by_container.get(container_key, []):
+                    record = dict(previous_units[key])
+                    if not record["done"]:
+                        record["done"] = _downstream_done(stage, tuple(key.split("/")), roots)
+                    entries[key] = record
+                continue
+            units = _iter_units(container, container_parts, kind)
+        for parts, entry in units:
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            key = "/".join(parts)
+            old = previous_units.get(key)
+            if old is not None and old["mtime_ns"] == stat.st_mtime_ns:
+                record = dict(old)
+            else:
+                if pack is not None:
+                    ts = _pack_timestamp(parts, entry.path)
+                else:
+                    ts = _unit_timestamp(stage, parts, stat.st_mtime)
+                if ts is None:
+                    continue
+                size, files = _tree_size(entry.path) if kind == "dir" and pack is None else (stat.st_size, 1)
+                record = {"mtime_ns": stat.st_mtime_ns, "bytes": size, "files": files, "ts": ts, "done": False}
+                rescanned += 1
+            if not record["done"]:
+                record["done"] = _downstream_done(stage, parts, roots)
+            entries[key] = record
+    return {"units": entries, "dirs": dirs}, rescanned
+
+
+def plan_stage(
+    stage: str,
+    entries: Dict[str, dict],
+    now: float,
+    max_age: Optional[float] = None,
+    max_bytes: Optional[int] = None,
+    force: bool = False
+) -> Tuple[List[str], int]:
+    """
+    按 最长保留时间 与 总大小上限 选出要删除的单元（从最旧开始），返回 (单元列表, 受保护而保留的数量)。
+    受保护：下游尚未生成；拼接图还是该卫星最新一张（后续混合帧仍会用到）。force 时忽略依赖。
+    debug_output 中最新的 TIMES_HISTORY_KEEP 份时间列表历史（prefetch 学习节奏用）始终保留
+    """
+    latest_mosaic: Dict[str, str] = {}
+    if stage == "mosaics":
+        for key, record in entries.items():
+            # <区域>/<卫星>/<zoom>：帧文件在日期目录下，日包与日期目录同级
+            series = key.rsplit("/", 1 if key.endswith(archive.PACK_SUFFIX) else 2)[0]
+            current = latest_mosaic.get(series)
+            if current is None or record["ts"] > entries[current]["ts"]:
+                latest_mosaic[series] = key
+    protected_keys = {key for key, record in entries.items() if not record["done"]}
+    protected_keys.update(latest_mosaic.values())
+    if force:
+        protected_keys = set()
+    if stage == "debug_output":
+        history = sorted((key for key in entries if fnmatch(key, TIMES_HISTORY_GLOB)), key=lambda key: entries[key]["ts"])
+        protected_keys.update(history[-TIMES_HISTORY_KEEP:])
+
+    ordered = sorted(entries, key=lambda key: entries[key]["ts"])
+    remaining = sum(record["bytes"] for record in entries.values())
+    selected: List[str] = []
+    protected = 0
+    for key in ordered:
+        record = entries[key]
+        expired = max_age is not None and now - record["ts"] > max_age
+        over_budget = max_bytes is not None and remaining > max_bytes
+        if not (expired or over_budget):
+            # 按时间排序：之后的单元更新，既未过期也不再需要腾出空间
+            break
+        if key in protected_keys:
+            protected += 1
+            continue
+        selected.append(key)
+        remaining -= record["bytes"]
+    return selected, protected
+
+
+def _delete_batch(paths: List[Path]) -> List[Tuple[Path, str]]:
+    """删除一批单元，返回删除失败的 (路径, 错误信息)"""
+    failed = []
+    for path in paths:
+        try:
+            if path.is_dir() and not path.is_symlink():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            failed.append((path, str(e)))
+    return failed
+
+
+def _prune_empty_dirs(paths: List[Path], root: Path) -> None:
+    """删除单元后向上清理空目录，直到阶段根目录"""
+    parents = sorted({parent for path in paths for parent in path.parents if root in parent.parents},
+                     key=lambda p: len(p.parts), reverse=True)
+    for parent in parents:
+        try:
+            parent.rmdir()
+        except OSError:
+            pass
+
+
+def collect_garbage(
+    logger,
+    max_age: Optional[Dict[str, float]] = None,
+    max_bytes: Optional[Dict[str, int]] = None,
+    stages: Optional[List[str]] = None,
+    dry_run: bool = False,
+    workers: int = 8,
+    rescan: bool = False,
+    force: bool = False,
+    base_dir: str = ".",
+    index_path: Optional[str] = None
+) -> Dict[str, Dict[str, int]]:
+    """
+    按各阶段的保留时间 / 总大小策略清理存储，返回每个阶段的统计：
+    units / bytes（扫描到的）、deleted / reclaimed（删除的单元数与字节数）、protected、remaining、rescanned。
+    只有配置了策略的阶段会删除文件；dry_run 时只统计不删除；force 时不检查下游依赖
+    """
+    max_age = max_age or {}
+    max_bytes = max_bytes or {}
+    stages = stages or list(STAGE_LAYOUTS)
+    base = Path(base_dir)
+    roots = {stage: base / stage for stage in STAGE_LAYOUTS}
+    index_file = index_path or str(base / INDEX_PATH)
+    report: Dict[str, Dict[str, int]] = {}
+
+    with stage_lock("gc", "all", blocking=False, lock_root=str(base / ".zec_locks")) as acquired:
+        if not acquired:
+            logger.warning("另一个 zec gc 正在运行，本次跳过")
+            return report
+        index = {} if rescan else load_index(index_file)
+        now = time.time()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for stage in stages:
+                started = time.perf_counter()
+                state, rescanned = scan_stage(stage, roots, index.get(stage, {}))
+                entries = state["units"]
+                units = len(entries)
+                total = sum(record["bytes"] for record in entries.values())
+                selected, protected = ([], 0)
+                if stage in max_age or stage in max_bytes:
+                    selected, protected = plan_stage(stage, entries, now, max_age.get(stage), max_bytes.get(stage), force)
+
+                deleted = reclaimed = 0
+                if selected and not dry_run:
+                    paths = [roots[stage] / key for key in selected]
+                    batches = [paths[i:i + DELETE_BATCH] for i in range(0, len(paths), DELETE_BATCH)]
+                    failed = set()
+                    for batch_failures in pool.map(_delete_batch, batches):
+                        for path, error in batch_failures:
+                            logger.error(f"删除失败 {path}: {error}")
+                            failed.add(path)
+                    for key, path in zip(selected, paths):
+                        if path in failed:
+                            continue
+                        deleted += 1
+                        reclaimed += entries.pop(key)["bytes"]
+                    _prune_empty_dirs(paths, roots[stage])
+                elif selected:
+                    deleted = len(selected)
+                    reclaimed = sum(entries[key]["bytes"] for key in selected)
+
+                index[stage] = state
+                report[stage] = {
+                    "units": units,
+                    "bytes": total,
+                    "deleted": deleted,
+                    "reclaimed": reclaimed,
+                    "protected": protected,
+                    "remaining": total - reclaimed,
+                    "rescanned": rescanned,
+                }
+                if not dry_run:
+                    metrics.inc("gc_deleted_units_total", deleted, stage=stage)
+                    metrics.inc("gc_reclaimed_bytes_total", reclaimed, stage=stage)
+                metrics.set("gc_stage_bytes", total - reclaimed, stage=stage)
+                logger.info(
+                    f"{stage}: {units} 个单元 {total / 1024 ** 2:.1f} MB，"
+                    f"{'将' if dry_run else '已'}删除 {deleted} 个 / {reclaimed / 1024 ** 2:.1f} MB，"
+                    f"受保护 {protected} 个（重新统计 {rescanned} 个，{time.perf_counter() - started:.2f}s）"
+                )
+        save_index(index, index_file)
+    return report
@@ -0,0 +1,339 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import formatdate
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from zoom_earth_cli.blender import MOSAIC_SUFFIXES
+from zoom_earth_cli.blockwise import open_mosaic
+from zoom_earth_cli.const import COUNTRY_BOUNDS, get_bound_tile_range, get_satellite_tile_range, region_canvas
+from zoom_earth_cli.metrics import metrics
+
+# 最多向下提供几级 zoom（在存储的画布上按 2^n 降采样切片）
+MAX_OVERVIEW_LEVELS = 3
+# 新帧出现后多久能被看到：找不到时间戳时最多每隔这么久重新扫描一次目录
+RESCAN_INTERVAL = 30.0
+# 指定时间戳的切片内容不变（ETag 随源文件变化），"latest" 会指向新帧，缓存时间要短
+CACHE_CONTROL_FRAME = "public, max-age=86400"
+CACHE_CONTROL_LATEST = "public, max-age=60"
+
+_STATUS_TEXT = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+class ByteLRU:
+    """按字节数限制容量的 LRU 缓存（线程安全），超出容量时淘汰最久未使用的条目"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[object, Tuple[object, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._items[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+def scan_frames(base: Path, zoom: int) -> Dict[int, Path]:
+    """扫描 <base>/<zoom>/<YYYY-MM-DD>/<HHMM>.(png|npy)，返回 {UTC 时间戳: 路径}"""
+    frames = {}
+    for path in Path(base).glob(f"{zoom}/*/*"):
+        if path.suffix not in MOSAIC_SUFFIXES or path.name.endswith(".tmp.npy"):
+            continue
+        try:
+            dt = datetime.strptime(f"{path.parent.name} {path.stem}", "%Y-%m-%d %H%M")
+        except ValueError:
+            continue
+        frames[int(dt.replace(tzinfo=timezone.utc).timestamp())] = path
+    return frames
+
+
+def satellite_origin(zoom: int, satellite: str, region: str, downloads_dir: str = "downloads") -> Tuple[int, int]:
+    """
+    单颗卫星拼接图左上角对应的瓦片 (列, 行)。
+    优先读取下载阶段记录的 extent.json（x 为行、y 为列），否则按与 batch_download 相同的矩形求交计算。
+    """
+    extent_file = Path(downloads_dir) / region / satellite / str(zoom) / "extent.json"
+    if extent_file.exists():
+        extent = json.loads(extent_file.read_text(encoding="utf-8"))
+        return extent["y"][0], extent["x"][0]
+    rows, cols = get_satellite_tile_range(zoom, satellite)
+    if region in COUNTRY_BOUNDS:
+        c_rows, c_cols = get_bound_tile_range(zoom, COUNTRY_BOUNDS[region])
+        return max(cols.start, c_cols.start), max(rows.start, c_rows.start)
+    return cols.start, rows.start
+
+
+def blend_origin(zoom: int, region: str, downloads_dir: str = "downloads") -> Tuple[int, int]:
+    """混合画布左上角对应的瓦片 (列, 行)：与 blender 按 region_canvas 偏移放置各卫星的方式一致"""
+    _, _, offsets = region_canvas(region, zoom)
+    origins = {sat: satellite_origin(zoom, sat, region, downloads_dir) for sat in offsets}
+    return (
+        min(col - offsets[sat] for sat, (col, _) in origins.items()),
+        min(row for _, row in origins.values()),
+    )
+
+
+def render_tile(canvas: np.ndarray, origin: Tuple[int, int], zoom: int, z: int, x: int, y: int,
+                tile_size: int = 256) -> Optional[bytes]:
+    """
+    从存储 zoom 的画布上切出 XYZ 瓦片 (z, x, y) 并编码为 PNG；z 低于存储 zoom 时读取 2^n 倍窗口再降采样。
+    瓦片完全落在画布之外时返回 None。
+    """
+    scale = 2 ** (zoom - z)
+    size = tile_size * scale
+    left = (x * scale - origin[0]) * tile_size
+    top = (y * scale - origin[1]) * tile_size
+    height, width = canvas.shape[:2]
+    t0, l0 = max(top, 0), max(left, 0)
+    t1, l1 = min(top + size, height), min(left + size, width)
+    if t0 >= t1 or l0 >= l1:
+        return None
+
+    # 只读取与瓦片相交的窗口（npy 内存映射时只触及这些行）
+    window = np.asarray(canvas[t0:t1, l0:l1])
+    tile = np.zeros((size, size, 4), dtype=np.uint8)
+    target = tile[t0 - top:t1 - top, l0 - left:l1 - left]
+    target[..., :3] = window[..., :3]
+    target[..., 3] = window[..., 3] if window.shape[2] == 4 else 255
+
+    image = Image.fromarray(tile, "RGBA")
+    if scale > 1:
+        image = image.reduce(scale)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+class TileServer:
+    """
+    按需从混合帧（lighter_blend）或单星拼接图（mosaics）切出 XYZ 瓦片：
+      /{时间戳}/{z}/{x}/{y}.png            混合帧
+      /{卫星}/{时间戳}/{z}/{x}/{y}.png     单星拼接图
+      /timestamps.json                    可用时间戳
+    时间戳为 UTC 秒或 latest。切片结果放入按字节限制的 LRU，响应带 ETag / Cache-Control。
+    """
+
+    def __init__(
+        self,
+        region: str = "global",
+        zoom: int = 4,
+        blend_dir: str = "lighter_blend",
+        mosaics_dir: str = "mosaics",
+        downloads_dir: str = "downloads",
+        tile_size: int = 256,
+        cache_bytes: int = 256 * 1024 * 1024,
+        canvas_cache_bytes: int = 256 * 1024 * 1024,
+        workers: int = 4,
+        logger=logging
+    ):
+        self.region = region
+        self.zoom = zoom
+        self.blend_base = Path(blend_dir) / region
+        self.mosaics_base = Path(mosaics_dir) / region
+        self.downloads_dir = downloads_dir
+        self.tile_size = tile_size
+        self.tiles = ByteLRU(cache_bytes)
+        # 解码后的画布：PNG 需要整张解码，缓存以免每个瓦片重复解码；npy 为内存映射，几乎不占用预算
+        self.canvases = ByteLRU(canvas_cache_bytes)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.logger = logger
+        self._frames: Dict[Optional[str], Dict[int, Path]] = {}
+        self._scanned_at: Dict[Optional[str], float] = {}
+        self._origins: Dict[Optional[str], Tuple[int, int]] = {}
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+
+    def frames(self, satellite: Optional[str] = None, refresh: bool = False) -> Dict[int, Path]:
+        now = time.monotonic()
+        if refresh and now - self._scanned_at.get(satellite, 0) < RESCAN_INTERVAL:
+            refresh = False
+        if refresh or satellite not in self._frames:
+            base = self.blend_base if satellite is None else self.mosaics_base / satellite
+            self._frames[satellite] = scan_frames(base, self.zoom)
+            self._scanned_at[satellite] = now
+        return self._frames[satellite]
+
+    def origin(self, satellite: Optional[str] = None) -> Tuple[int, int]:
+        if satellite not in self._origins:
+            self._origins[satellite] = (
+                blend_origin(self.zoom, self.region, self.downloads_dir) if satellite is None
+                else satellite_origin(self.zoom, satellite, self.region, self.downloads_dir)
+            )
+        return self._origins[satellite]
+
+    def resolve(self, satellite: Optional[str], timestamp: str) -> Optional[Path]:
+        if timestamp == "latest":
+            frames = self.frames(satellite, refresh=True)
+            return frames[max(frames)] if frames else None
+        ts = int(timestamp)
+        path = self.frames(satellite).get(ts)
+        if path is None:
+            path = self.frames(satellite, refresh=True).get(ts)
+        return path
+
+    def _load_canvas(self, path: Path, mtime_ns: int) -> np.ndarray:
+        key = (str(path), mtime_ns)
+        canvas = self.canvases.get(key)
+        if canvas is None:
+            canvas = open_mosaic(path)
+            self.canvases.put(key, canvas, 0 if isinstance(canvas, np.memmap) else canvas.nbytes)
+        return canvas
+
+    def _render(self, path: Path, mtime_ns: int, origin: Tuple[int, int], z: int, x: int, y: int) -> Optional[bytes]:
+        return render_tile(self._load_canvas(path, mtime_ns), origin, self.zoom, z, x, y, self.tile_size)
+
+    async def tile(self, satellite: Optional[str], timestamp: str, z: int, x: int, y: int,
+                   if_none_match: Optional[str] = None) -> Tuple[int, Dict[str, str], bytes]:
+        if not (self.zoom - MAX_OVERVIEW_LEVELS <= z <= self.zoom) or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            return 404, {}, b""
+        path = self.resolve(satellite, timestamp)
+        if path is None:
+            return 404, {}, b""
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return 404, {}, b""
+
+        key = (str(path), stat.st_mtime_ns, z, x, y)
+        etag = '"' + hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest() + '"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": CACHE_CONTROL_LATEST if timestamp == "latest" else CACHE_CONTROL_FRAME,
+            "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        }
+        if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+            return 304, headers, b""
+
+        body = self.tiles.get(key)
+        if body is None:
+            # 同一瓦片的并发请求共享一次切片
+            future = self._inflight.get(key)
+            if future is None:
+                loop = asyncio.get_running_loop()
+                origin = self.origin(satellite)
+                future = loop.run_in_executor(
+                    self.executor, self._render, path, stat.st_mtime_ns, origin, z, x, y
+                )
+                self._inflight[key] = future
+                future.add_done_callback(lambda _: self._inflight.pop(key, None))
+            body = await asyncio.shield(future)
+            if body is None:
+                return 404, {}, b""
+            self.tiles.put(key, body, len(body))
+        headers["Content-Type"] = "image/png"
+        return 200, headers, body
+
+    async def respond(self, method: str, target: str, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        if method not in ("GET", "HEAD"):
+            return 405, {"Allow": "GET, HEAD"}, b""
+        parts = target.split("?", 1)[0].strip("/").split("/")
+        if parts == ["timestamps.json"]:
+            body = json.dumps({
+                "region": self.region,
+                "zoom": self.zoom,
+                "timestamps": sorted(self.frames(refresh=True)),
+            }).encode()
+            return 200, {"Content-Type": "application/json", "Cache-Control": "no-cache"}, body
+        if len(parts) not in (4, 5) or not parts[-1].endswith(".png"):
+            return 404, {}, b""
+        satellite = parts[0] if len(parts) == 5 else None
+        timestamp = parts[-4]
+        try:
+            z, x, y = int(parts[-3]), int(parts[-2]), int(parts[-1][:-4])
+            if timestamp != "latest":
+                int(timestamp)
+        except ValueError:
+            return 400, {}, b""
+        if satellite is not None and ("." in satellite or not (self.mosaics_base / satellite).is_dir()):
+            return 404, {}, b""
+        return await self.tile(satellite, timestamp, z, x, y, headers.get("if-none-match"))
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """最小的 HTTP/1.1 实现：只处理 GET/HEAD，支持 keep-alive"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    status, response_headers, body = await self.respond(method, target, headers)
+                except Exception as e:
+                    self.logger.error(f"切片失败 {target}: {e}")
+                    status, response_headers, body = 500, {}, b""
+                metrics.inc("serve_responses_total", status=status)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                response_headers["Content-Length"] = str(len(body))
+                response_headers["Connection"] = "keep-alive" if keep_alive else "close"
+                response_headers["Access-Control-Allow-Origin"] = "*"
+                head = f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, 'Internal Server Error')}\r\n"
+                head += "".join(f"{name}: {value}\r\n" for name, value in response_headers.items())
+                writer.write(head.encode("latin-1") + b"\r\n")
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8000) -> None:
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        frames = self.frames()
+        self.logger.info(
+            f"瓦片服务已启动: http://{host}:{port}/{{时间戳}}/{{z}}/{{x}}/{{y}}.png "
+            f"（{self.blend_base}，zoom={self.zoom}，{len(frames)} 帧）"
+        )
+        async with server:
+            await server.serve_forever()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
+        metrics.inc("serve_tile_cache_total", self.tiles.hits, result="hit")
+        metrics.inc("serve_tile_cache_total", self.tiles.misses, result="miss")
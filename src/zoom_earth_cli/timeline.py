@@ -0,0 +1,70 @@
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class TimelineIndex:
+    """
+    按卫星保存有序时间戳数组，用 searchsorted 批量回答
+    "某时刻或之前该卫星最新一帧是哪个时间戳" 的查询。
+    """
+
+    def __init__(self, times: Dict[str, Iterable[int]]):
+        self.satellites: List[str] = list(times.keys())
+        self.arrays: Dict[str, np.ndarray] = {
+            sat: np.unique(np.fromiter(ts_list, dtype=np.int64))
+            for sat, ts_list in times.items()
+        }
+
+    def all_timestamps(self) -> np.ndarray:
+        """所有卫星时间戳的并集（升序）"""
+        if not self.arrays:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(list(self.arrays.values())))
+
+    def latest_at_or_before(self, satellite: str, targets: np.ndarray) -> np.ndarray:
+        """返回每个目标时刻或之前该卫星的最新时间戳，无数据处为 -1"""
+        arr = self.arrays.get(satellite)
+        targets = np.asarray(targets, dtype=np.int64)
+        if arr is None or arr.size == 0:
+            return np.full(targets.shape, -1, dtype=np.int64)
+        idx = np.searchsorted(arr, targets, side="right") - 1
+        return np.where(idx >= 0, arr[np.clip(idx, 0, None)], -1)
+
+    def schedule(self, targets: Iterable[int]) -> "FrameSchedule":
+        """一次性为全部目标时刻生成帧调度表"""
+        target_arr = np.unique(np.fromiter(targets, dtype=np.int64))
+        sources = {sat: self.latest_at_or_before(sat, target_arr) for sat in self.satellites}
+        return FrameSchedule(target_arr, sources)
+
+
+class FrameSchedule:
+    """帧调度表：目标时刻 → 每颗卫星实际使用的源时间戳（-1 表示无可用数据）"""
+
+    def __init__(self, targets: np.ndarray, sources: Dict[str, np.ndarray]):
+        self.targets = targets
+        self.sources = sources
+
+    def __len__(self) -> int:
+        return int(self.targets.size)
+
+    def complete_mask(self) -> np.ndarray:
+        """所有卫星均已有数据的目标时刻掩码"""
+        mask = np.ones(self.targets.shape, dtype=bool)
+        for arr in self.sources.values():
+            mask &= arr >= 0
+        return mask
+
+    def sources_at(self, i: int) -> Dict[str, Optional[int]]:
+        """第 i 个目标时刻的源时间戳字典，无数据的卫星值为 None"""
+        result: Dict[str, Optional[int]] = {}
+        for sat, arr in self.sources.items():
+            ts = int(arr[i])
+            result[sat] = ts if ts >= 0 else None
+        return result
+
+    def rows(self, reverse: bool = False):
+        """逐行产出 (目标时刻, {卫星: 源时间戳或None})"""
+        order = range(len(self) - 1, -1, -1) if reverse else range(len(self))
+        for i in order:
+            yield int(self.targets[i]), self.sources_at(i)
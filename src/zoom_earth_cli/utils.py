@@ -4,11 +4,18 @@ import os
 import json
 from pathlib import Path
 import platform
+import time
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any
 import numpy as np
 from typing import Dict, Set
 
+from zoom_earth_cli import archive
+from zoom_earth_cli.const import PREVIEW_SCALES
+from zoom_earth_cli.metrics import metrics
+from zoom_earth_cli.timeline import TimelineIndex
+
 def get_system_font():
     """获取系统默认字体"""
     system = platform.system()
@@ -73,6 +80,15 @@ def generate_black_tile(satellite: str, timestamp: str, x: int, y: int, zoom: in
     except Exception as e:
         logging.error(f"生成全黑图片失败：{path}, 错误：{e}")
 
+def preview_dir(path: str, scale: int, root: str = "previews") -> str:
+    """预览输出与原输出平行的目录树，如 mosaics/global -> previews/1-4/mosaics/global"""
+    if scale not in PREVIEW_SCALES:
+        raise ValueError(f"不支持的预览缩放倍数: {scale}，可选: {PREVIEW_SCALES}")
+    parts = Path(path).parts
+    if Path(path).is_absolute():
+        parts = parts[1:]
+    return str(Path(root, f"1-{scale}", *parts))
+
 def validate_coordinates(filename: str) -> tuple:
     """解析文件名中的坐标"""
     try:
@@ -89,11 +105,19 @@ def concat_tiles(
     rotate_deg: int = 0,  # 新增旋转参数
     reverse_y: bool = False,
     show_coords: bool = False,
-    swap_xy: bool = True  # 新增坐标轴交换参数
+    swap_xy: bool = True,  # 新增坐标轴交换参数
+    extent: Optional[Dict[str, List[int]]] = None,
+    tile_filter: Optional[Callable[[int, int], bool]] = None
 ):
-    """拼接卫星图片（支持旋转）"""
-    # 如果输出文件已存在则跳过拼接
-    if output_path.exists():
+    """
+    拼接卫星图片（支持旋转）
+
+    extent: 文件名坐标的闭区间范围 {"x": [min, max], "y": [min, max]}，
+            指定后画布按该范围生成，缺失的瓦片留黑，保证各时间点尺寸与偏移一致
+    tile_filter: 按文件名坐标 (x, y) 判断瓦片是否参与拼接
+    """
+    # 如果输出文件已存在（或已归档）则跳过拼接
+    if archive.exists(output_path):
         logging.info(f"拼接图已存在，跳过: {output_path}")
         return
     # 验证旋转角度有效性
@@ -104,9 +128,12 @@ def concat_tiles(
     # 生成瓦片坐标映射（基于预定义范围）
     # 收集瓦片并解析坐标
     coord_map = {}
-    for tile_file in tile_dir.glob("x*_y*.jpg"):
+    # 已归档的日期从日包中列出瓦片
+    for tile_file in archive.list_files(tile_dir, "x*_y*.jpg"):
         x, y = validate_coordinates(tile_file.name)
         if x is not None and y is not None:
+            if tile_filter is not None and not tile_filter(x, y):
+                continue
             # 根据参数交换坐标轴
             if swap_xy:
                 x, y = y, x  # 交换XY坐标
@@ -117,8 +144,14 @@ def concat_tiles(
         return
 
     # 计算坐标范围
-    x_coords = {x for x, _ in coord_map}
-    y_coords = {y for _, y in coord_map}
+    if extent:
+        file_x = set(range(extent["x"][0], extent["x"][1] + 1))
+        file_y = set(range(extent["y"][0], extent["y"][1] + 1))
+        x_coords, y_coords = (file_y, file_x) if swap_xy else (file_x, file_y)
+        coord_map = {k: v for k, v in coord_map.items() if k[0] in x_coords and k[1] in y_coords}
+    else:
+        x_coords = {x for x, _ in coord_map}
+        y_coords = {y for _, y in coord_map}
     
     # 根据旋转角度调整坐标轴
     if rotate_deg in (90, 270):
@@ -134,7 +167,13 @@ def concat_tiles(
     # 拼接处理（带旋转）
     for (orig_x, orig_y), path in coord_map.items():
         try:
-            img = Image.open(path)
+            decode_started = time.perf_counter()
+            with archive.open_frame(path) as fp:
+                img = Image.open(fp)
+                # 输出尺寸小于原瓦片时让 JPEG 解码器直接按 1/2、1/4、1/8 缩小解码（DCT 缩放）
+                img.draft("RGB", (tile_size, tile_size))
+                img.load()
+            metrics.observe("decode_seconds", time.perf_counter() - decode_started, stage="concat")
             
             # 应用旋转（保持比例）
             if rotate_deg != 0:
@@ -182,10 +221,22 @@ def concat_tiles(
 
     # 保存结果
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    canvas.save(output_path, quality=95)
+    with metrics.timer("save_seconds", stage="concat"):
+        canvas.save(output_path, quality=95)
     logging.info(f"生成拼接图: {output_path}")
 
-def add_feather_alpha(img, feather_width=100, black_threshold=10, debug=True):
+@lru_cache(maxsize=32)
+def _edge_feather_row(width: int, feather_width: int) -> np.ndarray:
+    """左右两侧线性渐变的单行羽化系数（按宽度缓存）"""
+    feather = np.ones(width, dtype=np.float32)
+    # 左侧渐变（0 → 1）
+    feather[:feather_width] = np.linspace(0, 1, feather_width)
+    # 右侧渐变（1 → 0）
+    feather[-feather_width:] = np.linspace(1, 0, feather_width)
+    feather.setflags(write=False)
+    return feather
+
+def add_feather_alpha(img, feather_width=100, black_threshold=10, debug=False):
     """为图像添加透明度通道和羽化效果"""
     # 转换为RGBA模式
     img = img.convert("RGBA")
@@ -193,29 +244,20 @@ def add_feather_alpha(img, feather_width=100, black_threshold=10, debug=True):
     height, width = img.height, img.width  # 注意这里的顺序是(height, width)
     
     # 创建基础Alpha通道（非黑色区域不透明）
-    r, g, b, a = data.T  # 这里转置后维度变为 (channels, height, width)
-    black_mask = (r <= black_threshold) & (g <= black_threshold) & (b <= black_threshold)
-    alpha = np.where(black_mask, 0, 255).astype(np.uint8).T  # 需要再次转置回(height, width)
+    rgb = data[..., :3]
+    black_mask = (rgb <= black_threshold).all(axis=2)
     
-    # 生成水平羽化渐变（修正维度顺序）
-    feather = np.ones((height, width), dtype=np.float32)  # 使用(height, width)顺序
-    
-    # 左侧渐变（0 → 1）
-    feather[:, :feather_width] = np.linspace(0, 1, feather_width)
-    # 右侧渐变（1 → 0）
-    feather[:, -feather_width:] = np.linspace(1, 0, feather_width)
-    
-    # 应用羽化到Alpha通道（现在两个数组维度一致）
-    alpha = (alpha.astype(np.float32) * feather).clip(0, 255).astype(np.uint8)
-    
-    data[..., 3] = alpha
+    # 水平羽化渐变只与宽度有关，按行广播到整张图
+    feather = _edge_feather_row(width, feather_width)
+    data[..., 3] = np.where(black_mask, 0, (255 * feather)[None, :]).astype(np.uint8)
+
     # 调试输出
     if debug:
         # 保存各阶段结果
         debug_dir = "debug_output"
         os.makedirs(debug_dir, exist_ok=True)
         # 保存羽化蒙版
-        Image.fromarray((feather*255).astype(np.uint8)).save(f"{debug_dir}/feather_mask.png")
+        Image.fromarray(np.broadcast_to((feather*255).astype(np.uint8), (height, width))).save(f"{debug_dir}/feather_mask.png")
         # 保存最终效果
         preview = Image.alpha_composite(img.convert("RGBA"), Image.fromarray(data))
         preview.save(f"{debug_dir}/final_preview.png")
@@ -350,58 +392,23 @@ def process_latest_times(latest_times: Dict[str, List[int]], hours: int = 2) ->
         print("Warning: No timestamps remain after filtering.")
         return []
 
-    sorted_timestamps = sorted(list(all_timestamps_set))
+    # 4. Build a timeline index and resolve the latest timestamp per satellite for every master timestamp in one pass
+    index = TimelineIndex({sat: filtered_data.get(sat, []) for sat in satellites})
+    schedule = index.schedule(all_timestamps_set)
 
-    # 4. Find the first "master" timestamp where *all* satellites have at least one data point <= that timestamp
-    start_ts: Optional[int] = None
-    start_index: int = -1
-    for i, ts in enumerate(sorted_timestamps):
-        all_sats_have_data = True
-        for sat in satellites:
-            # Check if there exists any timestamp for this satellite <= current ts
-            has_data_at_or_before_ts = any(t <= ts for t in filtered_data.get(sat, []))
-            if not has_data_at_or_before_ts:
-                all_sats_have_data = False
-                break  # No need to check other satellites for this ts
-
-        if all_sats_have_data:
-            start_ts = ts
-            start_index = i
-            break # Found the first valid starting timestamp
-
-    # If no timestamp exists where all satellites have data (e.g., one satellite never reported)
-    if start_ts is None:
+    # 5. Only keep master timestamps from the point where *all* satellites have reported at least once
+    complete = schedule.complete_mask()
+    if not complete.any():
         print(f"Warning: Could not find a timestamp where all satellites ({', '.join(satellites)}) have data.")
         return []
+    start_index = int(np.argmax(complete))
 
-    # 5. Initialize the 'last known timestamp' for each satellite based on the found start_ts
-    current_latest_ts: Dict[str, int] = {}
-    for sat in satellites:
-        # Find the maximum timestamp for this satellite that is <= start_ts
-        # We know at least one exists because of the check in step 4
-        relevant_times = [t for t in filtered_data.get(sat, []) if t <= start_ts]
-        # This list is guaranteed non-empty by the logic in step 4
-        current_latest_ts[sat] = max(relevant_times)
-
-
-    # 6. Iterate through sorted timestamps *starting from the valid start index*
+    # 6. Populate the result entries starting from the valid start index
     result: List[Dict[str, Any]] = []
-    for i in range(start_index, len(sorted_timestamps)):
-        master_ts = sorted_timestamps[i]
-        entry: Dict[str, Any] = {'timestamp': master_ts}
-
-        # Update the 'last known timestamp' for any satellite that has a new data point *at* master_ts
+    for i in range(start_index, len(schedule)):
+        entry: Dict[str, Any] = {'timestamp': int(schedule.targets[i])}
         for sat in satellites:
-             # Check if this satellite specifically reported at master_ts
-             # Using a set could be faster for large lists, but requires pre-conversion
-             if master_ts in filtered_data.get(sat, []):
-                 current_latest_ts[sat] = master_ts
-             # Otherwise, current_latest_ts[sat] remains unchanged (carry-forward)
-
-        # Populate the result entry with the current latest timestamp for each satellite
-        for sat in satellites:
-            entry[sat] = current_latest_ts[sat]
-
+            entry[sat] = int(schedule.sources[sat][i])
         result.append(entry)
 
     return result
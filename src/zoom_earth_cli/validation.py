@@ -0,0 +1,179 @@
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# 瓦片默认尺寸（宽, 高）
+TILE_SIZE = (256, 256)
+
+# 帧头（含 SOF 段）最多缓冲这么多字节；正常瓦片的帧头远小于该值
+MAX_HEADER_BYTES = 64 * 1024
+
+SOI = b"\xff\xd8"
+EOI = b"\xff\xd9"
+# SOF0-SOF15，排除 DHT(C4) / JPG(C8) / DAC(CC)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+SOS_MARKER = 0xDA
+# 不带长度字段的独立标记（TEM / RSTn）
+STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8)}
+
+
+class JPEGStreamValidator:
+    """
+    边下载边检查 JPEG 结构，不做完整解码：
+    开头必须是 SOI，SOS 之前必须出现 SOF 且尺寸符合预期，结尾必须是 EOI。
+    """
+
+    def __init__(self, expected_size: Optional[Tuple[int, int]] = TILE_SIZE):
+        self.expected_size = expected_size
+        self.width: Optional[int] = None
+        self.height: Optional[int] = None
+        self.size = 0
+        self.error: Optional[str] = None
+        self._header = bytearray()
+        self._header_done = False
+        self._tail = b""
+
+    def feed(self, chunk: bytes) -> bool:
+        """送入下一段数据；返回目前为止是否仍然有效（无效时可提前中止下载）"""
+        if not chunk:
+            return self.error is None
+        self.size += len(chunk)
+        self._tail = (self._tail + chunk[-2:])[-2:]
+        if not self._header_done and self.error is None:
+            self._header += chunk
+            self._parse_header()
+        return self.error is None
+
+    def _parse_header(self) -> None:
+        buf = self._header
+        if len(buf) >= 2 and buf[:2] != SOI:
+            self.error = "缺少 SOI 标记（可能是 HTML/错误页面）"
+            return
+        pos = 2
+        while pos + 2 <= len(buf):
+            if buf[pos] != 0xFF:
+                self.error = f"段标记错误（偏移 {pos}）"
+                return
+            marker = buf[pos + 1]
+            if marker == 0xFF:  # 填充字节
+                pos += 1
+                continue
+            if marker in STANDALONE_MARKERS:
+                pos += 2
+                continue
+            if marker == SOS_MARKER or marker == EOI[1]:
+                self.error = "SOF 之前出现扫描数据或结束标记"
+                return
+            if pos + 4 > len(buf):
+                break
+            length = (buf[pos + 2] << 8) | buf[pos + 3]
+            if length < 2:
+                self.error = f"段长度错误（偏移 {pos}）"
+                return
+            if marker in SOF_MARKERS:
+                if pos + 9 > len(buf):
+                    break
+                self.height = (buf[pos + 5] << 8) | buf[pos + 6]
+                self.width = (buf[pos + 7] << 8) | buf[pos + 8]
+                self._header_done = True
+                self._header = bytearray()
+                if self.expected_size and (self.width, self.height) != tuple(self.expected_size):
+                    self.error = f"尺寸 {self.width}x{self.height} 与预期 {self.expected_size[0]}x{self.expected_size[1]} 不符"
+                return
+            pos += 2 + length
+
+        if len(buf) > MAX_HEADER_BYTES:
+            self.error = f"前 {MAX_HEADER_BYTES} 字节内未找到 SOF"
+
+    @property
+    def header_parsed(self) -> bool:
+        return self._header_done
+
+    def skip_to_end(self, tail: bytes, total_size: int) -> None:
+        """跳过扫描数据，直接给出文件末尾字节与总大小（用于已落盘文件的快速检查）"""
+        self._tail = tail[-2:]
+        self.size = total_size
+
+    def finish(self) -> Optional[str]:
+        """数据结束后调用；有效返回 None，否则返回原因"""
+        if self.error:
+            return self.error
+        if self.size < 4:
+            return f"数据过短（{self.size} 字节）"
+        if not self._header_done:
+            return "未找到 SOF（帧头不完整）"
+        if self._tail != EOI:
+            return "缺少 EOI 标记（数据被截断）"
+        return None
+
+
+def validate_jpeg_file(path: Path, expected_size: Optional[Tuple[int, int]] = TILE_SIZE) -> Optional[str]:
+    """检查已落盘的 JPEG：只读取帧头与最后两个字节。有效返回 None，否则返回原因"""
+    validator = JPEGStreamValidator(expected_size)
+    with open(path, "rb") as f:
+        while not validator.header_parsed and validator.error is None:
+            chunk = f.read(8192)
+            if not chunk:
+                break
+            validator.feed(chunk)
+        size = os.fstat(f.fileno()).st_size
+        if size > validator.size:
+            f.seek(size - 2)
+            validator.skip_to_end(f.read(2), size)
+    return validator.finish()
+
+
+def verify_store(
+    root: str,
+    quarantine_dir: Optional[str] = "quarantine",
+    workers: int = 8,
+    expected_size: Optional[Tuple[int, int]] = TILE_SIZE,
+    logger=logging
+) -> Dict[str, object]:
+    """
+    并行检查 root 下全部瓦片，损坏的文件按原相对路径移入 quarantine_dir。
+    quarantine_dir 为 None 时只报告不移动。返回统计 {checked, corrupt, quarantined, reasons}
+    """
+    root_path = Path(root)
+    files = sorted(root_path.rglob("*.jpg"))
+    logger.info(f"开始校验 {root_path} 下的 {len(files)} 个瓦片（{workers} 线程）")
+
+    def _check(path: Path) -> Tuple[Path, Optional[str]]:
+        try:
+            return path, validate_jpeg_file(path, expected_size)
+        except OSError as e:
+            return path, f"读取失败: {e}"
+
+    corrupt: List[Tuple[Path, str]] = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, reason in executor.map(_check, files, chunksize=64):
+            if reason:
+                corrupt.append((path, reason))
+
+    def _quarantine(item: Tuple[Path, str]) -> bool:
+        path, reason = item
+        target = Path(quarantine_dir) / path.relative_to(root_path)
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(path), str(target))
+            logger.warning(f"已隔离损坏瓦片: {path} -> {target}（{reason}）")
+            return True
+        except OSError as e:
+            logger.error(f"隔离失败 {path}: {e}")
+            return False
+
+    quarantined = 0
+    if quarantine_dir:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            quarantined = sum(executor.map(_quarantine, corrupt))
+    else:
+        for path, reason in corrupt:
+            logger.warning(f"损坏瓦片: {path}（{reason}）")
+
+    reasons: Dict[str, int] = {}
+    for _, reason in corrupt:
+        reasons[reason] = reasons.get(reason, 0) + 1
+    return {"checked": len(files), "corrupt": len(corrupt), "quarantined": quarantined, "reasons": reasons}
@@ -0,0 +1,86 @@
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from zoom_earth_cli import archive
+from zoom_earth_cli.blender import build_blend_schedule, load_mosaic_array
+from zoom_earth_cli.concat import process_concat_core
+from zoom_earth_cli.ffmpeg import collapse_duplicate_frames, collect_timelapse_frames, encode_frame_runs
+
+
+def _tile(path: Path, value: int):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGB", (256, 256), (value, value, value)).save(path)
+
+
+def test_pack_day_roundtrip_and_listing(tmp_path):
+    day = tmp_path / "downloads" / "japan" / "himawari" / "4" / "2025-03-21"
+    _tile(day / "0200" / "x5_y13.jpg", 40)
+    _tile(day / "0200" / "x6_y13.jpg", 80)
+    _tile(day / "0210" / "x5_y13.jpg", 120)
+    original = (day / "0200" / "x6_y13.jpg").read_bytes()
+
+    files, size, packed = archive.pack_day(day)
+
+    assert files == 3 and not day.exists() and (day.parent / "2025-03-21.zpk").is_file()
+    assert archive.list_dirs(day.parent) == [day]
+    assert archive.list_dirs(day) == [day / "0200", day / "0210"]
+    assert archive.list_files(day / "0200", "x*_y*.jpg") == [day / "0200" / "x5_y13.jpg", day / "0200" / "x6_y13.jpg"]
+    with archive.open_frame(day / "0200" / "x6_y13.jpg") as fp:
+        assert fp.read() == original
+    assert archive.exists(day / "0210" / "x5_y13.jpg") and not archive.exists(day / "0210" / "x6_y13.jpg")
+
+    # 归档后补下载的帧：再次归档时与已有日包合并
+    _tile(day / "0220" / "x5_y13.jpg", 160)
+    archive.pack_day(day)
+    assert archive.list_dirs(day) == [day / "0200", day / "0210", day / "0220"]
+    with archive.open_frame(day / "0200" / "x6_y13.jpg") as fp:
+        assert fp.read() == original
+
+
+def test_concat_and_blend_read_archived_days(tmp_path):
+    zoom_dir = tmp_path / "downloads" / "japan" / "himawari" / "4"
+    _tile(zoom_dir / "2025-03-21" / "0200" / "x5_y13.jpg", 60)
+    _tile(zoom_dir / "2025-03-21" / "0200" / "x6_y13.jpg", 90)
+    archive.pack_day(zoom_dir / "2025-03-21")
+
+    mosaics = tmp_path / "mosaics" / "japan"
+    process_concat_core(
+        str(tmp_path / "downloads" / "japan"), str(mosaics), 256, 0, False, None, 0, logging, output_format="npy"
+    )
+    mosaic_path = mosaics / "himawari" / "4" / "2025-03-21" / "0200.npy"
+    expected = np.load(mosaic_path)
+    assert expected.shape == (512, 256, 3) and abs(int(expected[300, 10, 0]) - 90) <= 3
+
+    files, size, packed = archive.pack_day(mosaic_path.parent)
+    assert packed < size  # npy 条目压缩存储
+    all_files, schedule = build_blend_schedule(mosaics, 0, 4, logging)
+    assert list(all_files["himawari"].values()) == [mosaic_path]
+    assert np.array_equal(load_mosaic_array(mosaic_path), expected)
+
+
+def test_video_frames_from_pack_share_duplicates(tmp_path):
+    day = tmp_path / "lighter_blend" / "japan" / "4" / "2025-03-21"
+    for minute, value in (("00", 30), ("10", 200)):
+        path = day / f"02{minute}.png"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        Image.new("RGBA", (64, 32), (value, value, value, 255)).save(path)
+    os.link(day / "0210.png", day / "0220.png")
+    archive.pack_day(day)
+
+    frames = collect_timelapse_frames(str(day.parent), duration_hours=1)
+    assert [Path(path).name for _, path in frames] == ["0200.png", "0210.png", "0220.png"]
+    runs = collapse_duplicate_frames([path for _, path in frames])
+    assert [count for _, count in runs] == [1, 2]
+    assert archive.ffmpeg_input(runs[1][0]).startswith("subfile,,start,")
+
+    if shutil.which("ffmpeg") is None:
+        pytest.skip("未安装 ffmpeg")
+    output = tmp_path / "out.mp4"
+    encode_frame_runs(runs, str(output), framerate=10)
+    assert output.stat().st_size > 0
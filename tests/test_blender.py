@@ -0,0 +1,163 @@
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from zoom_earth_cli import blender
+from zoom_earth_cli.const import region_canvas
+from zoom_earth_cli.locking import ClaimSet, blend_claim_key
+from zoom_earth_cli.metrics import metrics
+
+
+def _mosaic(path: Path, value: int, size=(256, 512)):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGB", size, (value, value, value)).save(path)
+
+
+def test_blend_stream_reports_total_frames(tmp_path, monkeypatch):
+    mosaics = tmp_path / "mosaics" / "japan"
+    for minute in ("00", "10", "20"):
+        _mosaic(mosaics / "himawari" / "4" / "2025-03-21" / f"02{minute}.png", 80)
+    captured = {}
+
+    def fake_encode(frames, width, height, output_file, framerate=30, total_frames=None, logger=logging):
+        captured["total_frames"] = total_frames
+        return sum(1 for _ in frames)
+
+    monkeypatch.setattr(blender, "encode_frame_stream", fake_encode)
+    written = blender.process_blend_stream(str(mosaics), "out.mp4", 0, 256, 512, {"himawari": 0}, logging)
+
+    assert written == 3 and captured["total_frames"] == 3
+
+
+def test_blend_stream_tee_waits_for_previous_save(tmp_path, monkeypatch):
+    mosaics = tmp_path / "mosaics" / "japan"
+    for index, minute in enumerate(("00", "10", "20", "30")):
+        _mosaic(mosaics / "himawari" / "4" / "2025-03-21" / f"02{minute}.png", 40 + index * 40)
+    saved = []
+    save = blender._save_canvas_returning_path
+
+    def slow_save(canvas, output_path):
+        time.sleep(0.05)
+        saved.append(output_path)
+        return save(canvas, output_path)
+
+    backlog = []
+
+    def fake_encode(frames, width, height, output_file, framerate=30, total_frames=None, logger=logging):
+        count = 0
+        for _ in frames:
+            count += 1
+            backlog.append(count - len(saved))
+        return count
+
+    monkeypatch.setattr(blender, "_save_canvas_returning_path", slow_save)
+    monkeypatch.setattr(blender, "encode_frame_stream", fake_encode)
+    tee_dir = tmp_path / "lighter_blend" / "japan"
+    written = blender.process_blend_stream(
+        str(mosaics), "out.mp4", 0, 256, 512, {"himawari": 0}, logging, tee_dir=str(tee_dir)
+    )
+
+    # 编码器取帧时最多只有当前一帧的 PNG 尚未写完
+    assert written == 4 and max(backlog) <= 1
+    assert len(list((tee_dir / "4" / "2025-03-21").glob("*.png"))) == 4
+
+
+def test_parallel_blend_decodes_upcoming_sources_concurrently(tmp_path, monkeypatch):
+    mosaics = tmp_path / "mosaics" / "japan"
+    for index, minute in enumerate(("00", "10", "20", "30")):
+        _mosaic(mosaics / "himawari" / "4" / "2025-03-21" / f"02{minute}.png", 40 + index * 40)
+    load = blender.load_mosaic_array
+    active = {"now": 0, "max": 0}
+    lock = threading.Lock()
+
+    def slow_load(image_path):
+        with lock:
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+        time.sleep(0.1)
+        try:
+            return load(image_path)
+        finally:
+            with lock:
+                active["now"] -= 1
+
+    monkeypatch.setattr(blender, "load_mosaic_array", slow_load)
+    output = tmp_path / "lighter_blend" / "japan"
+    generated, skipped = blender.process_blend_core(
+        str(mosaics), str(output), 0, 256, 512, {"himawari": 0}, logging, workers=2
+    )
+
+    assert (generated, skipped) == (4, 0)
+    # 每个时间戳只需要一张新拼接图：后续任务的解码已提前提交，而不是逐个串行等待
+    assert active["max"] >= 2
+    with Image.open(output / "4" / "2025-03-21" / "0230.png") as img:
+        assert img.getpixel((10, 10))[0] == 160
+
+
+def _unchanged_source_fixture(tmp_path):
+    # msg-zero 在 02:10 发布新图，但不参与 japan 的混合：02:10 的源图像组合与 02:00 相同
+    mosaics = tmp_path / "mosaics" / "japan"
+    _mosaic(mosaics / "himawari" / "4" / "2025-03-21" / "0200.png", 120)
+    _mosaic(mosaics / "msg-zero" / "4" / "2025-03-21" / "0200.png", 10)
+    _mosaic(mosaics / "msg-zero" / "4" / "2025-03-21" / "0210.png", 20)
+    output = tmp_path / "lighter_blend" / "japan"
+    return mosaics, output, output / "4" / "2025-03-21"
+
+
+def test_blend_links_frame_with_unchanged_sources(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    metrics.reset()
+    mosaics, output, day = _unchanged_source_fixture(tmp_path)
+
+    generated, skipped = blender.process_blend_core(str(mosaics), str(output), 0, 256, 512, {"himawari": 0}, logging)
+
+    assert (generated, skipped) == (2, 0)
+    assert os.stat(day / "0210.png").st_ino == os.stat(day / "0200.png").st_ino
+    assert metrics.counter_value("blend_frames_total", result="rendered") == 1
+    assert metrics.counter_value("blend_frames_total", result="linked") == 1
+
+
+def test_blend_defers_links_to_frames_claimed_elsewhere(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    metrics.reset()
+    mosaics, output, day = _unchanged_source_fixture(tmp_path)
+    # 从最新的时间戳开始处理：02:10 混合后 02:00 引用它。另一个进程已认领 02:10，尚未写完
+    other = ClaimSet("blend", "japan-4")
+    assert other.try_claim(blend_claim_key(day / "0210.png"))
+
+    generated, skipped = blender.process_blend_core(str(mosaics), str(output), 0, 256, 512, {"himawari": 0}, logging)
+
+    assert (generated, skipped) == (0, 0) and not (day / "0200.png").exists()
+    assert metrics.counter_value("blend_frames_total", result="link_deferred") == 1
+
+    # 对方写完后再次运行：02:10 已存在，02:00 直接引用
+    _mosaic(day / "0210.png", 120)
+    other.release_all()
+    blender.process_blend_core(str(mosaics), str(output), 0, 256, 512, {"himawari": 0}, logging)
+    assert os.stat(day / "0210.png").st_ino == os.stat(day / "0200.png").st_ino
+
+
+def test_blend_places_satellites_by_zoom(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # zoom 5 下中国画布从第 21 列开始，himawari 从第 22 列开始：偏移仍是 1 个瓦片，而不是按 zoom 加倍
+    width, height, offsets = region_canvas("china", 5)
+    assert (width, height, offsets) == (1792, 2048, {"msg-iodc": 0, "himawari": 1})
+    assert region_canvas("global", 5)[2]["himawari"] == 22
+
+    mosaics = tmp_path / "mosaics" / "china"
+    _mosaic(mosaics / "msg-iodc" / "5" / "2025-03-21" / "0200.png", 60, size=(256, height))
+    _mosaic(mosaics / "himawari" / "5" / "2025-03-21" / "0200.png", 200, size=(512, height))
+    output = tmp_path / "lighter_blend" / "china"
+
+    generated, _ = blender.process_blend_core(str(mosaics), str(output), 0, width, height, offsets, logging, zoom_level=5)
+
+    assert generated == 1
+    with Image.open(output / "5" / "2025-03-21" / "0200.png") as img:
+        assert img.size == (width, height)
+        assert img.getpixel((100, 100))[0] == 60
+        assert img.getpixel((256 + 100, 100))[0] == 200
+        assert img.getpixel((768 + 100, 100))[3] == 0
@@ -0,0 +1,52 @@
+import numpy as np
+from PIL import Image
+
+from zoom_earth_cli.blockwise import PNGStripWriter, blend_blockwise, concat_tiles_blockwise
+from zoom_earth_cli.compositor import compose_frame
+
+
+def test_png_strip_writer_roundtrip(tmp_path):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(37, 23, 4), dtype=np.uint8)
+    path = tmp_path / "strip.png"
+
+    with PNGStripWriter(path, 23, 37, channels=4) as writer:
+        for top in range(0, 37, 10):
+            writer.write(image[top:top + 10])
+
+    with Image.open(path) as img:
+        assert img.mode == "RGBA"
+        assert np.array_equal(np.asarray(img), image)
+
+
+def test_blockwise_blend_matches_full_canvas(tmp_path):
+    rng = np.random.default_rng(1)
+    left = rng.integers(0, 256, size=(40, 30, 3), dtype=np.uint8)
+    right = rng.integers(0, 256, size=(32, 30, 3), dtype=np.uint8)
+    np.save(tmp_path / "left.npy", left)
+    Image.fromarray(right).save(tmp_path / "right.png")
+
+    for mode in ("lighter", "feather"):
+        output = tmp_path / f"{mode}.png"
+        blend_blockwise(
+            [("a", tmp_path / "left.npy", 0), ("b", tmp_path / "right.png", 20)],
+            output, 50, 40, mode=mode, block_rows=16,
+        )
+        expected = compose_frame([("a", left, 0), ("b", right, 20)], 50, 40, mode=mode)
+        with Image.open(output) as img:
+            assert np.array_equal(np.asarray(img), expected)
+
+
+def test_concat_blockwise_writes_memmap_canvas(tmp_path):
+    tile_dir = tmp_path / "tiles"
+    tile_dir.mkdir()
+    Image.new("RGB", (8, 8), (250, 250, 250)).save(tile_dir / "x4_y2.jpg")
+    Image.new("RGB", (8, 8), (250, 250, 250)).save(tile_dir / "x5_y3.jpg")
+
+    output = tmp_path / "mosaic.npy"
+    assert concat_tiles_blockwise(tile_dir, output, tile_size=8)
+
+    canvas = np.load(output, mmap_mode="r")
+    assert canvas.shape == (16, 16, 3)
+    assert canvas[4, 4, 0] > 200 and canvas[12, 12, 0] > 200
+    assert not canvas[4, 12].any() and not canvas[12, 4].any()
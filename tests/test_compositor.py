@@ -0,0 +1,43 @@
+import numpy as np
+from PIL import Image, ImageChops
+
+from zoom_earth_cli.compositor import compose_frame, composite_lighter
+
+
+def test_composite_lighter_matches_pil_paste_and_lighter():
+    rng = np.random.default_rng(0)
+    canvas_img = Image.fromarray(rng.integers(0, 255, (32, 64, 4), dtype=np.uint8), "RGBA")
+    mosaic = rng.integers(0, 255, (32, 48, 3), dtype=np.uint8)
+
+    mosaic_rgba = Image.fromarray(mosaic, "RGB").convert("RGBA")
+    temp_canvas = Image.new("RGBA", canvas_img.size, (0, 0, 0, 0))
+    temp_canvas.paste(mosaic_rgba, (24, 0), mosaic_rgba)
+    expected = np.asarray(ImageChops.lighter(canvas_img, temp_canvas))
+
+    canvas = np.array(canvas_img)
+    composite_lighter(canvas, mosaic, 24)
+
+    assert np.array_equal(canvas, expected)
+
+
+def test_feather_mode_cross_fades_only_inside_overlap():
+    left = np.full((4, 20, 3), 200, dtype=np.uint8)
+    right = np.full((4, 20, 3), 100, dtype=np.uint8)
+    layers = [("goes-east", left, 0), ("mtg-zero", right, 10)]
+
+    canvas = compose_frame(layers, 30, 4, mode="feather", feather_width=8)
+
+    assert (canvas[:, :10, :3] == 200).all()
+    assert (canvas[:, 20:, :3] == 100).all()
+    seam = canvas[0, 10:20, 0].astype(int)
+    assert (np.diff(seam) <= 0).all() and seam[0] > seam[-1]
+    assert (canvas[..., 3] == 255).all()
+
+
+def test_priority_mode_assigns_each_column_to_one_satellite():
+    left = np.full((2, 20, 3), 200, dtype=np.uint8)
+    right = np.full((2, 20, 3), 100, dtype=np.uint8)
+
+    canvas = compose_frame([("a", left, 0), ("b", right, 10)], 30, 2, mode="priority")
+
+    assert set(np.unique(canvas[..., 0])) == {100, 200}
@@ -0,0 +1,53 @@
+import json
+
+import numpy as np
+
+from zoom_earth_cli.coverage import get_region_tiles, polygon_tiles
+
+
+def _write_geojson(path, features):
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features}), encoding="utf-8")
+
+
+def _rings(rings):
+    return [np.asarray(ring, dtype=float) for ring in rings]
+
+
+def _feature(iso, coordinates):
+    return {
+        "type": "Feature",
+        "properties": {"ISO_A3": iso},
+        "geometry": {"type": "Polygon", "coordinates": coordinates},
+    }
+
+
+def test_triangle_skips_tiles_outside_polygon():
+    # zoom 2 下每个瓦片跨 90 度经度；外接矩形为 2x2 瓦片，三角形不覆盖右上角
+    rings = _rings([[(-170, -50), (-20, -50), (-170, 50), (-170, -50)]])
+    tiles = polygon_tiles(rings, zoom=2)
+
+    assert tiles == {(1, 0), (2, 0), (2, 1)}
+
+
+def test_hole_excludes_inner_tiles():
+    outer = [(-179, -80), (179, -80), (179, 80), (-179, 80), (-179, -80)]
+    hole = [(-100, -60), (-100, 60), (100, 60), (100, -60), (-100, -60)]
+    tiles = polygon_tiles(_rings([outer, hole]), zoom=3)
+
+    assert (3, 3) not in tiles and (4, 4) not in tiles
+    assert (0, 0) in tiles and (7, 7) in tiles
+
+
+def test_region_tiles_cached_per_region_and_zoom(tmp_path):
+    geojson = tmp_path / "regions.geojson"
+    _write_geojson(geojson, [
+        _feature("CHN", [[(75, 20), (135, 20), (135, 50), (75, 50), (75, 20)]]),
+        _feature("FRA", [[(-5, 42), (8, 42), (8, 51), (-5, 51), (-5, 42)]]),
+    ])
+    cache_dir = tmp_path / "cache"
+
+    tiles = get_region_tiles(str(geojson), "china", 4, cache_dir=str(cache_dir))
+
+    assert (cache_dir / "china_z4.json").exists()
+    assert all(11 <= y <= 14 for _, y in tiles)
+    assert tiles == get_region_tiles(str(geojson), "CHN", 4, cache_dir=None)
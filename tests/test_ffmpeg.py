@@ -0,0 +1,138 @@
+import json
+import logging
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from zoom_earth_cli.ffmpeg import (
+    FFmpegProcess,
+    _prune_segment_cache,
+    _segment_signature,
+    build_rendition_graph,
+    parse_rendition,
+    split_frame_runs,
+    write_concat_list,
+)
+
+
+def test_rendition_graph_splits_single_input():
+    args, outputs = build_rendition_graph(["full", "540p", "webp"], "out/t.mp4", 30, 120)
+
+    graph = args[args.index("-filter_complex") + 1]
+    assert graph.startswith("[0:v]fps=30,trim=end_frame=120,split=3[s0][s1][s2]")
+    assert "scale=-2:'min(540,ih)'" in graph
+    assert outputs == {
+        "full": Path("out/t.mp4"),
+        "540p": Path("out/t_540p.mp4"),
+        "webp": Path("out/t_preview.webp"),
+    }
+    assert [args[i + 1] for i, a in enumerate(args) if a == "-map"] == ["[o0]", "[o1]", "[o2]"]
+
+
+def test_parse_rendition_rejects_unknown():
+    assert parse_rendition("hls-1080p") == ("hls", 1080)
+    with pytest.raises(ValueError):
+        parse_rendition("hls-webp")
+    with pytest.raises(ValueError):
+        parse_rendition("4k")
+
+
+def test_segment_signature_tracks_frame_changes(tmp_path):
+    frame = tmp_path / "0200.png"
+    frame.write_bytes(b"a" * 10)
+    runs = [(str(frame), 2)]
+    signature = _segment_signature(runs, 30)
+    assert _segment_signature(runs, 30) == signature
+
+    assert _segment_signature([(str(frame), 3)], 30) != signature
+    assert _segment_signature(runs, 24) != signature
+    stat = frame.stat()
+    os.utime(frame, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    touched = _segment_signature(runs, 30)
+    assert touched != signature
+    # 只改变大小（修改时间还原）同样使签名失效
+    frame.write_bytes(b"b" * 11)
+    os.utime(frame, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert _segment_signature(runs, 30) not in (signature, touched)
+
+
+def _cached_segment(cache: Path, name: str, output: str) -> Path:
+    segment = cache / name
+    segment.write_bytes(b"")
+    segment.with_suffix(".json").write_text(json.dumps({"output": os.path.abspath(output)}), encoding="utf-8")
+    return segment
+
+
+def test_prune_segment_cache_keeps_other_outputs(tmp_path):
+    cache = tmp_path / "cache"
+    cache.mkdir()
+    stale = _cached_segment(cache, "20250321_0100_aaaa.mp4", "a.mp4")
+    replaced = _cached_segment(cache, "20250321_0200_aaaa.mp4", "a.mp4")
+    keep = [_cached_segment(cache, "20250321_0200_bbbb.mp4", "a.mp4")]
+    newer = _cached_segment(cache, "20250321_0300_cccc.mp4", "a.mp4")
+    # 另一个输出共用缓存目录，其窗口早于 a.mp4 的最新分段
+    other = _cached_segment(cache, "20250321_0100_dddd.mp4", "b.mp4")
+
+    _prune_segment_cache(cache, keep, "a.mp4", logging)
+
+    assert not stale.exists() and not replaced.exists() and not stale.with_suffix(".json").exists()
+    assert keep[0].exists() and newer.exists()
+    assert other.exists() and other.with_suffix(".json").exists()
+
+
+def test_split_frame_runs_cuts_runs_at_chunk_boundaries():
+    runs = [("a", 3), ("b", 5), ("c", 1)]
+    assert split_frame_runs(runs, 4) == [[("a", 3), ("b", 1)], [("b", 4)], [("c", 1)]]
+    # 边界恰好落在段尾时不产生空块
+    assert split_frame_runs([("a", 4), ("b", 4)], 4) == [[("a", 4)], [("b", 4)]]
+    assert split_frame_runs(runs, 100) == [runs]
+    assert split_frame_runs([], 4) == []
+
+
+def test_write_concat_list_durations_and_last_entry(tmp_path):
+    frames = []
+    for name in ("0200.png", "0210.png"):
+        (tmp_path / name).write_bytes(b"")
+        frames.append(str(tmp_path / name))
+    list_path = tmp_path / "list.txt"
+
+    write_concat_list(list_path, [(frames[0], 1), (frames[1], 3)], 30)
+
+    assert list_path.read_text().splitlines() == [
+        f"file '{frames[0]}'",
+        "duration 0.03333",
+        f"file '{frames[1]}'",
+        "duration 0.10000",
+        f"file '{frames[1]}'",
+    ]
+
+
+def test_ffmpeg_process_parses_progress_blocks():
+    snapshots = []
+    process = FFmpegProcess(["ffmpeg", "-i", "in"], label="t.mp4", total_frames=100, on_progress=snapshots.append)
+    assert process.cmd[:4] == ["ffmpeg", "-progress", "pipe:1", "-nostats"]
+    process.proc = SimpleNamespace(stdout=[
+        b"frame=40\n", b"fps=20.0\n", b"speed=N/A\n", b"out_time=00:00:01.333333\n", b"progress=continue\n",
+        b"\n",
+        b"frame=100\n", b"fps=25\n", b"speed=1.5x\n", b"progress=end\n",
+    ])
+
+    process._read_progress()
+
+    assert [s["frame"] for s in snapshots] == [40, 100]
+    first, last = snapshots
+    assert first["speed"] is None and first["eta_seconds"] == 3.0 and not first["done"]
+    assert first["out_time"] == "00:00:01.333333" and first["label"] == "t.mp4"
+    assert last["speed"] == 1.5 and last["eta_seconds"] == 0.0 and last["done"]
+    assert process.last_progress is last
+
+
+def test_ffmpeg_process_keeps_stderr_tail():
+    process = FFmpegProcess(["ffmpeg"], stderr_lines=3)
+    process.proc = SimpleNamespace(stderr=[f"line {i}\n".encode() for i in range(10)] + [b"\xff\n"])
+
+    process._drain_stderr()
+
+    assert list(process.stderr_tail) == ["line 8\n", "line 9\n", "\ufffd\n"]
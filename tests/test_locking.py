@@ -0,0 +1,45 @@
+import json
+import multiprocessing
+
+from zoom_earth_cli.locking import ClaimSet, stage_lock
+
+
+def _hold_lock(lock_root, queue):
+    with stage_lock("concat", "global", blocking=False, lock_root=lock_root) as acquired:
+        queue.put(acquired)
+
+
+def test_concurrent_claims_split_work(tmp_path):
+    first = ClaimSet("concat", "global", lock_root=str(tmp_path))
+    second = ClaimSet("concat", "global", lock_root=str(tmp_path))
+
+    assert first.claim_all(["a", "b"]) == ["a", "b"]
+    assert second.claim_all(["a", "b", "c"]) == ["c"]
+
+    first.release("a")
+    assert second.try_claim("a")
+
+
+def test_expired_and_dead_claims_are_reclaimed(tmp_path):
+    claims = ClaimSet("download", "global", lock_root=str(tmp_path))
+    (claims.claim_dir / "expired.claim").write_text(json.dumps({"pid": 1, "host": "other", "expires_at": 0}))
+    (claims.claim_dir / "crashed.claim").write_text(json.dumps({
+        "pid": 2 ** 22 + 12345, "host": claims.owner["host"], "expires_at": 4e9,
+    }))
+    (claims.claim_dir / "alive.claim").write_text(json.dumps({"pid": 1, "host": "other", "expires_at": 4e9}))
+
+    assert claims.claim_all(["expired", "crashed", "alive"]) == ["expired", "crashed"]
+
+    with claims:
+        pass
+    assert not (claims.claim_dir / "expired.claim").exists()
+    assert (claims.claim_dir / "alive.claim").exists()
+
+
+def test_stage_lock_is_exclusive_across_processes(tmp_path):
+    queue = multiprocessing.Queue()
+    with stage_lock("concat", "global", lock_root=str(tmp_path)):
+        process = multiprocessing.Process(target=_hold_lock, args=(str(tmp_path), queue))
+        process.start()
+        process.join()
+    assert queue.get() is False
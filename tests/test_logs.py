@@ -0,0 +1,59 @@
+import logging
+import threading
+
+from zoom_earth_cli.logs import LogSampler, ProgressReporter, RateLimiter, setup_logging, shutdown_logging
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_sampler_and_rate_limiter():
+    sampler = LogSampler(every=10, first=2)
+    assert [i + 1 for i in range(30) if sampler.sample()] == [1, 2, 10, 20, 30]
+
+    clock = FakeClock()
+    limiter = RateLimiter(per_second=2.0, burst=3, clock=clock)
+    assert [limiter.allow() for _ in range(5)] == [True, True, True, False, False]
+    clock.now = 1.0
+    assert [limiter.allow() for _ in range(3)] == [True, True, False]
+    assert limiter.suppressed == 3
+
+
+def test_progress_reporter_aggregates(caplog):
+    clock = FakeClock()
+    logger = logging.getLogger("zec.test.progress")
+    progress = ProgressReporter("下载", 100, interval=10, logger=logger, clock=clock)
+    with caplog.at_level(logging.INFO, logger="zec.test.progress"):
+        for i in range(50):
+            clock.now = i * 0.5
+            progress.update("成功" if i % 5 else "失败")
+        progress.finish()
+    lines = [record.getMessage() for record in caplog.records]
+    assert len(lines) == 3
+    assert lines[0].startswith("下载进度 21/100 (21.0%)，失败 5，成功 16，")
+    assert lines[-1].startswith("下载完成 50/100")
+
+
+def test_queue_logging_writes_from_threads(tmp_path):
+    shutdown_logging()
+    log_file = tmp_path / "zec.log"
+    setup_logging(log_file=str(log_file))
+    try:
+        threads = [
+            threading.Thread(target=lambda n=n: [logging.getLogger("zec.test").info(f"线程{n}-{i}") for i in range(50)])
+            for n in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        shutdown_logging()
+    lines = log_file.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 200
+    assert any(line.endswith(" - INFO - 线程3-49") for line in lines)
@@ -0,0 +1,61 @@
+import json
+from datetime import datetime, timezone
+
+from zoom_earth_cli import api_client
+from zoom_earth_cli.metrics import MetricsRegistry, metrics, write_run_report
+
+
+def test_registry_report_and_prometheus(tmp_path):
+    registry = MetricsRegistry()
+    registry.inc("download_tiles_total", satellite="himawari", result="ok")
+    registry.inc("download_tiles_total", 2, satellite="himawari", result="ok")
+    registry.inc("download_bytes_total", 1536, satellite='sat "a"')
+    for value in (0.004, 0.02, 0.3):
+        registry.observe("decode_seconds", value, stage="concat")
+
+    assert registry.counter_value("download_tiles_total", result="ok", satellite="himawari") == 3
+    hist = registry.histogram("decode_seconds", stage="concat")
+    assert hist.count == 3 and hist.quantile(0.5) == 0.02
+
+    text = registry.to_prometheus()
+    assert 'zec_download_tiles_total{result="ok",satellite="himawari"} 3' in text
+    assert 'zec_download_bytes_total{satellite="sat \\"a\\""} 1536' in text
+    assert 'zec_decode_seconds_bucket{stage="concat",le="0.005"} 1' in text
+    assert 'zec_decode_seconds_bucket{stage="concat",le="+Inf"} 3' in text
+    assert 'zec_decode_seconds_count{stage="concat"} 3' in text
+
+    prom = tmp_path / "textfile" / "zec.prom"
+    path = write_run_report("concat", 1_700_000_000.0, str(tmp_path / "reports"), str(prom), registry=registry)
+    report = json.loads(path.read_text(encoding="utf-8"))
+    assert report["command"] == "concat"
+    assert {"name": "download_tiles_total", "labels": {"result": "ok", "satellite": "himawari"}, "value": 3} \
+        in report["metrics"]["counters"]
+    assert "zec_run_duration_seconds" in prom.read_text()
+
+
+def test_batch_download_counts_retries_and_new_black(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    metrics.reset()
+    ts = int(datetime(2025, 3, 21, 2, 0, tzinfo=timezone.utc).timestamp())
+    monkeypatch.setattr(api_client, "get_latest_times", lambda hours: {"himawari": [ts]})
+
+    attempts = {}
+
+    def fake_download(country, satellite, timestamp, x, y, zoom):
+        attempts[(x, y)] = attempts.get((x, y), 0) + 1
+        if (x, y) == (5, 13):
+            # 首次失败，重试时成功且为黑图
+            return (True, True) if attempts[(x, y)] > 1 else (False, False)
+        if (x, y) == (6, 13):
+            return (False, False)
+        return (True, False)
+
+    monkeypatch.setattr(api_client, "download_tile", fake_download)
+    api_client.batch_download(satellites=["himawari"], zoom=4, country="japan")
+
+    total = len(attempts)
+    assert metrics.counter_value("download_attempted_tiles_total", satellite="himawari") == total
+    assert metrics.counter_value("download_retried_tiles_total", satellite="himawari") == 2
+    assert metrics.counter_value("download_recovered_tiles_total", satellite="himawari") == 1
+    assert metrics.counter_value("download_failed_tiles_total", satellite="himawari") == 1
+    assert metrics.counter_value("download_new_black_tiles_total", satellite="himawari") == 1
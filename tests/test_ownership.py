@@ -0,0 +1,47 @@
+from PIL import Image
+
+from zoom_earth_cli.ownership import build_ownership
+from zoom_earth_cli.utils import concat_tiles
+
+ALL_SATELLITES = ("goes-east", "goes-west", "himawari", "msg-iodc", "msg-zero", "mtg-zero")
+
+
+def test_each_column_has_single_owner_without_margin():
+    table = build_ownership(4, ALL_SATELLITES, 0)
+
+    primaries = [sat for sat in ALL_SATELLITES if sat != "msg-zero"]
+    for y in range(16):
+        owners = table.owners(8, y)
+        assert len([sat for sat in owners if sat in primaries]) == 1
+    # 替补卫星沿用主卫星的归属
+    assert table.tiles_for("msg-zero") == table.tiles_for("mtg-zero")
+    assert table.owners(8, 4) == ("goes-east",)
+
+
+def test_margin_extends_ownership_within_coverage():
+    narrow = build_ownership(4, ALL_SATELLITES, 0)
+    wide = build_ownership(4, ALL_SATELLITES, 1)
+
+    assert narrow.tiles_for("goes-east") < wide.tiles_for("goes-east")
+    # 不会超出卫星自身的覆盖范围（goes-west 覆盖 0-2 列）
+    assert max(y for _, y in wide.tiles_for("goes-west")) == 2
+
+
+def test_concat_keeps_extent_when_tiles_filtered(tmp_path):
+    tile_dir = tmp_path / "0000"
+    tile_dir.mkdir()
+    for x in (4, 5):
+        for y in (2, 3, 4):
+            Image.new("RGB", (16, 16), (200, 200, 200)).save(tile_dir / f"x{x}_y{y}.jpg")
+
+    output = tmp_path / "out.png"
+    concat_tiles(
+        tile_dir, output, tile_size=16,
+        extent={"x": [4, 5], "y": [2, 4]},
+        tile_filter=lambda x, y: y != 4,
+    )
+
+    with Image.open(output) as img:
+        assert img.size == (48, 32)
+        assert img.getpixel((40, 8)) == (0, 0, 0)
+        assert img.getpixel((8, 8))[0] > 150
@@ -0,0 +1,96 @@
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from zoom_earth_cli import pipeline
+from zoom_earth_cli.locking import ClaimSet, blend_claim_key, concat_claim_key
+from zoom_earth_cli.pipeline import FramePipeline
+
+
+def _ts(hour: int, minute: int) -> int:
+    return int(datetime(2025, 3, 21, hour, minute, tzinfo=timezone.utc).timestamp())
+
+
+def test_pipeline_downloads_concats_and_blends_in_order(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    times = [_ts(2, 0), _ts(2, 10), _ts(2, 20)]
+    calls = []
+
+    def fake_plan(*args):
+        return "japan", {"himawari": list(times)}, {"himawari": [(5, 13), (6, 13)]}
+
+    def fake_download(region, satellite, ts, x, y, zoom):
+        calls.append((ts, x))
+        # 第二帧的 (6, 13) 首次下载失败，重试成功
+        if ts == times[1] and x == 6 and calls.count((ts, x)) == 1:
+            return False, False
+        dt = datetime.fromtimestamp(ts, timezone.utc)
+        tile_dir = tmp_path / "downloads" / region / satellite / str(zoom) / dt.strftime("%Y-%m-%d") / dt.strftime("%H%M")
+        tile_dir.mkdir(parents=True, exist_ok=True)
+        value = 40 + times.index(ts) * 50
+        Image.new("RGB", (256, 256), (value, value, value)).save(tile_dir / f"x{x}_y{y}.jpg")
+        return True, False
+
+    monkeypatch.setattr(pipeline, "plan_download", fake_plan)
+    monkeypatch.setattr(pipeline, "download_tile", fake_download)
+
+    stats = FramePipeline("japan", 4, logging, queue_size=1, concurrency=2).run()
+
+    assert stats["download_frames"] == 3 and stats["failed_tiles"] == 0
+    assert stats["mosaics"] == 3 and stats["blended"] == 3
+    frames = sorted((tmp_path / "lighter_blend" / "japan" / "4").rglob("*.png"))
+    assert [p.name for p in frames] == ["0200.png", "0210.png", "0220.png"]
+    with Image.open(frames[1]) as img:
+        canvas = np.asarray(img)
+    assert canvas.shape == (512, 256, 4)
+    assert abs(int(canvas[400, 100, 0]) - 90) <= 3
+    assert (tmp_path / "mosaics" / "japan" / "himawari" / "4" / "2025-03-21" / "0220.png").exists()
+
+    # 再次运行：拼接图与混合帧已存在，全部跳过
+    stats = FramePipeline("japan", 4, logging).run()
+    assert stats["blended"] == 0 and stats["skipped"] == 3
+
+
+def test_pipeline_stage_failure_stops_other_stages(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    times = [_ts(3, minute) for minute in range(0, 60, 10)]
+    monkeypatch.setattr(pipeline, "plan_download", lambda *args: ("japan", {"himawari": times}, {"himawari": [(5, 13)]}))
+    monkeypatch.setattr(pipeline, "download_tile", lambda *args: (True, False))
+
+    def broken_concat(**kwargs):
+        raise RuntimeError("磁盘已满")
+
+    monkeypatch.setattr(pipeline, "concat_tiles", broken_concat)
+    with pytest.raises(RuntimeError, match="磁盘已满"):
+        FramePipeline("japan", 4, logging, queue_size=1).run()
+
+
+def test_pipeline_respects_claims_from_standalone_stages(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    times = [_ts(4, 0), _ts(4, 10)]
+    monkeypatch.setattr(pipeline, "plan_download", lambda *args: ("japan", {"himawari": times}, {"himawari": [(5, 13)]}))
+
+    def fake_download(region, satellite, ts, x, y, zoom):
+        dt = datetime.fromtimestamp(ts, timezone.utc)
+        tile_dir = tmp_path / "downloads" / region / satellite / str(zoom) / dt.strftime("%Y-%m-%d") / dt.strftime("%H%M")
+        tile_dir.mkdir(parents=True, exist_ok=True)
+        Image.new("RGB", (256, 256), (90, 90, 90)).save(tile_dir / f"x{x}_y{y}.jpg")
+        return True, False
+
+    monkeypatch.setattr(pipeline, "download_tile", fake_download)
+    # 模拟并发运行的 process-concat / process-blend：分别认领了 04:00 的拼接图与 04:10 的混合帧
+    other_concat = ClaimSet("concat", "japan")
+    assert other_concat.try_claim(concat_claim_key("himawari", 4, "2025-03-21", "0400"))
+    other_blend = ClaimSet("blend", "japan-4")
+    blend_path = Path("lighter_blend") / "japan" / "4" / "2025-03-21" / "0410.png"
+    assert other_blend.try_claim(blend_claim_key(blend_path))
+
+    stats = FramePipeline("japan", 4, logging).run()
+
+    assert stats["mosaics"] == 1 and stats["missing_mosaics"] == 1
+    assert not (tmp_path / "mosaics" / "japan" / "himawari" / "4" / "2025-03-21" / "0400.png").exists()
+    assert stats["claimed_elsewhere"] == 1 and not (tmp_path / blend_path).exists()
@@ -0,0 +1,55 @@
+from zoom_earth_cli.prefetch import CadenceModel, PrefetchScheduler, learn_cadence
+
+
+def test_learn_cadence_from_history():
+    # himawari 每 10 分钟一帧，新帧在帧时间后约 15 分钟出现在列表中
+    history = [
+        (1000 + 900, {"himawari": [0, 600, 1000]}),
+        (1600 + 900, {"himawari": [600, 1000, 1600]}),
+        (2200 + 900, {"himawari": [1000, 1600, 2200]}),
+    ]
+    models = learn_cadence(history)
+
+    assert models["himawari"].cadence == 600
+    assert models["himawari"].latency == 900
+    assert models["himawari"].next_timestamp == 2800
+
+
+class FakeClock:
+    def __init__(self, start):
+        self.t = start
+
+    def now(self):
+        return self.t
+
+    def sleep(self, seconds):
+        self.t += seconds
+
+
+def test_scheduler_probes_then_fetches_and_respects_miss_budget():
+    clock = FakeClock(0)
+    published = {600}
+    calls = []
+
+    def fetch(sat, ts, x, y):
+        calls.append((ts, x, y))
+        return ts in published
+
+    models = {"himawari": CadenceModel("himawari", 600, 100, 0)}
+    scheduler = PrefetchScheduler(
+        models, {"himawari": [(0, 0), (0, 1), (0, 2)]}, fetch,
+        miss_budget=2, requests_per_second=10, now=clock.now, sleep=clock.sleep,
+    )
+
+    # 第一帧：在预测时间（600 + 100）探测命中，随后按速率下载其余两个瓦片
+    scheduler.step()
+    assert calls == [(600, 0, 0), (600, 0, 1), (600, 0, 2)]
+    assert clock.t >= 700 and models["himawari"].latest == 600
+
+    # 第二帧未发布：退避重试，两次未命中后放弃该帧
+    calls.clear()
+    scheduler.step()
+    scheduler.step()
+    assert calls == [(1200, 0, 0), (1200, 0, 0)]
+    assert scheduler.stats == {"frames": 1, "misses": 2, "tiles": 3, "resyncs": 1}
+    assert models["himawari"].next_timestamp == 1800
@@ -0,0 +1,42 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from zoom_earth_cli.blockwise import concat_tiles_blockwise
+from zoom_earth_cli.utils import concat_tiles, preview_dir
+
+
+def _write_tiles(tile_dir: Path):
+    tile_dir.mkdir(parents=True)
+    for x in range(2):
+        for y in range(3):
+            color = (40 * x + 30, 60 * y + 20, 100)
+            Image.new("RGB", (256, 256), color).save(tile_dir / f"x{x}_y{y}.jpg", quality=95)
+
+
+def test_preview_dir_mirrors_output_tree():
+    assert preview_dir("mosaics/global", 4) == str(Path("previews", "1-4", "mosaics", "global"))
+    assert preview_dir("/data/blend/japan", 2) == str(Path("previews", "1-2", "data", "blend", "japan"))
+    with pytest.raises(ValueError):
+        preview_dir("mosaics/global", 3)
+
+
+@pytest.mark.parametrize("scale", [2, 4, 8])
+def test_concat_tiles_reduced_scale(tmp_path, scale):
+    tile_dir = tmp_path / "tiles"
+    _write_tiles(tile_dir)
+    size = 256 // scale
+
+    png_path = tmp_path / f"preview_{scale}.png"
+    concat_tiles(tile_dir, png_path, tile_size=size)
+    with Image.open(png_path) as img:
+        assert img.size == (3 * size, 2 * size)
+        pixels = np.asarray(img.convert("RGB")).astype(int)
+    # swap_xy：文件名 x 为行、y 为列
+    assert np.abs(pixels[size + size // 2, 2 * size + size // 2] - (70, 140, 100)).max() <= 4
+
+    npy_path = tmp_path / f"preview_{scale}.npy"
+    concat_tiles_blockwise(tile_dir, npy_path, tile_size=size)
+    assert np.load(npy_path).shape == (2 * size, 3 * size, 3)
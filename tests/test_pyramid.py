@@ -0,0 +1,66 @@
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+from PIL import Image
+
+from zoom_earth_cli.pyramid import COMPLETE_MARKER, build_levels, build_pyramids, downsample_2x
+
+
+def test_downsample_weights_colour_by_alpha():
+    canvas = np.zeros((2, 4, 4), dtype=np.uint8)
+    canvas[0, 0] = (200, 100, 50, 255)      # 左块只有一个不透明像素，其余全透明
+    canvas[:, 2:] = (10, 20, 30, 255)
+    out = downsample_2x(canvas)
+    assert out.shape == (1, 2, 4)
+    assert tuple(out[0, 0]) == (200, 100, 50, 64)
+    assert tuple(out[0, 1]) == (10, 20, 30, 255)
+
+
+def test_levels_align_to_parent_tiles():
+    tile = 4
+    # 起点为奇数列/行的 3 x 1 瓦片画布
+    canvas = np.zeros((tile, 3 * tile, 4), dtype=np.uint8)
+    canvas[..., 3] = 255
+    canvas[:, :tile, 0] = 255
+    levels = build_levels(canvas, (3, 5), zoom=4, min_zoom=2, tile_size=tile)
+    assert [(z, origin, level.shape[:2]) for z, origin, level in levels] == [
+        (4, (3, 5), (4, 12)),
+        (3, (1, 2), (4, 8)),
+        (2, (0, 1), (4, 8)),
+    ]
+    z3 = levels[1][2]
+    # z3 的第一个瓦片右下四分之一来自 z4 的 (列 3, 行 5)（红色），其余为补齐的透明区域
+    assert tuple(z3[3, 3]) == (255, 0, 0, 255)
+    assert z3[3, 0, 3] == 0 and z3[0, 3, 3] == 0
+
+
+def test_build_pyramids_skips_transparent_and_complete(tmp_path, monkeypatch):
+    ts = int(datetime(2025, 3, 21, 2, 0, tzinfo=timezone.utc).timestamp())
+    canvas = np.zeros((2 * 256, 2 * 256, 4), dtype=np.uint8)
+    canvas[:256, :256] = (0, 128, 255, 255)
+    frame = tmp_path / "lighter_blend" / "japan" / "6" / "2025-03-21" / "0200.png"
+    frame.parent.mkdir(parents=True)
+    Image.fromarray(canvas, "RGBA").save(frame)
+    extent_dir = tmp_path / "downloads" / "japan" / "himawari" / "6"
+    extent_dir.mkdir(parents=True)
+    (extent_dir / "extent.json").write_text(json.dumps({"x": [24, 25], "y": [56, 57]}))
+
+    monkeypatch.chdir(tmp_path)
+    kwargs = dict(blend_dir="lighter_blend", output_dir="pyramid", region="japan", zoom=6,
+                  logger=logging, min_zoom=4, workers=2)
+    stats = build_pyramids(**kwargs)
+    frame_dir = tmp_path / "pyramid" / "japan" / str(ts)
+    assert stats["frames"] == 1
+    assert sorted(str(p.relative_to(frame_dir)) for p in frame_dir.rglob("*.png")) == [
+        os.path.join("4", "14", "6.png"), os.path.join("5", "28", "12.png"), os.path.join("6", "56", "24.png"),
+    ]
+    assert stats["empty_tiles"] == 3
+    assert json.loads((frame_dir / COMPLETE_MARKER).read_text())["tiles"] == 3
+    with Image.open(frame_dir / "5" / "28" / "12.png") as img:
+        tile = np.asarray(img)
+    assert tuple(tile[0, 0]) == (0, 128, 255, 255) and tile[200, 200, 3] == 0
+
+    assert build_pyramids(**kwargs)["skipped_frames"] == 1
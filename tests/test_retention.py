@@ -0,0 +1,130 @@
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from zoom_earth_cli import archive, retention
+from zoom_earth_cli.retention import collect_garbage, parse_duration, parse_size, plan_stage
+
+
+def _write(path, size=100):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"\0" * size)
+
+
+def _frame(hours_ago: float):
+    dt = datetime.now(timezone.utc) - timedelta(hours=hours_ago)
+    return dt.strftime("%Y-%m-%d"), dt.strftime("%H%M")
+
+
+def test_parse_policies_units():
+    assert parse_duration("2d") == 2 * 86400 and parse_duration("36") == 36 * 3600
+    assert parse_size("20G") == parse_size("20GB") == 20 * 1024 ** 3
+    assert parse_size("1.5M") == int(1.5 * 1024 ** 2)
+
+
+def test_plan_stage_budget_skips_protected():
+    now = time.time()
+    entries = {
+        f"r/himawari/4/d/{i}.png": {"ts": now - (10 - i) * 3600, "bytes": 100, "done": i != 1}
+        for i in range(5)
+    }
+    selected, protected = plan_stage("mosaics", entries, now, max_bytes=250)
+    # 需删除 3 个才能降到 250 字节以下：1 号的混合帧尚未生成，跳过并继续删更新的
+    assert selected == ["r/himawari/4/d/0.png", "r/himawari/4/d/2.png", "r/himawari/4/d/3.png"]
+    assert protected == 1
+
+
+def test_gc_respects_dependencies_and_uses_index(tmp_path):
+    old_date, old_time = _frame(72)
+    new_date, new_time = _frame(1)
+    # 旧帧已拼接，可以删除；另一个旧帧还没有拼接图，必须保留
+    built = tmp_path / "downloads" / "global" / "himawari" / "4" / old_date / old_time
+    _write(built / "x5_y13.jpg", 1000)
+    pending = tmp_path / "downloads" / "global" / "goes-east" / "4" / old_date / old_time
+    _write(pending / "x5_y2.jpg", 1000)
+    _write(tmp_path / "downloads" / "global" / "himawari" / "4" / "extent.json", 10)
+    _write(tmp_path / "mosaics" / "global" / "himawari" / "4" / old_date / f"{old_time}.png", 500)
+    _write(tmp_path / "mosaics" / "global" / "himawari" / "4" / new_date / f"{new_time}.png", 500)
+    _write(tmp_path / "lighter_blend" / "global" / "4" / old_date / f"{old_time}.png", 300)
+
+    kwargs = dict(max_age={"downloads": parse_duration("1d"), "mosaics": parse_duration("1d")}, base_dir=str(tmp_path))
+    preview = collect_garbage(logging, dry_run=True, **kwargs)
+    assert preview["downloads"]["deleted"] == 1 and built.exists()
+
+    report = collect_garbage(logging, **kwargs)
+    assert report["downloads"] == {
+        "units": 2, "bytes": 2000, "deleted": 1, "reclaimed": 1000, "protected": 1, "remaining": 1000, "rescanned": 0,
+    }
+    assert not built.exists() and not built.parent.exists() and pending.exists()
+    assert (tmp_path / "downloads" / "global" / "himawari" / "4" / "extent.json").exists()
+    # 旧拼接图的混合帧已生成，且不是该卫星最新一张
+    assert report["mosaics"]["deleted"] == 1 and report["mosaics"]["reclaimed"] == 500
+    assert report["lighter_blend"]["deleted"] == 0
+
+    # 第二次运行：未变化的单元全部来自索引，不再逐文件统计
+    again = collect_garbage(logging, **kwargs)
+    assert all(row["rescanned"] == 0 for row in again.values())
+    assert again["downloads"]["protected"] == 1
+
+    _write(pending / "x6_y2.jpg", 1000)
+    os.utime(pending, ns=(time.time_ns(), time.time_ns() + 1_000_000))
+    assert collect_garbage(logging, **kwargs)["downloads"]["bytes"] == 2000
+
+
+def test_gc_keeps_newest_cadence_history(tmp_path, monkeypatch):
+    monkeypatch.setattr(retention, "TIMES_HISTORY_KEEP", 2)
+    debug = tmp_path / "debug_output"
+    names = [f"satellite_times_2025-03-2{day}_00-00-00.json" for day in (1, 2, 3)] + ["blend_debug.png"]
+    for age, name in enumerate(reversed(names)):
+        _write(debug / name)
+        stamp = time.time() - (age + 1) * 86400
+        os.utime(debug / name, (stamp, stamp))
+
+    report = collect_garbage(logging, max_age={"debug_output": 3600}, base_dir=str(tmp_path))
+
+    # prefetch 依赖的最新两份历史保留，其余过期文件照常删除
+    assert report["debug_output"]["deleted"] == 2 and report["debug_output"]["protected"] == 2
+    assert sorted(p.name for p in debug.iterdir()) == names[1:3]
+
+
+def test_scan_skips_unchanged_date_directories(tmp_path, monkeypatch):
+    roots = {stage: tmp_path / stage for stage in retention.STAGE_LAYOUTS}
+    day = roots["mosaics"] / "global" / "himawari" / "4" / "2025-03-21"
+    for name in ("0200.png", "0210.png"):
+        _write(day / name)
+    state, rescanned = retention.scan_stage("mosaics", roots, {})
+    assert rescanned == 2 and len(state["units"]) == 2
+
+    listed = []
+    scandir = os.scandir
+    monkeypatch.setattr(retention.os, "scandir", lambda path: listed.append(str(path)) or scandir(path))
+    state, rescanned = retention.scan_stage("mosaics", roots, state)
+    assert rescanned == 0 and len(state["units"]) == 2 and str(day) not in listed
+
+    _write(day / "0220.png")
+    state, rescanned = retention.scan_stage("mosaics", roots, state)
+    assert rescanned == 1 and len(state["units"]) == 3 and str(day) in listed
+
+
+def test_gc_counts_and_expires_archived_days(tmp_path):
+    old_date, old_time = _frame(72)
+    zoom_dir = tmp_path / "downloads" / "global" / "himawari" / "4"
+    _write(zoom_dir / old_date / old_time / "x5_y13.jpg", 1000)
+    mosaic_day = tmp_path / "mosaics" / "global" / "himawari" / "4" / old_date
+    _write(mosaic_day / f"{old_time}.png", 500)
+    _write(tmp_path / "lighter_blend" / "global" / "4" / old_date / f"{old_time}.png", 300)
+    archive.pack_day(zoom_dir / old_date)
+    archive.pack_day(mosaic_day)
+    pack = zoom_dir / f"{old_date}.zpk"
+
+    kwargs = dict(base_dir=str(tmp_path), stages=["downloads", "mosaics"])
+    report = collect_garbage(logging, **kwargs)
+    # 日包整体作为一个单元计入大小
+    assert report["downloads"]["units"] == 1 and report["downloads"]["bytes"] == pack.stat().st_size
+    assert report["mosaics"]["units"] == 1
+
+    # 下游拼接图只存在于日包中：瓦片日包仍视为已拼接，可按保留时间删除
+    report = collect_garbage(logging, max_age={"downloads": parse_duration("1d")}, **kwargs)
+    assert report["downloads"]["deleted"] == 1 and not pack.exists()
+    assert (mosaic_day.parent / f"{old_date}.zpk").exists()
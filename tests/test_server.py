@@ -0,0 +1,138 @@
+import asyncio
+import io
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+from PIL import Image
+
+from zoom_earth_cli.const import region_canvas
+from zoom_earth_cli.server import ByteLRU, TileServer, blend_origin
+
+
+def _tile_png(body: bytes) -> np.ndarray:
+    with Image.open(io.BytesIO(body)) as img:
+        return np.asarray(img.convert("RGBA"))
+
+
+def _make_tree(tmp_path):
+    ts = int(datetime(2025, 3, 21, 2, 0, tzinfo=timezone.utc).timestamp())
+    # 2 x 3 个瓦片的混合画布，每个瓦片填充可区分的颜色
+    canvas = np.zeros((2 * 256, 3 * 256, 4), dtype=np.uint8)
+    for row in range(2):
+        for col in range(3):
+            canvas[row * 256:(row + 1) * 256, col * 256:(col + 1) * 256] = (row * 100, col * 80, 50, 255)
+    blend_path = tmp_path / "lighter_blend" / "japan" / "6" / "2025-03-21" / "0200.png"
+    blend_path.parent.mkdir(parents=True)
+    Image.fromarray(canvas, "RGBA").save(blend_path)
+
+    mosaic_path = tmp_path / "mosaics" / "japan" / "himawari" / "6" / "2025-03-21" / "0200.npy"
+    mosaic_path.parent.mkdir(parents=True)
+    np.save(mosaic_path, canvas[..., :3].copy())
+
+    extent_dir = tmp_path / "downloads" / "japan" / "himawari" / "6"
+    extent_dir.mkdir(parents=True)
+    # x 为行、y 为列：画布左上角为瓦片 (列 55, 行 24)
+    (extent_dir / "extent.json").write_text(json.dumps({"x": [24, 25], "y": [55, 57]}))
+    return ts
+
+
+def _server(tmp_path, **kwargs):
+    return TileServer(
+        region="japan",
+        zoom=6,
+        blend_dir=str(tmp_path / "lighter_blend"),
+        mosaics_dir=str(tmp_path / "mosaics"),
+        downloads_dir=str(tmp_path / "downloads"),
+        **kwargs,
+    )
+
+
+def test_byte_lru_evicts_by_size():
+    cache = ByteLRU(10)
+    cache.put("a", b"aaaa", 4)
+    cache.put("b", b"bbbb", 4)
+    assert cache.get("a") == b"aaaa"
+    cache.put("c", b"cccc", 4)
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa" and cache.get("c") == b"cccc"
+    assert cache.current_bytes == 8
+    cache.put("huge", b"x" * 11, 11)
+    assert cache.get("huge") is None
+
+
+
+def test_blend_origin_uses_zoom_scaled_offsets(tmp_path):
+    downloads = tmp_path / "downloads"
+    # zoom 5 全球：goes-west 缺第 0 列，画布原点仍由按 zoom 加倍的偏移决定（goes-east 第 4 列、偏移 4）
+    extent_dir = downloads / "global" / "goes-west" / "5"
+    extent_dir.mkdir(parents=True)
+    (extent_dir / "extent.json").write_text(json.dumps({"x": [9, 22], "y": [1, 10]}))
+    assert region_canvas("global", 5)[2]["goes-east"] == 4
+    assert blend_origin(5, "global", str(downloads)) == (0, 9)
+
+def test_tiles_cut_from_blend_and_mosaic(tmp_path):
+    ts = _make_tree(tmp_path)
+    server = _server(tmp_path)
+    assert blend_origin(6, "japan", str(tmp_path / "downloads")) == (55, 24)
+
+    async def scenario():
+        status, headers, body = await server.respond("GET", f"/{ts}/6/57/25.png", {})
+        assert status == 200 and headers["Content-Type"] == "image/png"
+        assert tuple(_tile_png(body)[128, 128]) == (100, 160, 50, 255)
+
+        # 带相同 ETag 的条件请求直接返回 304
+        status, _, body = await server.respond("GET", f"/{ts}/6/57/25.png", {"if-none-match": headers["ETag"]})
+        assert status == 304 and body == b""
+
+        status, _, body = await server.respond("GET", f"/himawari/latest/6/56/24.png", {})
+        assert status == 200
+        assert tuple(_tile_png(body)[0, 0]) == (0, 80, 50, 255)
+
+        # 低一级 zoom：2x2 窗口降采样，画布外的部分为透明
+        status, _, body = await server.respond("GET", f"/{ts}/5/27/12.png", {})
+        tile = _tile_png(body)
+        assert status == 200 and tile.shape == (256, 256, 4)
+        assert tile[0, 0, 3] == 0 and tuple(tile[200, 200]) == (100, 0, 50, 255)
+
+        assert (await server.respond("GET", f"/{ts}/6/0/0.png", {}))[0] == 404
+        assert (await server.respond("GET", "/0/6/57/25.png", {}))[0] == 404
+        assert (await server.respond("GET", "/abc/6/57/25.png", {}))[0] == 400
+        assert (await server.respond("POST", f"/{ts}/6/57/25.png", {}))[0] == 405
+
+    asyncio.run(scenario())
+    server.close()
+    assert server.tiles.hits == 0 and len(server.tiles) == 3
+
+
+def test_http_keep_alive_round_trip(tmp_path):
+    ts = _make_tree(tmp_path)
+    server = _server(tmp_path)
+
+    async def scenario():
+        listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        statuses = []
+        for _ in range(2):
+            writer.write(f"GET /{ts}/6/55/24.png HTTP/1.1\r\nHost: test\r\n\r\n".encode())
+            await writer.drain()
+            statuses.append(await reader.readline())
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line == b"\r\n":
+                    break
+                name, _, value = line.decode().partition(":")
+                headers[name.lower()] = value.strip()
+            body = await reader.readexactly(int(headers["content-length"]))
+            assert headers["cache-control"].startswith("public")
+            assert tuple(_tile_png(body)[10, 10]) == (0, 0, 50, 255)
+        writer.close()
+        listener.close()
+        await listener.wait_closed()
+        return statuses
+
+    assert asyncio.run(scenario()) == [b"HTTP/1.1 200 OK\r\n"] * 2
+    server.close()
+    assert server.tiles.hits == 1
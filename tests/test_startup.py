@@ -0,0 +1,14 @@
+import subprocess
+import sys
+
+
+def test_cli_import_does_not_load_stage_dependencies(tmp_path):
+    code = (
+        "import sys, zoom_earth_cli.main; "
+        "print(','.join(m for m in ('numpy', 'PIL', 'requests', 'rich.progress', 'asyncio', "
+        "'zoom_earth_cli.api_client', 'zoom_earth_cli.blender') if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=tmp_path)
+    assert result.stdout.strip() == ""
+    # 导入时不再配置日志，不会生成日志文件
+    assert not (tmp_path / "zoom_earth.log").exists()
@@ -0,0 +1,29 @@
+from zoom_earth_cli.timeline import TimelineIndex
+from zoom_earth_cli.utils import process_latest_times
+
+
+def test_schedule_carries_forward_latest_source():
+    index = TimelineIndex({
+        "himawari": [100, 300],
+        "msg-iodc": [200],
+    })
+    schedule = index.schedule([100, 200, 300, 400])
+
+    rows = list(schedule.rows())
+    assert rows[0] == (100, {"himawari": 100, "msg-iodc": None})
+    assert rows[1] == (200, {"himawari": 100, "msg-iodc": 200})
+    assert rows[3] == (400, {"himawari": 300, "msg-iodc": 200})
+    assert schedule.complete_mask().tolist() == [False, True, True, True]
+
+
+def test_process_latest_times_starts_when_all_satellites_reported():
+    latest_times = {
+        "goes-east": [1743139200, 1743139800],
+        "msg-iodc": [1743139800, 1743140700],
+    }
+    result = process_latest_times(latest_times, hours=0)
+
+    assert result == [
+        {"timestamp": 1743139800, "goes-east": 1743139800, "msg-iodc": 1743139800},
+        {"timestamp": 1743140700, "goes-east": 1743139800, "msg-iodc": 1743140700},
+    ]
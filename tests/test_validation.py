@@ -0,0 +1,51 @@
+import io
+
+from PIL import Image
+
+from zoom_earth_cli.validation import JPEGStreamValidator, validate_jpeg_file, verify_store
+
+
+def _jpeg_bytes(size=(256, 256)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (10, 120, 200)).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def test_stream_validator_accepts_chunked_tile():
+    data = _jpeg_bytes()
+    validator = JPEGStreamValidator()
+    for start in range(0, len(data), 7):
+        assert validator.feed(data[start:start + 7])
+    assert validator.finish() is None
+    assert (validator.width, validator.height) == (256, 256)
+
+
+def test_stream_validator_rejects_bad_payloads():
+    data = _jpeg_bytes()
+
+    html = JPEGStreamValidator()
+    assert not html.feed(b"<html><body>502 Bad Gateway</body></html>")
+    assert "SOI" in html.finish()
+
+    truncated = JPEGStreamValidator()
+    truncated.feed(data[:len(data) // 2])
+    assert "EOI" in truncated.finish()
+
+    wrong_size = JPEGStreamValidator()
+    wrong_size.feed(_jpeg_bytes((128, 256)))
+    assert "128x256" in wrong_size.finish()
+
+
+def test_verify_store_quarantines_corrupt_tiles(tmp_path):
+    tile_dir = tmp_path / "downloads" / "global" / "himawari" / "4" / "2025-04-01" / "0000"
+    tile_dir.mkdir(parents=True)
+    data = _jpeg_bytes()
+    (tile_dir / "x4_y11.jpg").write_bytes(data)
+    (tile_dir / "x4_y12.jpg").write_bytes(data[:-100])
+
+    result = verify_store(str(tmp_path / "downloads"), str(tmp_path / "quarantine"), workers=2)
+
+    assert result["checked"] == 2 and result["corrupt"] == 1 and result["quarantined"] == 1
+    assert (tile_dir / "x4_y11.jpg").exists() and not (tile_dir / "x4_y12.jpg").exists()
+    moved = tmp_path / "quarantine" / "global" / "himawari" / "4" / "2025-04-01" / "0000" / "x4_y12.jpg"
+    assert validate_jpeg_file(moved) is not None